@@ -0,0 +1,354 @@
+"""
+Admission Control
+Token-bucket rate limits per client and route, and per-upstream concurrency
+caps with a bounded wait queue, for both gateways
+"""
+
+import asyncio
+from collections import OrderedDict
+import math
+import threading
+import time
+
+from flask import request
+
+
+class RateLimited(Exception):
+    """The client used up its token bucket for a route (429)"""
+
+    def __init__(self, retry_after):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+
+class UpstreamBusy(Exception):
+    """Every slot for an upstream is taken and its wait queue is full (503)"""
+
+
+def retry_after_header(seconds):
+    """Retry-After value: whole seconds, at least 1"""
+    return str(max(1, math.ceil(seconds)))
+
+
+def parse_rate_limits(value):
+    """Parse 'prefix=rate/burst,prefix=rate' into {prefix: (rate, burst)}
+
+    rate is requests per second; burst defaults to max(1, rate). Raises
+    ValueError for a rate that is not positive or a burst below 1.
+    """
+    limits = {}
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        prefix, spec = item.split('=', 1)
+        rate, _, burst = spec.partition('/')
+        rate = float(rate)
+        burst = float(burst) if burst else max(1.0, rate)
+        if rate <= 0 or burst < 1:
+            raise ValueError(f"Invalid rate limit for {prefix.strip()}: {spec} (rate must be > 0, burst >= 1)")
+        limits[prefix.strip()] = (rate, burst)
+    return limits
+
+
+def client_id(remote_addr, headers, header_name=None, trusted_hops=1):
+    """Client identity for rate limiting
+
+    With header_name (e.g. X-Forwarded-For), the address appended by the
+    outermost of `trusted_hops` proxies: each proxy appends the peer it saw,
+    so entries further left are client-supplied and not trusted. Falls back
+    to the peer address when the header is missing or has fewer entries.
+    """
+    if header_name and headers.get(header_name):
+        hops = [hop.strip() for hop in headers[header_name].split(',')]
+        if trusted_hops > 0 and len(hops) >= trusted_hops:
+            return hops[-trusted_hops]
+    return remote_addr or 'unknown'
+
+
+class LocalBuckets:
+    """Token buckets in process memory, least recently used dropped first"""
+
+    name = 'local'
+
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self._buckets = OrderedDict()   # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        """Take one token: (allowed, seconds until one is available)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_size:
+                self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+    def size(self):
+        with self._lock:
+            return len(self._buckets)
+
+
+# Refill and take atomically on the Redis server, using its clock so every
+# gateway replica sees the same bucket
+TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(state[1]) or burst
+local updated_at = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate)
+local allowed = 0
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(wait)}
+"""
+
+
+class RedisBuckets:
+    """Token buckets shared by every gateway replica through Redis"""
+
+    name = 'redis'
+
+    def __init__(self, client, prefix='gateway:ratelimit:'):
+        self.client = client
+        self.prefix = prefix
+        self._take = client.register_script(TAKE_SCRIPT)
+
+    def take(self, key, rate, burst):
+        allowed, wait = self._take(keys=[self.prefix + key], args=[rate, burst])
+        return bool(allowed), float(wait)
+
+    def size(self):
+        return None
+
+
+def create_buckets(backend_url=None, max_size=100000):
+    """In-process buckets, or Redis-backed when a redis:// URL is configured"""
+    if not backend_url:
+        return LocalBuckets(max_size=max_size)
+
+    import redis  # only needed for the shared backend
+    return RedisBuckets(redis.Redis.from_url(backend_url))
+
+
+class RateLimiter:
+    """Token-bucket rate limits on the routes listed in RATE_LIMITS
+
+    RATE_LIMITS maps route prefixes to (requests per second, burst); the
+    longest matching prefix applies and each client gets its own bucket per
+    prefix. Unlisted routes (health checks, /metrics) are never limited. If
+    the shared backend fails, requests are admitted and counted as errors.
+    """
+
+    def __init__(self, app=None):
+        self.config = None
+        self.buckets = None
+        self.admitted = {}      # prefix -> requests
+        self.rejected = {}
+        self.errors = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RATE_LIMITS', {})
+        app.config.setdefault('RATE_LIMIT_BACKEND_URL', None)
+        app.config.setdefault('RATE_LIMIT_CLIENT_HEADER', None)
+        app.config.setdefault('RATE_LIMIT_TRUSTED_HOPS', 1)
+        app.config.setdefault('RATE_LIMIT_MAX_CLIENTS', 100000)
+        self.configure(app.config)
+        app.before_request(self.before_request)
+
+    def configure(self, config):
+        """Read settings from a Flask config or async_app's config dict"""
+        self.config = config
+        self.buckets = create_buckets(config['RATE_LIMIT_BACKEND_URL'], max_size=config['RATE_LIMIT_MAX_CLIENTS'])
+
+    def limit_for(self, route):
+        """(prefix, rate, burst) of the longest prefix matching a route, or None"""
+        best = None
+        for prefix, (rate, burst) in self.config['RATE_LIMITS'].items():
+            if route.startswith(prefix) and (best is None or len(prefix) > len(best[0])):
+                best = (prefix, rate, burst)
+        return best
+
+    def check(self, route, client):
+        """Take a token for client on route, raising RateLimited when it has none"""
+        limit = self.limit_for(route)
+        if limit is None:
+            return
+        prefix, rate, burst = limit
+        try:
+            allowed, retry_after = self.buckets.take(f"{prefix}|{client}", rate, burst)
+        except Exception as e:
+            print(f"Rate limit backend error, admitting request: {e}")
+            with self._lock:
+                self.errors += 1
+            allowed, retry_after = True, 0.0
+
+        counters = self.admitted if allowed else self.rejected
+        with self._lock:
+            counters[prefix] = counters.get(prefix, 0) + 1
+        if not allowed:
+            raise RateLimited(retry_after)
+
+    def before_request(self):
+        if request.method != 'OPTIONS':
+            self.check(request.path, client_id(request.remote_addr, request.headers,
+                                               self.config['RATE_LIMIT_CLIENT_HEADER'],
+                                               self.config['RATE_LIMIT_TRUSTED_HOPS']))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': self.buckets.name,
+                'clients': self.buckets.size(),
+                'limits': {prefix: {'rate': rate, 'burst': burst}
+                           for prefix, (rate, burst) in self.config['RATE_LIMITS'].items()},
+                'admitted': dict(self.admitted),
+                'rejected': dict(self.rejected),
+                'errors': self.errors
+            }
+
+
+class ConcurrencyLimiter:
+    """At most UPSTREAM_MAX_CONCURRENCY requests in flight per upstream
+
+    Requests beyond the cap wait up to UPSTREAM_QUEUE_TIMEOUT seconds for a
+    slot; once UPSTREAM_QUEUE_SIZE requests are already waiting, further ones
+    are rejected at once instead of piling up. Limits are per process.
+    """
+
+    def __init__(self, app=None):
+        self.config = None
+        self._upstreams = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('UPSTREAM_MAX_CONCURRENCY', 0)
+        app.config.setdefault('UPSTREAM_QUEUE_SIZE', 50)
+        app.config.setdefault('UPSTREAM_QUEUE_TIMEOUT', 1)
+        self.configure(app.config)
+
+    def configure(self, config):
+        """Read settings from a Flask config or async_app's config dict"""
+        self.config = config
+
+    def make_semaphore(self, limit):
+        return threading.Semaphore(limit)
+
+    def upstream(self, service_url):
+        """Slots and counters of an upstream (None when unlimited)"""
+        state = self._upstreams.get(service_url)
+        if state is not None or self.config['UPSTREAM_MAX_CONCURRENCY'] <= 0:
+            return state
+
+        with self._lock:
+            state = self._upstreams.get(service_url)
+            if state is None:
+                state = self._upstreams[service_url] = {
+                    'slots': self.make_semaphore(self.config['UPSTREAM_MAX_CONCURRENCY']),
+                    'in_flight': 0, 'waiting': 0, 'admitted': 0, 'queued': 0, 'rejected': 0
+                }
+            return state
+
+    def acquire(self, service_url):
+        """Take a slot, waiting in the queue if needed; raises UpstreamBusy"""
+        state = self.upstream(service_url)
+        if state is None:
+            return
+        if not state['slots'].acquire(blocking=False):
+            if not self._enqueue(state):
+                raise UpstreamBusy(service_url)
+            try:
+                acquired = state['slots'].acquire(timeout=self.config['UPSTREAM_QUEUE_TIMEOUT'])
+            finally:
+                self._dequeue(state)
+            if not acquired:
+                self._reject(state)
+                raise UpstreamBusy(service_url)
+        self._admit(state)
+
+    def release(self, service_url):
+        state = self.upstream(service_url)
+        if state is None:
+            return
+        with self._lock:
+            state['in_flight'] -= 1
+        state['slots'].release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_concurrency': self.config['UPSTREAM_MAX_CONCURRENCY'],
+                'queue_size': self.config['UPSTREAM_QUEUE_SIZE'],
+                'upstreams': {
+                    service_url: {name: value for name, value in state.items() if name != 'slots'}
+                    for service_url, state in self._upstreams.items()
+                }
+            }
+
+    def _enqueue(self, state):
+        with self._lock:
+            if state['waiting'] >= self.config['UPSTREAM_QUEUE_SIZE']:
+                state['rejected'] += 1
+                return False
+            state['waiting'] += 1
+            state['queued'] += 1
+            return True
+
+    def _dequeue(self, state):
+        with self._lock:
+            state['waiting'] -= 1
+
+    def _reject(self, state):
+        with self._lock:
+            state['rejected'] += 1
+
+    def _admit(self, state):
+        with self._lock:
+            state['admitted'] += 1
+            state['in_flight'] += 1
+
+
+class AsyncConcurrencyLimiter(ConcurrencyLimiter):
+    """ConcurrencyLimiter for the asyncio gateway: waiters queue on the event loop"""
+
+    def make_semaphore(self, limit):
+        return asyncio.Semaphore(limit)
+
+    async def acquire(self, service_url):
+        state = self.upstream(service_url)
+        if state is None:
+            return
+        slots = state['slots']
+        if slots.locked():
+            if not self._enqueue(state):
+                raise UpstreamBusy(service_url)
+            try:
+                await asyncio.wait_for(slots.acquire(), self.config['UPSTREAM_QUEUE_TIMEOUT'])
+            except asyncio.TimeoutError:
+                self._reject(state)
+                raise UpstreamBusy(service_url)
+            finally:
+                self._dequeue(state)
+        else:
+            await slots.acquire()
+        self._admit(state)
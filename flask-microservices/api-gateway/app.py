@@ -3,13 +3,23 @@ API Gateway - Microservice
 Routes requests to appropriate microservices
 """
 
-from flask import Flask, request, jsonify, Response
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import requests
 import os
+from routes import ROUTES, HEALTH_CHECKS, STATS_COUNTS, PASSTHROUGH_HEADERS, CONDITIONAL_HEADERS
+from upstream import UpstreamClient, SizedBody, parse_route_timeouts
+from health import HealthMonitor, summarize
+from stats import StatsAggregator
+from response_cache import ResponseCache
+from compression import Compressor
+from admission import (RateLimiter, ConcurrencyLimiter, RateLimited, UpstreamBusy,
+                       parse_rate_limits, retry_after_header)
+from fast_json import FastJSONProvider
 
 app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
+app.json = FastJSONProvider(app)
+CORS(app, expose_headers=list(PASSTHROUGH_HEADERS))  # Enable CORS for all routes
 
 # Configuration
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'gateway-secret-key')
@@ -17,25 +27,100 @@ app.config['AUTH_SERVICE_URL'] = os.environ.get('AUTH_SERVICE_URL', 'http://loca
 app.config['USER_SERVICE_URL'] = os.environ.get('USER_SERVICE_URL', 'http://localhost:5002')
 app.config['CHAT_SERVICE_URL'] = os.environ.get('CHAT_SERVICE_URL', 'http://localhost:5003')
 
-def forward_request(service_url, path, method='GET', data=None, headers=None):
-    """Forward request to a microservice"""
-    url = f"{service_url}{path}"
+# Upstream connection pooling
+app.config['UPSTREAM_POOL_SIZE'] = int(os.environ.get('UPSTREAM_POOL_SIZE', 20))
+app.config['UPSTREAM_CONNECT_TIMEOUT'] = float(os.environ.get('UPSTREAM_CONNECT_TIMEOUT', 2))
+app.config['UPSTREAM_READ_TIMEOUT'] = float(os.environ.get('UPSTREAM_READ_TIMEOUT', 10))
+# Per-route read timeouts, e.g. "/api/auth/login=5,/api/chat/rooms=3"
+app.config['ROUTE_TIMEOUTS'] = parse_route_timeouts(os.environ.get('ROUTE_TIMEOUTS'))
+
+# Streaming pass-through (bounded memory per request)
+app.config['GATEWAY_STREAMING'] = os.environ.get('GATEWAY_STREAMING', 'false').lower() == 'true'
+app.config['STREAM_CHUNK_SIZE'] = int(os.environ.get('STREAM_CHUNK_SIZE', 64 * 1024))
+
+# Background health polling
+app.config['HEALTH_CHECK_INTERVAL'] = float(os.environ.get('HEALTH_CHECK_INTERVAL', 5))
+app.config['HEALTH_CHECK_TIMEOUT'] = float(os.environ.get('HEALTH_CHECK_TIMEOUT', 2))
+
+# Seconds /api/stats counters are cached for
+app.config['STATS_CACHE_TTL'] = float(os.environ.get('STATS_CACHE_TTL', 10))
+
+# Optional response cache for GET routes, e.g. "/api/chat/rooms=5,/api/users/profiles=10"
+app.config['RESPONSE_CACHE_TTLS'] = parse_route_timeouts(os.environ.get('RESPONSE_CACHE_TTLS'))
+app.config['RESPONSE_CACHE_BACKEND_URL'] = os.environ.get('RESPONSE_CACHE_BACKEND_URL')
+app.config['RESPONSE_CACHE_SIZE'] = int(os.environ.get('RESPONSE_CACHE_SIZE', 1000))
+
+# Negotiated gzip/brotli for responses of at least COMPRESSION_MIN_SIZE bytes
+app.config['GATEWAY_COMPRESSION'] = os.environ.get('GATEWAY_COMPRESSION', 'true').lower() == 'true'
+app.config['COMPRESSION_MIN_SIZE'] = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+app.config['COMPRESSION_LEVEL'] = int(os.environ.get('COMPRESSION_LEVEL', 6))
+
+# Admission control: per-client token buckets on route prefixes, e.g.
+# "/api/auth/login=0.2/5,/api=20/40" (requests per second / burst)
+app.config['RATE_LIMITS'] = parse_rate_limits(os.environ.get('RATE_LIMITS'))
+app.config['RATE_LIMIT_BACKEND_URL'] = os.environ.get('RATE_LIMIT_BACKEND_URL')
+app.config['RATE_LIMIT_CLIENT_HEADER'] = os.environ.get('RATE_LIMIT_CLIENT_HEADER')
+app.config['RATE_LIMIT_TRUSTED_HOPS'] = int(os.environ.get('RATE_LIMIT_TRUSTED_HOPS', 1))
+app.config['RATE_LIMIT_MAX_CLIENTS'] = int(os.environ.get('RATE_LIMIT_MAX_CLIENTS', 100000))
+# Requests in flight per upstream (0: unlimited), and how many may wait for a slot and for how long
+app.config['UPSTREAM_MAX_CONCURRENCY'] = int(os.environ.get('UPSTREAM_MAX_CONCURRENCY', 0))
+app.config['UPSTREAM_QUEUE_SIZE'] = int(os.environ.get('UPSTREAM_QUEUE_SIZE', 50))
+app.config['UPSTREAM_QUEUE_TIMEOUT'] = float(os.environ.get('UPSTREAM_QUEUE_TIMEOUT', 1))
+
+rate_limiter = RateLimiter(app)
+concurrency = ConcurrencyLimiter(app)
+upstream = UpstreamClient(app)
+health_monitor = HealthMonitor(upstream, HEALTH_CHECKS, app)
+stats_aggregator = StatsAggregator(upstream, STATS_COUNTS, app)
+response_cache = ResponseCache(app)
+compressor = Compressor(app)
+
+def forward_request(service_url, path, method='GET', data=None, headers=None, streaming=None):
+    """Forward request to a microservice
+
+    The client's request body is forwarded as raw bytes unless `data` is
+    given, in which case it is sent as JSON. In streaming mode the body is
+    read from the client, and the upstream response relayed back, in
+    STREAM_CHUNK_SIZE pieces instead of being buffered in memory
+    (GATEWAY_STREAMING, unless `streaming` is given). Bodies without a
+    Content-Length (chunked uploads) are buffered either way.
+    """
+    if method not in ('GET', 'POST', 'PUT', 'DELETE'):
+        return jsonify({'error': 'Unsupported method'}), 405
     
-    try:
-        if method == 'GET':
-            response = requests.get(url, headers=headers, params=request.args, timeout=10)
-        elif method == 'POST':
-            response = requests.post(url, json=data, headers=headers, timeout=10)
-        elif method == 'PUT':
-            response = requests.put(url, json=data, headers=headers, timeout=10)
-        elif method == 'DELETE':
-            response = requests.delete(url, headers=headers, timeout=10)
+    if streaming is None:
+        streaming = app.config['GATEWAY_STREAMING']
+    headers = {k: v for k, v in (headers or {}).items() if v is not None}
+    kwargs = {'params': request.args, 'stream': streaming}
+    
+    if data is not None:
+        kwargs['json'] = data
+    elif method in ('POST', 'PUT'):
+        if 'Content-Type' in request.headers:
+            headers['Content-Type'] = request.headers['Content-Type']
+        if streaming and request.content_length:
+            # Content-Length is set from the body, never copied alongside a chunked framing
+            kwargs['data'] = SizedBody(request.stream, request.content_length, app.config['STREAM_CHUNK_SIZE'])
         else:
-            return jsonify({'error': 'Unsupported method'}), 405
+            kwargs['data'] = request.get_data()
+    
+    concurrency.acquire(service_url)
+    release = True
+    try:
+        response = upstream.request(method, service_url, path, route=request.path,
+                                    headers=headers, **kwargs)
+        
+        if streaming:
+            # The slot is held until the body has been relayed
+            streamed = stream_response(response)
+            streamed.call_on_close(lambda: concurrency.release(service_url))
+            release = False
+            return streamed
         
         return Response(
             response.content,
             status=response.status_code,
+            headers=passthrough_headers(response),
             content_type=response.headers.get('Content-Type', 'application/json')
         )
     except requests.exceptions.Timeout:
@@ -44,191 +129,147 @@ def forward_request(service_url, path, method='GET', data=None, headers=None):
         return jsonify({'error': 'Service unavailable'}), 503
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+    finally:
+        if release:
+            concurrency.release(service_url)
 
-# Health check
-@app.route('/health', methods=['GET'])
-def health():
-    """Health check endpoint"""
-    services = {
-        'auth': False,
-        'user': False,
-        'chat': False
-    }
-    
-    try:
-        auth_response = requests.get(f"{app.config['AUTH_SERVICE_URL']}/health", timeout=2)
-        services['auth'] = auth_response.status_code == 200
-    except:
-        pass
-    
-    try:
-        user_response = requests.get(f"{app.config['USER_SERVICE_URL']}/health", timeout=2)
-        services['user'] = user_response.status_code == 200
-    except:
-        pass
-    
-    try:
-        chat_response = requests.get(f"{app.config['CHAT_SERVICE_URL']}/health", timeout=2)
-        services['chat'] = chat_response.status_code == 200
-    except:
-        pass
+def passthrough_headers(response, names=PASSTHROUGH_HEADERS):
+    """Upstream response headers relayed to the client"""
+    return {name: response.headers[name] for name in names if name in response.headers}
+
+def stream_response(response):
+    """Relay an upstream response to the client chunk by chunk"""
+    chunk_size = app.config['STREAM_CHUNK_SIZE']
     
-    all_healthy = all(services.values())
+    def generate():
+        try:
+            # decode_content=False passes compressed bodies through untouched
+            for chunk in response.raw.stream(chunk_size, decode_content=False):
+                yield chunk
+        finally:
+            response.close()
     
-    return jsonify({
-        'status': 'healthy' if all_healthy else 'degraded',
-        'services': services
-    }), 200 if all_healthy else 503
-
-# Auth Service Routes
-@app.route('/api/auth/register', methods=['POST'])
-def register():
-    """Register user"""
-    return forward_request(
-        app.config['AUTH_SERVICE_URL'],
-        '/register',
-        method='POST',
-        data=request.get_json()
+    headers = passthrough_headers(response, PASSTHROUGH_HEADERS + ('Content-Length', 'Content-Encoding'))
+    return Response(
+        stream_with_context(generate()),
+        status=response.status_code,
+        headers=headers,
+        content_type=response.headers.get('Content-Type', 'application/json'),
+        direct_passthrough=True
     )
 
-@app.route('/api/auth/login', methods=['POST'])
-def login():
-    """Login user"""
-    return forward_request(
-        app.config['AUTH_SERVICE_URL'],
-        '/login',
-        method='POST',
-        data=request.get_json()
-    )
-
-@app.route('/api/auth/verify', methods=['POST'])
-def verify():
-    """Verify token"""
-    return forward_request(
-        app.config['AUTH_SERVICE_URL'],
-        '/verify',
-        method='POST',
-        data=request.get_json()
-    )
+@app.errorhandler(RateLimited)
+def rate_limited(error):
+    """The client exceeded its rate limit for the route"""
+    return jsonify({'error': 'Rate limit exceeded'}), 429, {'Retry-After': retry_after_header(error.retry_after)}
 
-@app.route('/api/auth/users', methods=['GET'])
-def get_users():
-    """Get all users"""
-    return forward_request(
-        app.config['AUTH_SERVICE_URL'],
-        '/users',
-        method='GET'
-    )
-
-@app.route('/api/auth/users/<int:user_id>', methods=['GET'])
-def get_user(user_id):
-    """Get user by ID"""
-    return forward_request(
-        app.config['AUTH_SERVICE_URL'],
-        f'/users/{user_id}',
-        method='GET'
-    )
+@app.errorhandler(UpstreamBusy)
+def upstream_busy(error):
+    """Shed requests while the upstream is at its concurrency cap and its queue is full"""
+    return jsonify({'error': 'Service busy, retry shortly'}), 503, {'Retry-After': '1'}
 
-# User Service Routes
-@app.route('/api/users/profiles/<int:user_id>', methods=['GET'])
-def get_profile(user_id):
-    """Get user profile"""
-    return forward_request(
-        app.config['USER_SERVICE_URL'],
-        f'/profiles/{user_id}',
-        method='GET'
-    )
+# Health checks
+@app.route('/health', methods=['GET'])
+def health():
+    """Aggregate health of all services (answered from the health cache)"""
+    body, status = summarize(health_monitor.snapshot())
+    return jsonify(body), status
 
-@app.route('/api/users/profiles/<int:user_id>', methods=['PUT'])
-def update_profile(user_id):
-    """Update user profile"""
-    headers = {'Authorization': request.headers.get('Authorization')}
-    return forward_request(
-        app.config['USER_SERVICE_URL'],
-        f'/profiles/{user_id}',
-        method='PUT',
-        data=request.get_json(),
-        headers=headers
-    )
+@app.route('/health/live', methods=['GET'])
+def liveness():
+    """Liveness probe - the gateway process is serving requests"""
+    return jsonify({'status': 'alive'}), 200
 
-@app.route('/api/users/profiles', methods=['GET'])
-def get_all_profiles():
-    """Get all profiles"""
-    return forward_request(
-        app.config['USER_SERVICE_URL'],
-        '/profiles',
-        method='GET'
-    )
+@app.route('/health/ready', methods=['GET'])
+def readiness():
+    """Readiness probe - the gateway is up and its health cache is current"""
+    health_monitor.snapshot()
+    if not health_monitor.is_fresh():
+        return jsonify({'status': 'not ready'}), 503
+    return jsonify({'status': 'ready'}), 200
 
-# Chat Service Routes
-@app.route('/api/chat/rooms', methods=['GET'])
-def get_rooms():
-    """Get all rooms"""
-    return forward_request(
-        app.config['CHAT_SERVICE_URL'],
-        '/rooms',
-        method='GET'
-    )
+# Gateway metrics
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Gateway metrics"""
+    return jsonify({
+        'upstreams': upstream.stats(),
+        'response_cache': response_cache.stats(),
+        'compression': compressor.stats(),
+        'rate_limits': rate_limiter.stats(),
+        'concurrency': concurrency.stats()
+    }), 200
 
-@app.route('/api/chat/rooms', methods=['POST'])
-def create_room():
-    """Create room"""
-    headers = {'Authorization': request.headers.get('Authorization')}
-    return forward_request(
-        app.config['CHAT_SERVICE_URL'],
-        '/rooms',
-        method='POST',
-        data=request.get_json(),
-        headers=headers
-    )
+def cache_key():
+    """Response cache key of the current request (see ResponseCache.key_for)"""
+    return response_cache.key_for(request.path, request.query_string.decode())
 
-@app.route('/api/chat/rooms/<int:room_id>', methods=['GET'])
-def get_room(room_id):
-    """Get room details"""
-    return forward_request(
-        app.config['CHAT_SERVICE_URL'],
-        f'/rooms/{room_id}',
-        method='GET'
-    )
+def cached_get(service_url, path, ttl):
+    """GET through the response cache
+    
+    The upstream is always asked for the full body (the client's validators
+    are not forwarded) so it can be cached; the client's If-None-Match is then
+    checked against the cached ETag.
+    """
+    key = cache_key()
+    entry = response_cache.get(key)
+    if entry is not None:
+        status, headers, body = entry
+        response = Response(body, status=status, headers=headers)
+        response.headers['X-Cache'] = 'HIT'
+    else:
+        response = forward_request(service_url, path, streaming=False)
+        if not isinstance(response, Response):
+            return response  # gateway error
+        response_cache.set(key, response, ttl)
+        response.headers['X-Cache'] = 'MISS'
+    return response.make_conditional(request)
 
-@app.route('/api/chat/rooms/<int:room_id>/messages', methods=['GET'])
-def get_messages(room_id):
-    """Get room messages"""
-    return forward_request(
-        app.config['CHAT_SERVICE_URL'],
-        f'/rooms/{room_id}/messages',
-        method='GET'
-    )
+# Proxy Routes (see routes.py)
+def make_proxy_view(route):
+    """Build a view that forwards a gateway route to its upstream"""
+    def view(**kwargs):
+        service_url = app.config[route.service]
+        path = route.path.format(**kwargs)
+        headers = {'Authorization': request.headers.get('Authorization')} if route.auth else {}
+        
+        if route.method == 'GET':
+            ttl = response_cache.ttl_for(request.path)
+            if ttl:
+                return cached_get(service_url, path, ttl)
+            for name in CONDITIONAL_HEADERS:
+                headers[name] = request.headers.get(name)
+        
+        response = forward_request(service_url, path, method=route.method, headers=headers)
+        if route.method != 'GET':
+            response_cache.invalidate_route(request.path)
+        return response
+    
+    view.__name__ = route.endpoint
+    view.__doc__ = route.description
+    return view
 
-@app.route('/api/chat/rooms/<int:room_id>/online', methods=['GET'])
-def get_online_users(room_id):
-    """Get online users"""
-    return forward_request(
-        app.config['CHAT_SERVICE_URL'],
-        f'/rooms/{room_id}/online',
-        method='GET'
-    )
+for route in ROUTES:
+    app.add_url_rule(route.rule, route.endpoint, make_proxy_view(route), methods=[route.method])
 
 # Stats endpoint
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
     """Get system statistics"""
     try:
-        # Get users count
-        users_response = requests.get(f"{app.config['AUTH_SERVICE_URL']}/users", timeout=5)
-        users_count = len(users_response.json()) if users_response.status_code == 200 else 0
-        
-        # Get rooms count
-        rooms_response = requests.get(f"{app.config['CHAT_SERVICE_URL']}/rooms", timeout=5)
-        rooms_count = len(rooms_response.json()) if rooms_response.status_code == 200 else 0
-        
         return jsonify({
-            'total_users': users_count,
-            'total_rooms': rooms_count,
+            **stats_aggregator.get(),
             'services_status': 'operational'
         }), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def create_app():
+    """App factory used by the production server (gunicorn.conf.py)"""
+    # Start health polling in the serving process so /health/ready is primed
+    health_monitor.snapshot()
+    return app
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # Development server; production runs gunicorn with gunicorn.conf.py
+    create_app().run(host='0.0.0.0', port=5000, debug=True)
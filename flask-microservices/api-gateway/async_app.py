@@ -0,0 +1,308 @@
+"""
+API Gateway - asyncio engine
+Same route table as app.py, served by aiohttp so that in-flight upstream calls
+do not each pin a worker thread. Run with: python async_app.py
+"""
+
+import asyncio
+import os
+import time
+
+import aiohttp
+from aiohttp import web
+
+from routes import ROUTES, HEALTH_CHECKS, STATS_COUNTS, PASSTHROUGH_HEADERS, CONDITIONAL_HEADERS, aiohttp_rule
+from upstream import parse_route_timeouts, route_timeout
+from health import probe_result, summarize
+from compression import COMPRESSIBLE_TYPES
+from admission import (RateLimiter, AsyncConcurrencyLimiter, RateLimited, UpstreamBusy,
+                       client_id, parse_rate_limits, retry_after_header)
+
+# Configuration (same environment variables as app.py)
+config = {
+    'AUTH_SERVICE_URL': os.environ.get('AUTH_SERVICE_URL', 'http://localhost:5001'),
+    'USER_SERVICE_URL': os.environ.get('USER_SERVICE_URL', 'http://localhost:5002'),
+    'CHAT_SERVICE_URL': os.environ.get('CHAT_SERVICE_URL', 'http://localhost:5003'),
+    'UPSTREAM_CONNECT_TIMEOUT': float(os.environ.get('UPSTREAM_CONNECT_TIMEOUT', 2)),
+    'UPSTREAM_READ_TIMEOUT': float(os.environ.get('UPSTREAM_READ_TIMEOUT', 10)),
+    'ROUTE_TIMEOUTS': parse_route_timeouts(os.environ.get('ROUTE_TIMEOUTS')),
+    'STREAM_CHUNK_SIZE': int(os.environ.get('STREAM_CHUNK_SIZE', 64 * 1024)),
+    'GATEWAY_COMPRESSION': os.environ.get('GATEWAY_COMPRESSION', 'true').lower() == 'true',
+    'COMPRESSION_MIN_SIZE': int(os.environ.get('COMPRESSION_MIN_SIZE', 1024)),
+    'HEALTH_CHECK_INTERVAL': float(os.environ.get('HEALTH_CHECK_INTERVAL', 5)),
+    'HEALTH_CHECK_TIMEOUT': float(os.environ.get('HEALTH_CHECK_TIMEOUT', 2)),
+    'STATS_CACHE_TTL': float(os.environ.get('STATS_CACHE_TTL', 10)),
+    # Total concurrent upstream connections held by this process
+    'ASYNC_UPSTREAM_LIMIT': int(os.environ.get('ASYNC_UPSTREAM_LIMIT', 1000)),
+    'RATE_LIMITS': parse_rate_limits(os.environ.get('RATE_LIMITS')),
+    'RATE_LIMIT_BACKEND_URL': os.environ.get('RATE_LIMIT_BACKEND_URL'),
+    'RATE_LIMIT_CLIENT_HEADER': os.environ.get('RATE_LIMIT_CLIENT_HEADER'),
+    'RATE_LIMIT_TRUSTED_HOPS': int(os.environ.get('RATE_LIMIT_TRUSTED_HOPS', 1)),
+    'RATE_LIMIT_MAX_CLIENTS': int(os.environ.get('RATE_LIMIT_MAX_CLIENTS', 100000)),
+    'UPSTREAM_MAX_CONCURRENCY': int(os.environ.get('UPSTREAM_MAX_CONCURRENCY', 0)),
+    'UPSTREAM_QUEUE_SIZE': int(os.environ.get('UPSTREAM_QUEUE_SIZE', 50)),
+    'UPSTREAM_QUEUE_TIMEOUT': float(os.environ.get('UPSTREAM_QUEUE_TIMEOUT', 1)),
+}
+
+# Response headers relayed from the upstream unchanged
+RELAYED_HEADERS = ('Content-Type', 'Content-Encoding') + PASSTHROUGH_HEADERS
+
+
+def error(message, status):
+    return web.json_response({'error': message}, status=status)
+
+
+def client_timeout(route):
+    return aiohttp.ClientTimeout(
+        sock_connect=config['UPSTREAM_CONNECT_TIMEOUT'],
+        sock_read=route_timeout(route, config['ROUTE_TIMEOUTS'], config['UPSTREAM_READ_TIMEOUT'])
+    )
+
+
+async def forward_request(request, service_url, path, headers=None):
+    """Forward request to a microservice, streaming both bodies"""
+    session = request.app['client']
+    headers = {k: v for k, v in (headers or {}).items() if v is not None}
+    data = None
+    if request.method in ('POST', 'PUT'):
+        for name in ('Content-Type', 'Content-Length'):
+            if name in request.headers:
+                headers[name] = request.headers[name]
+        data = request.content
+
+    try:
+        await request.app['concurrency'].acquire(service_url)
+    except UpstreamBusy:
+        return web.json_response({'error': 'Service busy, retry shortly'}, status=503, headers={'Retry-After': '1'})
+
+    response = None
+    request.app['metrics']['in_flight'] += 1
+    request.app['metrics']['requests'][service_url] = request.app['metrics']['requests'].get(service_url, 0) + 1
+    try:
+        async with session.request(request.method, f"{service_url}{path}", params=request.query,
+                                   data=data, headers=headers,
+                                   timeout=client_timeout(request.path)) as upstream:
+            response = web.StreamResponse(status=upstream.status, headers={
+                name: upstream.headers[name] for name in RELAYED_HEADERS if name in upstream.headers
+            })
+            if compressible(upstream):
+                # gzip/deflate per Accept-Encoding, compressed while streaming
+                response.headers['Vary'] = 'Accept-Encoding'
+                if response.headers.get('ETag', 'W/').startswith('"'):
+                    response.headers['ETag'] = 'W/' + response.headers['ETag']  # encoded bytes differ
+                response.enable_compression()
+            elif upstream.content_length is not None:
+                response.content_length = upstream.content_length
+            await response.prepare(request)
+            async for chunk in upstream.content.iter_chunked(config['STREAM_CHUNK_SIZE']):
+                await response.write(chunk)
+            await response.write_eof()
+            return response
+    except asyncio.TimeoutError:
+        if response is not None and response.prepared:
+            raise
+        return error('Service timeout', 504)
+    except aiohttp.ClientConnectionError:
+        if response is not None and response.prepared:
+            raise
+        return error('Service unavailable', 503)
+    except Exception as e:
+        if response is not None and response.prepared:
+            raise
+        return error(str(e), 500)
+    finally:
+        request.app['metrics']['in_flight'] -= 1
+        request.app['concurrency'].release(service_url)
+
+
+def compressible(upstream):
+    """Whether to compress an upstream response on its way to the client"""
+    return config['GATEWAY_COMPRESSION'] and upstream.status == 200 \
+        and 'Content-Encoding' not in upstream.headers \
+        and upstream.content_type.startswith(COMPRESSIBLE_TYPES) \
+        and (upstream.content_length is None or upstream.content_length >= config['COMPRESSION_MIN_SIZE'])
+
+
+def make_proxy_handler(route):
+    """Build a handler that forwards a gateway route to its upstream"""
+    async def handler(request):
+        headers = {'Authorization': request.headers.get('Authorization')} if route.auth else {}
+        if route.method == 'GET':
+            for name in CONDITIONAL_HEADERS:
+                headers[name] = request.headers.get(name)
+        return await forward_request(
+            request,
+            config[route.service],
+            route.path.format(**request.match_info),
+            headers=headers
+        )
+
+    handler.__name__ = route.endpoint
+    handler.__doc__ = route.description
+    return handler
+
+
+async def fetch_json(request, service_url, path, timeout):
+    """GET an upstream JSON document, returning (status, body)"""
+    async with request.app['client'].get(f"{service_url}{path}",
+                                         timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+        if response.status != 200:
+            return response.status, None
+        return response.status, await response.json(content_type=None)
+
+
+async def probe(app, service):
+    started = time.perf_counter()
+    try:
+        async with app['client'].get(f"{config[service]}/health",
+                                     timeout=aiohttp.ClientTimeout(total=config['HEALTH_CHECK_TIMEOUT'])) as response:
+            return probe_result(response.status == 200, started)
+    except Exception as e:
+        return probe_result(False, started, error=type(e).__name__)
+
+
+async def poll_health(app):
+    """Probe every service concurrently and refresh the health cache"""
+    names = list(HEALTH_CHECKS)
+    results = await asyncio.gather(*(probe(app, HEALTH_CHECKS[name]) for name in names))
+    app['health'] = dict(zip(names, results))
+    app['health_polled_at'] = time.monotonic()
+
+
+async def health_poller(app):
+    while True:
+        await poll_health(app)
+        await asyncio.sleep(config['HEALTH_CHECK_INTERVAL'])
+
+
+async def health(request):
+    """Aggregate health of all services (answered from the health cache)"""
+    body, status = summarize(request.app['health'])
+    return web.json_response(body, status=status)
+
+
+async def liveness(request):
+    """Liveness probe - the gateway process is serving requests"""
+    return web.json_response({'status': 'alive'})
+
+
+async def readiness(request):
+    """Readiness probe - the gateway is up and its health cache is current"""
+    polled_at = request.app['health_polled_at']
+    if polled_at is None or time.monotonic() - polled_at >= 3 * config['HEALTH_CHECK_INTERVAL']:
+        return web.json_response({'status': 'not ready'}, status=503)
+    return web.json_response({'status': 'ready'})
+
+
+async def get_stats(request):
+    """Get system statistics - counters are fetched concurrently and cached"""
+    app = request.app
+    try:
+        if app['stats'] is None or time.monotonic() - app['stats_fetched_at'] >= config['STATS_CACHE_TTL']:
+            fields = list(STATS_COUNTS)
+            results = await asyncio.gather(*(
+                fetch_json(request, config[STATS_COUNTS[field][0]], STATS_COUNTS[field][1], timeout=5)
+                for field in fields
+            ))
+            app['stats'] = {
+                field: body['count'] if status == 200 else 0
+                for field, (status, body) in zip(fields, results)
+            }
+            app['stats_fetched_at'] = time.monotonic()
+
+        return web.json_response({**app['stats'], 'services_status': 'operational'})
+    except Exception as e:
+        return error(str(e), 500)
+
+
+async def metrics(request):
+    """Gateway metrics"""
+    return web.json_response({
+        'engine': 'async',
+        **request.app['metrics'],
+        'rate_limits': request.app['rate_limiter'].stats(),
+        'concurrency': request.app['concurrency'].stats()
+    })
+
+
+@web.middleware
+async def rate_limit_middleware(request, handler):
+    """Per-client token buckets on the routes listed in RATE_LIMITS (see admission.py)"""
+    limiter = request.app['rate_limiter']
+    if request.method != 'OPTIONS' and limiter.limit_for(request.path) is not None:
+        client = client_id(request.remote, request.headers, config['RATE_LIMIT_CLIENT_HEADER'],
+                           config['RATE_LIMIT_TRUSTED_HOPS'])
+        try:
+            if limiter.buckets.name == 'redis':
+                # Keep the event loop free while the shared backend answers
+                await asyncio.get_running_loop().run_in_executor(None, limiter.check, request.path, client)
+            else:
+                limiter.check(request.path, client)
+        except RateLimited as e:
+            return web.json_response({'error': 'Rate limit exceeded'}, status=429,
+                                     headers={'Retry-After': retry_after_header(e.retry_after)})
+    return await handler(request)
+
+
+@web.middleware
+async def cors_middleware(request, handler):
+    """Answer CORS preflights; add_cors_headers covers every other response"""
+    if request.method != 'OPTIONS':
+        return await handler(request)
+    return web.Response(headers={
+        'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
+        'Access-Control-Allow-Headers': request.headers.get(
+            'Access-Control-Request-Headers', 'Authorization, Content-Type'
+        )
+    })
+
+
+async def add_cors_headers(request, response):
+    """Allow all origins, as flask-cors does for app.py
+
+    Runs on on_response_prepare, so streamed proxy responses get the headers
+    before their status line and headers are sent.
+    """
+    response.headers['Access-Control-Allow-Origin'] = request.headers.get('Origin', '*')
+    response.headers['Access-Control-Expose-Headers'] = ', '.join(PASSTHROUGH_HEADERS)
+
+
+async def start_client(app):
+    connector = aiohttp.TCPConnector(limit=config['ASYNC_UPSTREAM_LIMIT'], limit_per_host=0)
+    # auto_decompress=False relays compressed upstream bodies untouched
+    app['client'] = aiohttp.ClientSession(connector=connector, auto_decompress=False)
+    app['health_task'] = asyncio.create_task(health_poller(app))
+
+
+async def close_client(app):
+    app['health_task'].cancel()
+    await app['client'].close()
+
+
+def create_app():
+    app = web.Application(middlewares=[cors_middleware, rate_limit_middleware])
+    app['metrics'] = {'in_flight': 0, 'requests': {}}
+    app['rate_limiter'] = RateLimiter()
+    app['rate_limiter'].configure(config)
+    app['concurrency'] = AsyncConcurrencyLimiter()
+    app['concurrency'].configure(config)
+    app['health'] = {}
+    app['health_polled_at'] = None
+    app['stats'] = None
+    app['stats_fetched_at'] = None
+    app.on_response_prepare.append(add_cors_headers)
+    app.on_startup.append(start_client)
+    app.on_cleanup.append(close_client)
+
+    app.router.add_get('/health', health)
+    app.router.add_get('/health/live', liveness)
+    app.router.add_get('/health/ready', readiness)
+    app.router.add_get('/metrics', metrics)
+    app.router.add_get('/api/stats', get_stats)
+    for route in ROUTES:
+        app.router.add_route(route.method, aiohttp_rule(route.rule), make_proxy_handler(route))
+    return app
+
+
+if __name__ == '__main__':
+    web.run_app(create_app(), host='0.0.0.0', port=5000)
@@ -0,0 +1,138 @@
+"""
+Response Compression
+Negotiated gzip (or brotli, when installed) for gateway responses, compressing
+streamed responses chunk by chunk
+"""
+
+import threading
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/')
+
+
+class Compressor:
+    """after_request hook compressing responses the client accepts encoded
+
+    Bodies of at least COMPRESSION_MIN_SIZE bytes are compressed in one go;
+    streamed responses (GATEWAY_STREAMING) are compressed as they are relayed,
+    so memory stays bounded. Already encoded bodies, non-200 responses and
+    non-text content types are left alone. Strong ETags become weak, since
+    the encoded bytes differ from the upstream representation.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.compressed = {}    # encoding -> responses
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('GATEWAY_COMPRESSION', True)
+        app.config.setdefault('COMPRESSION_MIN_SIZE', 1024)
+        app.config.setdefault('COMPRESSION_LEVEL', 6)
+        app.after_request(self.after_request)
+
+    def negotiate(self, request):
+        """'br', 'gzip' or None from the request's Accept-Encoding"""
+        accepted = request.accept_encodings
+        if brotli is not None and accepted['br']:
+            return 'br'
+        if accepted['gzip']:
+            return 'gzip'
+        return None
+
+    def after_request(self, response):
+        if not self.app.config['GATEWAY_COMPRESSION'] or response.status_code != 200 \
+                or 'Content-Encoding' in response.headers \
+                or not (response.mimetype or '').startswith(COMPRESSIBLE_TYPES):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = self.negotiate(request)
+        if encoding is None:
+            return response
+
+        min_size = self.app.config['COMPRESSION_MIN_SIZE']
+        if response.is_streamed:
+            if response.content_length is not None and response.content_length < min_size:
+                return response
+            response.response = self._stream(response.response, encoding)
+            response.headers.pop('Content-Length', None)
+            response.direct_passthrough = True
+        else:
+            body = response.get_data()
+            if len(body) < min_size:
+                return response
+            compressed = self._compressor(encoding)
+            response.set_data(compressed.compress(body) + compressed.flush())
+            self._count(encoding, len(body), response.content_length)
+
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    def stats(self):
+        with self._lock:
+            return {
+                'encodings': ['br', 'gzip'] if brotli is not None else ['gzip'],
+                'compressed': dict(self.compressed),
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'ratio': round(self.bytes_out / self.bytes_in, 4) if self.bytes_in else None
+            }
+
+    def _compressor(self, encoding):
+        level = self.app.config['COMPRESSION_LEVEL']
+        if encoding == 'br':
+            return _BrotliStream(level)  # brotli quality runs 0-11, gzip levels 1-9
+        return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+
+    def _stream(self, chunks, encoding):
+        compressor = self._compressor(encoding)
+        size_in = size_out = 0
+        try:
+            for chunk in chunks:
+                size_in += len(chunk)
+                data = compressor.compress(chunk)
+                if data:
+                    size_out += len(data)
+                    yield data
+            data = compressor.flush()
+            size_out += len(data)
+            yield data
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+            self._count(encoding, size_in, size_out)
+
+    def _count(self, encoding, size_in, size_out):
+        with self._lock:
+            self.compressed[encoding] = self.compressed.get(encoding, 0) + 1
+            self.bytes_in += size_in
+            self.bytes_out += size_out
+
+
+class _BrotliStream:
+    """brotli.Compressor with zlib's compress()/flush() interface"""
+
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.finish()
@@ -0,0 +1,96 @@
+"""
+Health Monitoring
+Polls backend services in the background so /health answers from a cache
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import threading
+import time
+
+
+def probe_result(healthy, started, error=None):
+    """Cached status entry for one service"""
+    return {
+        'healthy': healthy,
+        'latency_ms': round((time.perf_counter() - started) * 1000, 2),
+        'last_checked': datetime.datetime.utcnow().isoformat(),
+        'error': error
+    }
+
+
+def summarize(statuses):
+    """Build the /health response body and status code from cached statuses"""
+    all_healthy = bool(statuses) and all(s['healthy'] for s in statuses.values())
+    return {
+        'status': 'healthy' if all_healthy else 'degraded',
+        'services': {name: s['healthy'] for name, s in statuses.items()},
+        'details': statuses
+    }, 200 if all_healthy else 503
+
+
+class HealthMonitor:
+    """Background poller keeping a per-service health cache
+
+    Every HEALTH_CHECK_INTERVAL seconds all services are probed in parallel;
+    /health then answers from the cache instead of calling downstreams.
+    """
+
+    def __init__(self, upstream, checks, app=None):
+        self.upstream = upstream
+        self.checks = checks
+        self.app = None
+        self.statuses = {}
+        self.last_poll = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=len(checks), thread_name_prefix='health')
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('HEALTH_CHECK_INTERVAL', 5)
+        app.config.setdefault('HEALTH_CHECK_TIMEOUT', 2)
+
+    def probe(self, service):
+        started = time.perf_counter()
+        try:
+            response = self.upstream.request(
+                'GET', self.app.config[service], '/health',
+                timeout=self.app.config['HEALTH_CHECK_TIMEOUT']
+            )
+            return probe_result(response.status_code == 200, started)
+        except Exception as e:
+            return probe_result(False, started, error=type(e).__name__)
+
+    def poll(self):
+        """Probe every service concurrently and refresh the cache"""
+        names = list(self.checks)
+        results = self._executor.map(self.probe, [self.checks[name] for name in names])
+        self.statuses = dict(zip(names, results))
+        self.last_poll = time.monotonic()
+
+    def snapshot(self):
+        """Cached statuses, starting the poller on first use"""
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self.poll()
+                    self._thread = threading.Thread(target=self._run, daemon=True)
+                    self._thread.start()
+        return self.statuses
+
+    def is_fresh(self):
+        """The poller has completed a round recently"""
+        if self.last_poll is None:
+            return False
+        return time.monotonic() - self.last_poll < 3 * self.app.config['HEALTH_CHECK_INTERVAL']
+
+    def _run(self):
+        while True:
+            time.sleep(self.app.config['HEALTH_CHECK_INTERVAL'])
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error polling service health: {e}")
@@ -0,0 +1,106 @@
+"""
+Gateway Response Cache
+Optional cache of upstream GET responses with per-route TTLs, kept in process
+memory or shared by every gateway replica through Redis
+"""
+
+import base64
+import threading
+import uuid
+
+from record_cache import create_store
+from upstream import route_timeout
+
+
+class ResponseCache:
+    """Caches 200 responses of the GET routes listed in RESPONSE_CACHE_TTLS
+
+    RESPONSE_CACHE_TTLS maps route prefixes to seconds (longest prefix wins);
+    other routes are never cached, so the cache is off unless configured.
+    Entries are keyed by path and query string under a generation token of
+    their route prefix, and hold the status, headers (including the upstream
+    ETag) and body. A write through the gateway replaces the token of every
+    prefix overlapping its path, so all query-string variants and parent
+    lists of the written resource miss at once (e.g. PUT
+    /api/users/profiles/7 invalidates /api/users/profiles?limit=20). Changes
+    made behind the gateway are served stale for up to the TTL.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.store = None
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('RESPONSE_CACHE_TTLS', {})
+        app.config.setdefault('RESPONSE_CACHE_BACKEND_URL', None)
+        app.config.setdefault('RESPONSE_CACHE_SIZE', 1000)
+        self.store = create_store(
+            app.config['RESPONSE_CACHE_BACKEND_URL'],
+            max_size=app.config['RESPONSE_CACHE_SIZE'],
+            prefix='gateway:response:'
+        )
+
+    def ttl_for(self, route):
+        """Seconds responses of a route are cached for (0: not cached)"""
+        return route_timeout(route, self.app.config['RESPONSE_CACHE_TTLS'], 0)
+
+    def key_for(self, route, query=''):
+        """Cache key of a GET: current generation of its prefix, path and query string"""
+        prefix = max((p for p in self.app.config['RESPONSE_CACHE_TTLS'] if route.startswith(p)), key=len)
+        generation = self.store.get(f"generation:{prefix}") or '0'
+        return f"{generation}:{route}?{query}" if query else f"{generation}:{route}"
+
+    def invalidate_route(self, route):
+        """Drop every cached response under the prefixes overlapping a written path"""
+        for prefix, ttl in self.app.config['RESPONSE_CACHE_TTLS'].items():
+            if route.startswith(prefix) or prefix.startswith(route):
+                # Unique tokens: entries of an expired generation can never match again.
+                # Kept as long as the entries it hides.
+                self.store.set(f"generation:{prefix}", uuid.uuid4().hex, ttl)
+                with self._lock:
+                    self.invalidations += 1
+
+    def get(self, key):
+        """(status, headers, body) or None"""
+        entry = self.store.get(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        status, headers, body = entry
+        return status, [tuple(header) for header in headers], base64.b64decode(body)
+
+    def set(self, key, response, ttl):
+        """Cache a Flask response if it is a cacheable 200"""
+        cache_control = response.headers.get('Cache-Control', '')
+        if response.status_code != 200 or 'no-store' in cache_control or 'private' in cache_control:
+            return
+        # JSON-safe entry: the shared store does not pickle
+        body = base64.b64encode(response.get_data()).decode('ascii')
+        self.store.set(key, [response.status_code, list(response.headers.items()), body], ttl)
+        with self._lock:
+            self.stored += 1
+
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': self.store.name,
+                'size': self.store.size(),
+                'routes': self.app.config['RESPONSE_CACHE_TTLS'],
+                'hits': self.hits,
+                'misses': self.misses,
+                'stored': self.stored,
+                'invalidations': self.invalidations,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,66 @@
+"""
+Gateway Route Table
+Proxy routes shared by the Flask gateway (app.py) and the asyncio gateway (async_app.py)
+"""
+
+from collections import namedtuple
+import re
+
+# endpoint: view name, rule: gateway URL rule (Flask syntax), method: HTTP method,
+# service: config key of the upstream URL, path: upstream path template,
+# auth: forward the client's Authorization header
+Route = namedtuple('Route', ['endpoint', 'rule', 'method', 'service', 'path', 'auth', 'description'])
+
+ROUTES = [
+    # Auth Service Routes
+    Route('register', '/api/auth/register', 'POST', 'AUTH_SERVICE_URL', '/register', False, 'Register user'),
+    Route('login', '/api/auth/login', 'POST', 'AUTH_SERVICE_URL', '/login', False, 'Login user'),
+    Route('verify', '/api/auth/verify', 'POST', 'AUTH_SERVICE_URL', '/verify', False, 'Verify token'),
+    Route('logout', '/api/auth/logout', 'POST', 'AUTH_SERVICE_URL', '/logout', True,
+          'Logout user (revokes the token)'),
+    Route('get_users', '/api/auth/users', 'GET', 'AUTH_SERVICE_URL', '/users', False, 'Get all users'),
+    Route('get_user', '/api/auth/users/<int:user_id>', 'GET', 'AUTH_SERVICE_URL', '/users/{user_id}', False,
+          'Get user by ID'),
+
+    # User Service Routes
+    Route('get_profile', '/api/users/profiles/<int:user_id>', 'GET', 'USER_SERVICE_URL', '/profiles/{user_id}',
+          False, 'Get user profile'),
+    Route('update_profile', '/api/users/profiles/<int:user_id>', 'PUT', 'USER_SERVICE_URL', '/profiles/{user_id}',
+          True, 'Update user profile'),
+    Route('get_all_profiles', '/api/users/profiles', 'GET', 'USER_SERVICE_URL', '/profiles', False,
+          'Get all profiles'),
+
+    # Chat Service Routes
+    Route('get_rooms', '/api/chat/rooms', 'GET', 'CHAT_SERVICE_URL', '/rooms', False, 'Get all rooms'),
+    Route('create_room', '/api/chat/rooms', 'POST', 'CHAT_SERVICE_URL', '/rooms', True, 'Create room'),
+    Route('get_room', '/api/chat/rooms/<int:room_id>', 'GET', 'CHAT_SERVICE_URL', '/rooms/{room_id}', False,
+          'Get room details'),
+    Route('get_messages', '/api/chat/rooms/<int:room_id>/messages', 'GET', 'CHAT_SERVICE_URL',
+          '/rooms/{room_id}/messages', False, 'Get room messages'),
+    Route('get_online_users', '/api/chat/rooms/<int:room_id>/online', 'GET', 'CHAT_SERVICE_URL',
+          '/rooms/{room_id}/online', False, 'Get online users'),
+]
+
+# Upstream response headers relayed to the client (pagination, counts and cache validators)
+PASSTHROUGH_HEADERS = ('X-Next-Cursor', 'X-Total-Count', 'ETag', 'Last-Modified', 'Cache-Control')
+
+# Client request headers forwarded on GET, so services can answer 304 Not Modified
+CONDITIONAL_HEADERS = ('If-None-Match', 'If-Modified-Since')
+
+# Services probed by /health, keyed by their name in the response
+HEALTH_CHECKS = {
+    'auth': 'AUTH_SERVICE_URL',
+    'user': 'USER_SERVICE_URL',
+    'chat': 'CHAT_SERVICE_URL'
+}
+
+# Counters aggregated by /api/stats: response field -> (service, count endpoint)
+STATS_COUNTS = {
+    'total_users': ('AUTH_SERVICE_URL', '/users/count'),
+    'total_rooms': ('CHAT_SERVICE_URL', '/rooms/count')
+}
+
+
+def aiohttp_rule(rule):
+    """Convert a Flask URL rule to aiohttp syntax: <int:id> -> {id:\\d+}"""
+    return re.sub(r'<int:(\w+)>', r'{\1:\\d+}', rule)
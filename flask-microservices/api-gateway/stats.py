@@ -0,0 +1,46 @@
+"""
+Stats Aggregation
+Collects /api/stats counters from the services' count endpoints
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+
+class StatsAggregator:
+    """Fetch all counters concurrently and cache the result for STATS_CACHE_TTL seconds"""
+
+    def __init__(self, upstream, counts, app=None):
+        self.upstream = upstream
+        self.counts = counts
+        self.app = None
+        self._cached = None
+        self._cached_at = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=len(counts), thread_name_prefix='stats')
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('STATS_CACHE_TTL', 10)
+
+    def fetch_count(self, service, path):
+        response = self.upstream.request('GET', self.app.config[service], path, timeout=5)
+        return response.json()['count'] if response.status_code == 200 else 0
+
+    def get(self):
+        """Current counters, refreshed at most once per STATS_CACHE_TTL"""
+        ttl = self.app.config['STATS_CACHE_TTL']
+        with self._lock:
+            if self._cached is not None and time.monotonic() - self._cached_at < ttl:
+                return self._cached
+
+            fields = list(self.counts)
+            futures = [self._executor.submit(self.fetch_count, *self.counts[field]) for field in fields]
+            stats = {field: future.result() for field, future in zip(fields, futures)}
+
+            self._cached = stats
+            self._cached_at = time.monotonic()
+            return stats
@@ -0,0 +1,132 @@
+"""
+Upstream HTTP Client
+Pooled, keep-alive connections from the gateway to the backend services
+"""
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def parse_route_timeouts(value):
+    """Parse 'prefix=seconds,prefix=seconds' into {prefix: seconds}"""
+    timeouts = {}
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        prefix, seconds = item.split('=', 1)
+        timeouts[prefix.strip()] = float(seconds)
+    return timeouts
+
+
+def route_timeout(route, route_timeouts, default):
+    """Read timeout for a gateway route, longest matching prefix wins"""
+    best = ''
+    timeout = default
+    for prefix, seconds in route_timeouts.items():
+        if route.startswith(prefix) and len(prefix) > len(best):
+            best, timeout = prefix, seconds
+    return timeout
+
+
+class SizedBody:
+    """A client request body relayed upstream in chunks under its declared length
+
+    requests sends Content-Length (and no Transfer-Encoding) for bodies with
+    a __len__, so the upstream sees a single, consistent framing.
+    """
+
+    def __init__(self, stream, length, chunk_size=64 * 1024):
+        self.stream = stream
+        self.length = length
+        self.chunk_size = chunk_size
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        remaining = self.length
+        while remaining > 0:
+            chunk = self.stream.read(min(self.chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+class UpstreamClient:
+    """One keep-alive connection pool (requests.Session) per upstream service"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self._sessions = {}
+        self._requests = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('UPSTREAM_POOL_SIZE', 20)
+        app.config.setdefault('UPSTREAM_POOL_BLOCK', False)
+        app.config.setdefault('UPSTREAM_MAX_RETRIES', 0)
+        app.config.setdefault('UPSTREAM_CONNECT_TIMEOUT', 2)
+        app.config.setdefault('UPSTREAM_READ_TIMEOUT', 10)
+        app.config.setdefault('ROUTE_TIMEOUTS', {})
+
+    def session(self, service_url):
+        """Get (or create) the pooled session for an upstream"""
+        session = self._sessions.get(service_url)
+        if session is not None:
+            return session
+
+        with self._lock:
+            session = self._sessions.get(service_url)
+            if session is None:
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=self.app.config['UPSTREAM_POOL_SIZE'],
+                    pool_block=self.app.config['UPSTREAM_POOL_BLOCK'],
+                    max_retries=self.app.config['UPSTREAM_MAX_RETRIES']
+                )
+                session = requests.Session()
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._sessions[service_url] = session
+                self._requests[service_url] = 0
+            return session
+
+    def timeout_for(self, route):
+        """(connect, read) timeout for a gateway route, longest prefix wins"""
+        read_timeout = route_timeout(
+            route, self.app.config['ROUTE_TIMEOUTS'], self.app.config['UPSTREAM_READ_TIMEOUT']
+        )
+        return (self.app.config['UPSTREAM_CONNECT_TIMEOUT'], read_timeout)
+
+    def request(self, method, service_url, path, route=None, timeout=None, **kwargs):
+        """Send a request to an upstream over its pooled session"""
+        session = self.session(service_url)
+        if timeout is None:
+            timeout = self.timeout_for(route or path)
+        with self._lock:
+            self._requests[service_url] += 1
+        return session.request(method, f"{service_url}{path}", timeout=timeout, **kwargs)
+
+    def stats(self):
+        """Connection reuse per upstream"""
+        stats = {}
+        with self._lock:
+            sessions = list(self._sessions.items())
+        for service_url, session in sessions:
+            adapter = session.get_adapter(service_url)
+            pools = adapter.poolmanager.pools
+            connections = sum(pools[key].num_connections for key in pools.keys())
+            requests_sent = self._requests[service_url]
+            stats[service_url] = {
+                'requests': requests_sent,
+                'connections_opened': connections,
+                'connections_reused': max(requests_sent - connections, 0),
+                'reuse_ratio': round(1 - connections / requests_sent, 4) if requests_sent else 0.0
+            }
+        return stats
@@ -5,19 +5,54 @@ Handles user registration, login, and JWT token generation
 
 from flask import Flask, request, jsonify
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
 import datetime
+import hashlib
 import os
+from fast_json import FastJSONProvider, parse_fields, project
+from password_hasher import PasswordHasher, HasherBusy
+from record_cache import create_record_cache
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 
 # Configuration
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'auth-secret-key-change-in-production')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///auth.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# JWT configuration - the signing secret is shared with services that verify tokens locally
+app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', app.config['SECRET_KEY'])
+app.config['JWT_ALGORITHM'] = os.environ.get('JWT_ALGORITHM', 'HS256')
+app.config['JWT_PRIVATE_KEY'] = os.environ.get('JWT_PRIVATE_KEY')
+app.config['JWT_PUBLIC_KEY'] = os.environ.get('JWT_PUBLIC_KEY')
+app.config['JWT_KEY_ID'] = os.environ.get('JWT_KEY_ID', 'auth-1')
+
+# Pagination
+app.config['PAGE_SIZE'] = int(os.environ.get('PAGE_SIZE', 100))
+app.config['MAX_PAGE_SIZE'] = int(os.environ.get('MAX_PAGE_SIZE', 500))
+
+# Password hashing - a bounded pool off the request threads; raising the method's
+# cost rehashes users as they log in
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256')
+app.config['PASSWORD_HASH_POOL'] = os.environ.get('PASSWORD_HASH_POOL', 'process')  # 'process', 'thread' or 'inline'
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+app.config['PASSWORD_HASH_MAX_PENDING'] = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 4 * app.config['PASSWORD_HASH_WORKERS']))
+app.config['PASSWORD_HASH_TIMEOUT'] = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+
+# User lookup cache - in-process unless a redis:// URL is configured
+app.config['USER_CACHE_BACKEND_URL'] = os.environ.get('USER_CACHE_BACKEND_URL')
+app.config['USER_CACHE_SIZE'] = int(os.environ.get('USER_CACHE_SIZE', 10000))
+app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', 60))
+
 db = SQLAlchemy(app)
+password_hasher = PasswordHasher(app)
+user_cache = create_record_cache(
+    app.config['USER_CACHE_BACKEND_URL'],
+    max_size=app.config['USER_CACHE_SIZE'],
+    ttl=app.config['USER_CACHE_TTL'],
+    prefix='auth:user:'
+)
 
 # User Model
 class User(db.Model):
@@ -30,10 +65,14 @@ class User(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        """Check a password, upgrading the stored hash if the hash method changed"""
+        valid, new_hash = password_hasher.verify(self.password_hash, password)
+        if new_hash:
+            self.password_hash = new_hash
+        return valid
     
     def to_dict(self):
         return {
@@ -44,42 +83,153 @@ class User(db.Model):
             'created_at': self.created_at.isoformat()
         }
 
-# Initialize database
-with app.app_context():
-    db.create_all()
-    # Create default admin if not exists
-    if not User.query.filter_by(username='admin').first():
-        admin = User(username='admin', email='admin@example.com', is_admin=True)
-        admin.set_password('admin123')
-        db.session.add(admin)
-        db.session.commit()
-        print("Default admin user created")
+# Fields of User.to_dict() a `fields=` projection may select
+USER_FIELDS = ('id', 'username', 'email', 'is_admin', 'created_at')
+
+# Revoked Token Model (logout)
+class RevokedToken(db.Model):
+    __tablename__ = 'revoked_tokens'
+    id = db.Column(db.Integer, primary_key=True)
+    token_digest = db.Column(db.String(64), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+# User Revocation Model (ban) - every token issued at or before revoked_at is invalid,
+# and the user cannot log in again until the ban is lifted (lifted_at set)
+class UserRevocation(db.Model):
+    __tablename__ = 'user_revocations'
+    user_id = db.Column(db.Integer, primary_key=True)
+    revoked_at = db.Column(db.DateTime, nullable=False)
+    lifted_at = db.Column(db.DateTime)
+
+def init_database():
+    """Create tables (and columns added since) and the default admin user"""
+    with app.app_context():
+        db.create_all()
+        # create_all() skips existing tables, so add columns introduced since
+        existing = {column['name'] for column in db.inspect(db.engine).get_columns('user_revocations')}
+        for column in UserRevocation.__table__.columns:
+            if column.name not in existing:
+                with db.engine.begin() as conn:
+                    conn.execute(db.text(
+                        f"ALTER TABLE user_revocations ADD COLUMN {column.name} "
+                        f"{column.type.compile(db.engine.dialect)}"
+                    ))
+        # Create default admin if not exists
+        if not User.query.filter_by(username='admin').first():
+            admin = User(username='admin', email='admin@example.com', is_admin=True)
+            admin.set_password('admin123')
+            db.session.add(admin)
+            db.session.commit()
+            print("Default admin user created")
+
+def create_app():
+    """App factory used by the production server (gunicorn.conf.py)"""
+    init_database()
+    return app
+
+def is_asymmetric():
+    """Check whether tokens are signed with a private/public key pair"""
+    return not app.config['JWT_ALGORITHM'].startswith('HS')
+
+def signing_key():
+    """Get the key used to sign tokens"""
+    if is_asymmetric():
+        return app.config['JWT_PRIVATE_KEY']
+    return app.config['JWT_SECRET_KEY']
+
+def verification_key():
+    """Get the key used to verify tokens"""
+    if is_asymmetric():
+        return app.config['JWT_PUBLIC_KEY']
+    return app.config['JWT_SECRET_KEY']
 
 def generate_token(user_id, username, is_admin):
     """Generate JWT token"""
+    now = datetime.datetime.utcnow()
     payload = {
         'user_id': user_id,
         'username': username,
         'is_admin': is_admin,
-        'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24)
+        'iat': epoch(now),  # sub-second, so a token issued just after a revocation stays valid
+        'exp': now + datetime.timedelta(hours=24)
     }
-    return jwt.encode(payload, app.config['SECRET_KEY'], algorithm='HS256')
+    headers = {'kid': app.config['JWT_KEY_ID']} if is_asymmetric() else None
+    return jwt.encode(payload, signing_key(), algorithm=app.config['JWT_ALGORITHM'], headers=headers)
 
 def verify_token(token):
     """Verify JWT token"""
     try:
-        payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-        return payload
+        payload = jwt.decode(token, verification_key(), algorithms=[app.config['JWT_ALGORITHM']])
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
         return None
+    
+    if is_revoked(token, payload):
+        return None
+    return payload
+
+def token_digest(token):
+    """Digest used to identify a token without storing it"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def epoch(dt):
+    """Convert a naive UTC datetime to epoch seconds (with microseconds)"""
+    return dt.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+def is_revoked(token, payload):
+    """Check whether a token was logged out or its user's tokens were revoked"""
+    if RevokedToken.query.filter_by(token_digest=token_digest(token)).first():
+        return True
+    
+    revocation = db.session.get(UserRevocation, payload['user_id'])
+    return bool(revocation) and payload.get('iat', 0) <= epoch(revocation.revoked_at)
+
+def bearer_token():
+    """Extract the bearer token from the Authorization header"""
+    token = request.headers.get('Authorization', '')
+    if token.startswith('Bearer '):
+        token = token[7:]
+    return token
+
+def paginate(query, key):
+    """Keyset pagination (?limit=N&after=<id>) ordered by primary key
+    
+    Returns the page and the cursor of the next page (None on the last page).
+    """
+    limit = request.args.get('limit', app.config['PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, app.config['MAX_PAGE_SIZE']))
+    after = request.args.get('after', type=int)
+    
+    if after is not None:
+        query = query.filter(key > after)
+    items = query.order_by(key).limit(limit + 1).all()
+    
+    if len(items) > limit:
+        items = items[:limit]
+        return items, str(items[-1].id)
+    return items, None
+
+def page_headers(next_cursor):
+    """Response headers advertising the next page cursor"""
+    return {'X-Next-Cursor': next_cursor} if next_cursor else {}
+
+@app.errorhandler(HasherBusy)
+def hasher_busy(error):
+    """Shed logins and registrations while the hashing pool is saturated"""
+    return jsonify({'error': 'Authentication is busy, retry shortly'}), 503, {'Retry-After': '1'}
 
 # Routes
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
-    return jsonify({'status': 'healthy', 'service': 'auth-service'}), 200
+    return jsonify({
+        'status': 'healthy',
+        'service': 'auth-service',
+        'password_hashing': password_hasher.stats(),
+        'user_cache': user_cache.stats()
+    }), 200
 
 @app.route('/register', methods=['POST'])
 def register():
@@ -121,10 +271,20 @@ def login():
         return jsonify({'error': 'Missing username or password'}), 400
     
     user = User.query.filter_by(username=data['username']).first()
+    # Looked up before check_password(): querying afterwards would autoflush
+    # an upgraded hash and hide it from the dirty check below
+    revocation = db.session.get(UserRevocation, user.id) if user else None
     
     if not user or not user.check_password(data['password']):
         return jsonify({'error': 'Invalid username or password'}), 401
     
+    if revocation and revocation.lifted_at is None:
+        return jsonify({'error': 'Account suspended'}), 403
+    
+    # Store the hash upgraded by check_password()
+    if user in db.session.dirty:
+        db.session.commit()
+    
     # Generate token
     token = generate_token(user.id, user.username, user.is_admin)
     
@@ -153,24 +313,128 @@ def verify():
             'user_id': payload['user_id'],
             'username': payload['username'],
             'is_admin': payload['is_admin']
-        }
+        },
+        'exp': payload['exp']
+    }), 200
+
+@app.route('/logout', methods=['POST'])
+def logout():
+    """Revoke the presented token"""
+    token = bearer_token()
+    payload = verify_token(token) if token else None
+    
+    if not payload:
+        return jsonify({'error': 'Invalid or expired token'}), 401
+    
+    db.session.add(RevokedToken(
+        token_digest=token_digest(token),
+        user_id=payload['user_id'],
+        expires_at=datetime.datetime.utcfromtimestamp(payload['exp'])
+    ))
+    db.session.commit()
+    
+    return jsonify({'message': 'Logout successful'}), 200
+
+@app.route('/users/<int:user_id>/revoke', methods=['POST'])
+def revoke_user_tokens(user_id):
+    """Ban a user: revoke every token issued so far and refuse logins (admin only)"""
+    payload = verify_token(bearer_token())
+    
+    if not payload or not payload.get('is_admin'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    revocation = db.session.get(UserRevocation, user_id)
+    if not revocation:
+        revocation = UserRevocation(user_id=user_id)
+        db.session.add(revocation)
+    revocation.revoked_at = datetime.datetime.utcnow()
+    revocation.lifted_at = None
+    db.session.commit()
+    
+    return jsonify({'message': 'User tokens revoked'}), 200
+
+@app.route('/users/<int:user_id>/revoke', methods=['DELETE'])
+def lift_user_revocation(user_id):
+    """Lift a ban so the user can log in again (admin only)
+    
+    Tokens issued before the ban stay revoked.
+    """
+    payload = verify_token(bearer_token())
+    
+    if not payload or not payload.get('is_admin'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    revocation = db.session.get(UserRevocation, user_id)
+    if not revocation:
+        return jsonify({'error': 'User is not banned'}), 404
+    revocation.lifted_at = datetime.datetime.utcnow()
+    db.session.commit()
+    
+    return jsonify({'message': 'Ban lifted'}), 200
+
+@app.route('/revocations', methods=['GET'])
+def get_revocations():
+    """List revocations that are still in effect (polled by other services)"""
+    now = datetime.datetime.utcnow()
+    tokens = RevokedToken.query.filter(RevokedToken.expires_at > now).all()
+    users = UserRevocation.query.all()
+    
+    return jsonify({
+        'tokens': [t.token_digest for t in tokens],
+        'users': {str(u.user_id): epoch(u.revoked_at) for u in users},
+        'generated_at': epoch(now)
+    }), 200
+
+@app.route('/keys', methods=['GET'])
+def get_keys():
+    """Publish the public verification key (asymmetric signing only)"""
+    if not is_asymmetric():
+        return jsonify({'error': 'Tokens are signed with a shared secret'}), 404
+    
+    return jsonify({
+        'algorithm': app.config['JWT_ALGORITHM'],
+        'keys': [{
+            'kid': app.config['JWT_KEY_ID'],
+            'public_key': app.config['JWT_PUBLIC_KEY']
+        }]
     }), 200
 
 @app.route('/users/<int:user_id>', methods=['GET'])
 def get_user(user_id):
-    """Get user by ID"""
-    user = User.query.get(user_id)
+    """Get user by ID (`fields=` selects fields)"""
+    try:
+        fields = parse_fields(request.args.get('fields'), USER_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    def load():
+        user = db.session.get(User, user_id)
+        return user.to_dict() if user else None
+    
+    user = user_cache.get(user_id, load)
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
-    return jsonify(user.to_dict()), 200
+    return jsonify(project(user, fields)), 200
+
+@app.route('/users/count', methods=['GET'])
+def count_users():
+    """Get the number of users"""
+    count = db.session.query(db.func.count(User.id)).scalar()
+    return jsonify({'count': count}), 200, {'X-Total-Count': str(count)}
 
 @app.route('/users', methods=['GET'])
 def get_all_users():
-    """Get all users"""
-    users = User.query.all()
-    return jsonify([user.to_dict() for user in users]), 200
+    """Get all users (paginated, `fields=` selects fields)"""
+    try:
+        fields = parse_fields(request.args.get('fields'), USER_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    users, next_cursor = paginate(User.query, User.id)
+    return jsonify([project(user.to_dict(), fields) for user in users]), 200, page_headers(next_cursor)
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5001, debug=True)
+    # Development server; production runs gunicorn with gunicorn.conf.py
+    create_app().run(host='0.0.0.0', port=5001, debug=True)
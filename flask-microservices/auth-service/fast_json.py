@@ -0,0 +1,140 @@
+"""
+Fast JSON
+JSON encoding shared by the service's Flask responses and Socket.IO packets,
+using orjson when it is installed and the standard library otherwise
+"""
+
+from collections import OrderedDict
+import json
+import threading
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional: fall back to the stdlib encoder
+    orjson = None
+
+
+def dumps_bytes(obj, default=None):
+    """Compact UTF-8 JSON"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=default, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def dumps(obj, **kwargs):
+    """Compact JSON text; accepts (and ignores) json.dumps formatting arguments
+
+    Lets this module stand in for `json` wherever a library only needs
+    dumps()/loads(), such as the Socket.IO packet encoder.
+    """
+    return dumps_bytes(obj, default=kwargs.get('default')).decode()
+
+
+def loads(s, **kwargs):
+    if orjson is not None:
+        return orjson.loads(s)
+    return json.loads(s, **kwargs)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider encoding with orjson when available
+
+    Keys keep insertion order rather than being sorted. With orjson, datetime
+    values serialize as ISO 8601 instead of HTTP dates (the models already
+    send isoformat() strings). Debug-mode pretty printing uses the stdlib.
+    """
+
+    sort_keys = False
+    ensure_ascii = False
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs.keys() - {'default'}:
+            return super().dumps(obj, **kwargs)
+        return dumps_bytes(obj, default=kwargs.get('default', self.default)).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if self.compact is False or (self.compact is None and self._app.debug):
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj, default=self.default) + b'\n',
+                                        mimetype=self.mimetype)
+
+
+class FragmentCache:
+    """Bounded LRU of pre-serialized JSON for immutable objects (e.g. messages)
+
+    Each object is encoded once; list responses are assembled by joining the
+    cached fragments instead of re-encoding every item on every request.
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._fragments = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        """Cached JSON bytes for key, encoding build() on a miss"""
+        with self._lock:
+            fragment = self._fragments.get(key)
+            if fragment is not None:
+                self._fragments.move_to_end(key)
+                self.hits += 1
+                return fragment
+            self.misses += 1
+
+        fragment = dumps_bytes(build())
+        if self.max_size > 0:
+            with self._lock:
+                self._fragments[key] = fragment
+                if len(self._fragments) > self.max_size:
+                    self._fragments.popitem(last=False)
+        return fragment
+
+    def clear(self):
+        """Drop every fragment (after deletes, when ids may be reused)"""
+        with self._lock:
+            self._fragments.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._fragments),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None
+            }
+
+
+def json_list(fragments):
+    """JSON array body from pre-serialized item fragments"""
+    return b'[' + b','.join(fragments) + b']\n'
+
+
+def parse_fields(value, allowed):
+    """Fields named by a `fields=a,b,c` projection parameter, or None for all
+
+    Raises ValueError naming any field not in `allowed`.
+    """
+    if not value:
+        return None
+    fields = tuple(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields or None
+
+
+def project(obj, fields):
+    """Only the requested fields of a serialized object (all of them for None)"""
+    return obj if fields is None else {name: obj[name] for name in fields}
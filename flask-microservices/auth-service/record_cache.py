@@ -0,0 +1,147 @@
+"""
+Record Cache
+Read-through cache with TTL for hot single-row lookups (users, profiles),
+kept in process memory or shared through Redis
+"""
+
+from collections import OrderedDict
+import json
+import threading
+import time
+
+
+class LocalStore:
+    """Bounded in-process LRU with per-entry expiry"""
+
+    name = 'local'
+
+    def __init__(self, max_size=10000, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def size(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class RedisStore:
+    """Cache shared by every replica through Redis
+
+    Values are stored as JSON (tuples come back as lists), never pickled:
+    whoever can write to the Redis must not be able to run code in the
+    services reading it. Invalidations are seen by all replicas at once.
+    Works with any client exposing get/set/delete, such as fakeredis.FakeRedis().
+    """
+
+    name = 'redis'
+
+    def __init__(self, client, ttl=60, prefix='cache:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + str(key))
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self.client.set(self.prefix + str(key), json.dumps(value, separators=(',', ':')), ex=max(1, int(ttl)))
+
+    def delete(self, keys):
+        if keys:
+            self.client.delete(*[self.prefix + str(key) for key in keys])
+
+    def size(self):
+        return None
+
+
+class ReadThroughCache:
+    """get(key, load) returns the cached value or calls load() and caches it
+
+    None results (missing rows) are not cached. Writers call invalidate()
+    after committing a change, so readers see it on their next lookup rather
+    than after the TTL. Hit/miss counters are per process.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, load):
+        value = self.store.get(key)
+        with self._lock:
+            if value is not None:
+                self.hits += 1
+                return value
+            self.misses += 1
+
+        value = load()
+        if value is not None:
+            self.store.set(key, value)
+        return value
+
+    def invalidate(self, *keys):
+        self.store.delete(keys)
+        with self._lock:
+            self.invalidations += len(keys)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': self.store.name,
+                'size': self.store.size(),
+                'ttl': self.store.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+def create_store(backend_url=None, max_size=10000, ttl=60, prefix='cache:'):
+    """In-process store, or Redis-backed when a redis:// URL is configured"""
+    if not backend_url:
+        return LocalStore(max_size=max_size, ttl=ttl)
+
+    import redis  # only needed for the shared backend
+    return RedisStore(redis.Redis.from_url(backend_url), ttl=ttl, prefix=prefix)
+
+
+def create_record_cache(backend_url=None, max_size=10000, ttl=60, prefix='cache:'):
+    """Read-through cache over create_store()"""
+    return ReadThroughCache(create_store(backend_url, max_size=max_size, ttl=ttl, prefix=prefix))
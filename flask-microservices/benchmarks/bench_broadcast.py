@@ -0,0 +1,89 @@
+"""
+Room Broadcast Benchmark
+Compares one new_message frame per message with batched new_messages frames
+(RoomBatcher) for a room with many members: frames sent, frames/sec and CPU
+time per delivered message
+
+Usage:
+    python benchmarks/bench_broadcast.py [--members 2000] [--messages 500] [--batch 50]
+
+Members are registered directly with the Socket.IO manager and frames go to a
+counting transport, so the numbers cover serialization and fan-out only.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from flask import Flask
+from flask_socketio import SocketIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'chat-service'))
+from broadcast import RoomBatcher  # noqa: E402
+
+
+def make_server(members, batch):
+    app = Flask(__name__)
+    app.config.update(BROADCAST_BATCHING=True, BROADCAST_BATCH_MAX=batch, BROADCAST_BATCH_WINDOW=60)
+    socketio = SocketIO(app, async_mode='threading')
+    server = socketio.server
+
+    sent = {'frames': 0, 'bytes': 0}
+
+    def send(eio_sid, data):
+        sent['frames'] += 1
+        sent['bytes'] += len(data)
+
+    server.eio.send = send  # counting transport instead of real connections
+    for i in range(members):
+        sid = server.manager.connect(f'eio-{i}', '/')
+        server.manager.enter_room(sid, '/', '1', eio_sid=f'eio-{i}')
+    return app, socketio, sent
+
+
+def message(i):
+    return {
+        'id': i,
+        'content': f'message {i} ' + 'x' * 80,
+        'user_id': i % 50,
+        'username': f'user-{i % 50}',
+        'room_id': 1,
+        'timestamp': '2024-01-01T00:00:00',
+        'is_file': False,
+        'file_url': None
+    }
+
+
+def report(label, sent, cpu, wall, deliveries):
+    print(f"{label:>10}: {sent['frames']:8d} frames  {sent['frames'] / wall:10.0f} frames/sec  "
+          f"{cpu * 1e6 / deliveries:6.2f} us CPU per delivered message  "
+          f"{sent['bytes'] / deliveries:6.1f} bytes per delivered message")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--members', type=int, default=2000)
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--batch', type=int, default=50, help='messages per batch frame')
+    args = parser.parse_args()
+    payloads = [message(i) for i in range(args.messages)]
+    deliveries = args.members * args.messages
+
+    app, socketio, sent = make_server(args.members, args.batch)
+    cpu, wall = time.process_time(), time.perf_counter()
+    for payload in payloads:
+        socketio.emit('new_message', payload, room='1')
+    report('per-msg', sent, time.process_time() - cpu, time.perf_counter() - wall, deliveries)
+
+    app, socketio, sent = make_server(args.members, args.batch)
+    batcher = RoomBatcher(socketio, app)
+    cpu, wall = time.process_time(), time.perf_counter()
+    for payload in payloads:
+        batcher.add(1, payload)
+    batcher.flush_all()
+    report('batched', sent, time.process_time() - cpu, time.perf_counter() - wall, deliveries)
+
+
+if __name__ == '__main__':
+    main()
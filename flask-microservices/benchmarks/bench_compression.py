@@ -0,0 +1,83 @@
+"""
+Payload Size Benchmark
+Fetches a page of chat-service message history with and without a `fields=`
+projection, then serves each body through the gateway's Compressor (buffered
+and streamed) and reports bytes on the wire and compression time per response
+
+Usage:
+    python benchmarks/bench_compression.py [--limit 200] [--requests 200]
+"""
+
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+from flask import Flask, Response
+
+from query_plans import ROOT, load_app, seed
+
+sys.path.insert(0, os.path.join(ROOT, 'flask-microservices', 'api-gateway'))
+from compression import Compressor, brotli  # noqa: E402
+
+
+def history(limit):
+    """Message history bodies from chat-service: {label: bytes}"""
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, 'chat.db')
+        chat = load_app('chat_app', os.path.join(ROOT, 'flask-microservices', 'chat-service', 'app.py'), db_path)
+        now = datetime.datetime.utcnow().isoformat(' ')
+        seed(db_path, 'messages', ['content', 'user_id', 'username', 'room_id', 'timestamp', 'is_file'],
+             ((f'message {i}: ' + 'lorem ipsum dolor sit amet ' * 3, i % 50, f'user-{i % 50}', 1, now, 0)
+              for i in range(limit)))
+        client = chat.app.test_client()
+        return {
+            'full': client.get(f'/rooms/1/messages?limit={limit}').get_data(),
+            'fields=id,content,username':
+                client.get(f'/rooms/1/messages?limit={limit}&fields=id,content,username').get_data()
+        }
+
+
+def gateway(body, chunk_size=16 * 1024):
+    """A stand-in gateway serving `body` buffered on /buffered and streamed on /streamed"""
+    app = Flask(__name__)
+    compressor = Compressor(app)
+
+    @app.route('/buffered')
+    def buffered():
+        return Response(body, mimetype='application/json')
+
+    @app.route('/streamed')
+    def streamed():
+        chunks = (body[i:i + chunk_size] for i in range(0, len(body), chunk_size))
+        return Response(chunks, mimetype='application/json', direct_passthrough=True)
+
+    return app.test_client(), compressor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--limit', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    encodings = ['identity', 'gzip'] + (['br'] if brotli is not None else [])
+    for label, body in history(args.limit).items():
+        print(f"{label} ({args.limit} messages):")
+        client, _ = gateway(body)
+        for mode in ('buffered', 'streamed'):
+            for encoding in encodings:
+                started = time.process_time()
+                for _ in range(args.requests):
+                    response = client.get(f'/{mode}', headers={'Accept-Encoding': encoding})
+                    size = len(response.get_data())
+                cpu = (time.process_time() - started) / args.requests
+                print(f"  {mode:>8} {encoding:>8}: {size:8d} bytes  {cpu * 1000:6.3f} ms CPU/response")
+    if brotli is None:
+        print("brotli is not installed; only gzip was measured")
+
+
+if __name__ == '__main__':
+    main()
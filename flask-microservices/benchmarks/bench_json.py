@@ -0,0 +1,101 @@
+"""
+JSON Serialization Benchmark
+Times chat-service GET /rooms/<id>/messages at several page sizes with the
+stdlib encoder, the fast encoder (orjson, when installed) and the fast encoder
+serving pre-serialized messages from the fragment cache, and the encoding
+step alone against the previous jsonify([m.to_dict() ...]) path
+
+Usage:
+    python benchmarks/bench_json.py [--limits 50 500] [--requests 200]
+
+Reports requests/sec and per-request latency; the database work is the same
+in every mode, so differences come from serialization.
+"""
+
+import argparse
+import datetime
+import os
+import tempfile
+import time
+
+from flask import jsonify
+from flask.json.provider import DefaultJSONProvider
+
+from query_plans import ROOT, load_app, seed
+
+
+def seed_room(db_path, messages):
+    now = datetime.datetime.utcnow().isoformat(' ')
+    seed(db_path, 'messages', ['content', 'user_id', 'username', 'room_id', 'timestamp', 'is_file', 'file_url'],
+         ((f'message {i} ' + 'x' * 80, i % 50, f'user-{i % 50}', 1, now, 0, None) for i in range(messages)))
+
+
+def endpoint(chat, limit, requests):
+    """Seconds per request for GET /rooms/1/messages?limit=N"""
+    client = chat.app.test_client()
+    url = f'/rooms/1/messages?limit={limit}'
+    client.get(url)  # warm up (and fill the fragment cache when enabled)
+    started = time.perf_counter()
+    for _ in range(requests):
+        response = client.get(url)
+        assert response.status_code == 200 and len(response.get_json()) == limit
+    return (time.perf_counter() - started) / requests
+
+
+def encode_only(chat, limit, requests, legacy):
+    """Seconds per response body for an already-loaded page of messages"""
+    with chat.app.test_request_context():
+        messages = chat.Message.query.filter_by(room_id=1).order_by(chat.Message.id.desc()).limit(limit).all()
+        started = time.perf_counter()
+        for _ in range(requests):
+            if legacy:
+                jsonify([msg.to_dict() for msg in messages]).get_data()
+            else:
+                chat.json_list([chat.message_json.get((msg.id, None), msg.to_dict) for msg in messages])
+        return (time.perf_counter() - started) / requests
+
+
+def report(label, seconds):
+    print(f"  {label:>22}: {1 / seconds:8.0f} req/sec  {seconds * 1000:7.3f} ms/request")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--limits', type=int, nargs='+', default=[50, 500])
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, 'chat.db')
+        chat = load_app('chat_app', os.path.join(ROOT, 'flask-microservices', 'chat-service', 'app.py'), db_path)
+        seed_room(db_path, max(args.limits) * 2)
+        chat.app.config['MAX_MESSAGE_PAGE_SIZE'] = max(args.limits)
+        fast_json = chat.fast_json
+        orjson = fast_json.orjson
+        print(f"fast encoder: {'orjson ' + orjson.__version__ if orjson else 'not installed (stdlib fallback)'}")
+
+        modes = [
+            ('stdlib', None, 0),
+            ('fast', orjson, 0),
+            ('fast + fragment cache', orjson, chat.message_json.max_size or 20000),
+        ]
+        for limit in args.limits:
+            print(f"limit={limit}, endpoint:")
+            for label, encoder, cache_size in modes:
+                fast_json.orjson = encoder
+                chat.message_json.clear()
+                chat.message_json.max_size = cache_size
+                report(label, endpoint(chat, limit, args.requests))
+
+            print(f"limit={limit}, encoding only:")
+            fast_json.orjson = None
+            chat.app.json = DefaultJSONProvider(chat.app)
+            report('jsonify (before)', encode_only(chat, limit, args.requests, legacy=True))
+            chat.app.json = fast_json.FastJSONProvider(chat.app)
+            fast_json.orjson = orjson
+            report('fragment cache', encode_only(chat, limit, args.requests, legacy=False))
+        fast_json.orjson = orjson
+
+
+if __name__ == '__main__':
+    main()
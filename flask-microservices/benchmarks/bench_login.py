@@ -0,0 +1,141 @@
+"""
+Login Throughput Benchmark
+Measures auth-service /login throughput with hashing on the request threads
+(inline) and in the process pool, reports logins/sec per hashing core, checks
+that a burst beyond PASSWORD_HASH_MAX_PENDING is shed with fast 503s, and that
+raising PASSWORD_HASH_METHOD rehashes users as they log in, and that jobs
+outliving PASSWORD_HASH_TIMEOUT hold their slot until they finish
+
+Usage:
+    python benchmarks/bench_login.py [--logins 400] [--threads 16] [--workers 4]
+                                     [--method pbkdf2:sha256]
+
+Exits with status 1 if shed requests are not fast, a login is not rehashed or
+a timed-out job frees its slot early.
+"""
+
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from werkzeug.security import generate_password_hash
+
+from query_plans import ROOT, load_app, seed
+
+sys.path.insert(0, os.path.join(ROOT, 'flask-microservices', 'auth-service'))
+from password_hasher import hash_method  # noqa: E402
+
+PASSWORD = 'correct horse battery staple'
+
+
+def seed_users(db_path, count, method):
+    """Users sharing one hash (same password and cost, so the same work per login)"""
+    pwhash = generate_password_hash(PASSWORD, method=method)
+    now = datetime.datetime.utcnow().isoformat(' ')
+    seed(db_path, 'users', ['username', 'email', 'password_hash', 'is_admin', 'created_at'],
+         ((f'bench-{i}', f'bench-{i}@example.com', pwhash, 0, now) for i in range(count)))
+
+
+def run_logins(app, users, logins, threads):
+    """Log in from several threads; (seconds, status code -> [latencies])"""
+    results = {}
+    lock = threading.Lock()
+
+    def worker(mine):
+        client = app.test_client()
+        for i in mine:
+            started = time.perf_counter()
+            response = client.post('/login', json={'username': f'bench-{users[i % len(users)]}',
+                                                   'password': PASSWORD})
+            with lock:
+                results.setdefault(response.status_code, []).append(time.perf_counter() - started)
+
+    workers = [threading.Thread(target=worker, args=(range(t, logins, threads),)) for t in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - started, results
+
+
+def configure(auth, **config):
+    auth.password_hasher.shutdown()
+    auth.app.config.update(**config)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--logins', type=int, default=400)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='hashing processes')
+    parser.add_argument('--method', default='pbkdf2:sha256', help='hash method of the seeded users')
+    args = parser.parse_args()
+    failed = False
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, 'auth.db')
+        auth = load_app('auth_app', os.path.join(ROOT, 'flask-microservices', 'auth-service', 'app.py'), db_path)
+        seed_users(db_path, args.logins * 2, args.method)
+        users = list(range(args.logins * 2))
+
+        # Throughput: every login is valid and nothing is shed
+        for label, pool, workers in (('inline', 'inline', 1), ('process', 'process', args.workers)):
+            configure(auth, PASSWORD_HASH_METHOD=args.method, PASSWORD_HASH_POOL=pool,
+                      PASSWORD_HASH_WORKERS=workers, PASSWORD_HASH_MAX_PENDING=args.logins)
+            elapsed, results = run_logins(auth.app, users[:args.logins], args.logins, args.threads)
+            rate = len(results.get(200, [])) / elapsed
+            cores = workers if pool == 'process' else 1
+            print(f"{label:>8}: {rate:8.1f} logins/sec  {rate / cores:8.1f} per hashing core  "
+                  f"(statuses {sorted((code, len(times)) for code, times in results.items())})")
+
+        # Burst: more concurrent logins than the queue admits
+        pending = max(1, args.workers)
+        configure(auth, PASSWORD_HASH_POOL='process', PASSWORD_HASH_WORKERS=args.workers,
+                  PASSWORD_HASH_MAX_PENDING=pending)
+        elapsed, results = run_logins(auth.app, users[:args.logins], args.logins, args.threads * 4)
+        shed = sorted(results.get(503, []))
+        print(f"   burst: {len(results.get(200, []))} admitted, {len(shed)} shed with 503 "
+              f"(max pending {pending}, {args.threads * 4} threads)")
+        if shed:
+            p99 = shed[min(len(shed) - 1, int(len(shed) * 0.99))]
+            print(f"          503 latency p50 {shed[len(shed) // 2] * 1000:.1f} ms  p99 {p99 * 1000:.1f} ms")
+            admitted = sorted(results.get(200, [])) or [0]
+            if p99 >= admitted[len(admitted) // 2]:
+                print("Shed requests are not faster than admitted logins")
+                failed = True
+
+        # Rehash-on-login: a higher cost upgrades the users who log in
+        old = auth.password_hasher.method
+        configure(auth, PASSWORD_HASH_METHOD=f"pbkdf2:sha256:{int(old.split(':')[2]) * 2}",
+                  PASSWORD_HASH_MAX_PENDING=args.logins)
+        upgraded = users[args.logins:args.logins + 20]
+        run_logins(auth.app, upgraded, len(upgraded), 4)
+        with auth.app.app_context():
+            stale = [u for u in upgraded
+                     if hash_method(auth.User.query.filter_by(username=f'bench-{u}').one().password_hash)
+                     != auth.password_hasher.method]
+        print(f"  rehash: {len(upgraded) - len(stale)}/{len(upgraded)} users upgraded from {old} "
+              f"to {auth.password_hasher.method}")
+        failed = failed or bool(stale)
+
+        # Timeouts: the request fails fast but the job keeps its slot until it finishes
+        configure(auth, PASSWORD_HASH_TIMEOUT=0.001, PASSWORD_HASH_MAX_PENDING=pending)
+        _, results = run_logins(auth.app, users[:pending], pending, pending)
+        held = auth.password_hasher.stats()['in_flight']
+        auth.password_hasher.shutdown()
+        released = auth.password_hasher.stats()['in_flight']
+        print(f" timeout: {len(results.get(503, []))}/{pending} logins timed out, {held} slots held "
+              f"until the jobs finished, {released} after")
+        failed = failed or held == 0 or released != 0
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+User Stats Ingestion Benchmark
+Measures user-service stats throughput with one request per delta
+(/profiles/<id>/stats) and with bulk upserts (/profiles/stats:batch), and
+checks that concurrent batches lose no increments.
+
+Usage:
+    python benchmarks/bench_stats_batch.py [--deltas 100000] [--batch-size 500] [--threads 4]
+
+Exits with status 1 if the batch endpoint stays below --target deltas/sec or
+the stored counters do not add up.
+"""
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from query_plans import ROOT, load_app
+
+
+def make_deltas(count, users):
+    now = datetime.datetime.utcnow().isoformat()
+    return [{
+        'user_id': random.randint(1, users),
+        'messages_sent': 1,
+        'rooms_created': 0,
+        'last_seen': now
+    } for _ in range(count)]
+
+
+def single(app, deltas):
+    """One request (and one transaction) per delta, as chat-service used to send"""
+    client = app.test_client()
+    started = time.perf_counter()
+    for delta in deltas:
+        client.post(f"/profiles/{delta['user_id']}/stats", json={'messages_sent': 1, 'last_seen': True})
+    return time.perf_counter() - started
+
+
+def batched(app, deltas, batch_size, threads):
+    """Bulk requests of batch_size deltas, sent from several threads at once"""
+    batches = [deltas[i:i + batch_size] for i in range(0, len(deltas), batch_size)]
+    errors = []
+
+    def worker(mine):
+        client = app.test_client()
+        for batch in mine:
+            response = client.post('/profiles/stats:batch', json={'deltas': batch})
+            if response.status_code != 200:
+                errors.append(response.status_code)
+
+    workers = [threading.Thread(target=worker, args=(batches[i::threads],)) for i in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - started, errors
+
+
+def messages_sent_total(module):
+    with module.app.app_context():
+        return module.db.session.execute(
+            module.db.select(module.db.func.sum(module.UserProfile.messages_sent))
+        ).scalar() or 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--deltas', type=int, default=100_000)
+    parser.add_argument('--single', type=int, default=2_000, help='deltas sent one request at a time')
+    parser.add_argument('--users', type=int, default=5_000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--target', type=float, default=10_000, help='required deltas/sec for batches')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        users = load_app('user_app', os.path.join(ROOT, 'flask-microservices', 'user-service', 'app.py'),
+                         os.path.join(workdir, 'users.db'))
+
+        elapsed = single(users.app, make_deltas(args.single, args.users))
+        print(f"{'single':>8}: {args.single / elapsed:10.0f} deltas/sec")
+
+        before = messages_sent_total(users)
+        elapsed, errors = batched(users.app, make_deltas(args.deltas, args.users), args.batch_size, args.threads)
+        rate = args.deltas / elapsed
+        print(f"{'batch':>8}: {rate:10.0f} deltas/sec "
+              f"({args.batch_size} per request, {args.threads} threads)")
+
+        lost = args.deltas - (messages_sent_total(users) - before)
+        failed = False
+        if errors or lost:
+            print(f"{len(errors)} failed batches, {lost} increments lost")
+            failed = True
+        if rate < args.target:
+            print(f"Batch throughput below the {args.target:.0f} deltas/sec target")
+            failed = True
+
+    if failed:
+        sys.exit(1)
+    print("Batch ingestion meets the target with no lost increments")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Token Verification Benchmark
+Compares per-message token verification throughput in local and remote mode,
+with and without the verified-token cache
+
+Usage:
+    python benchmarks/bench_token_verify.py [--messages 2000] [--auth-url http://localhost:5001]
+
+Remote mode needs a running auth-service started with the same JWT_SECRET_KEY.
+"""
+
+import argparse
+import datetime
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import jwt
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'chat-service'))
+from token_auth import TokenVerifier  # noqa: E402
+
+
+def make_token(secret):
+    """Sign a token the same way auth-service does"""
+    payload = {
+        'user_id': 1,
+        'username': 'bench',
+        'is_admin': False,
+        'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+    }
+    return jwt.encode(payload, secret, algorithm='HS256')
+
+
+def run(mode, token, messages, config, cache_size=0):
+    """Verify the same token once per simulated chat message"""
+    verifier = TokenVerifier(SimpleNamespace(config=dict(
+        config, TOKEN_VERIFICATION=mode, TOKEN_CACHE_SIZE=cache_size
+    )))
+    start = time.perf_counter()
+    for _ in range(messages):
+        if not verifier.verify(token):
+            print(f"{mode}: verification failed, is auth-service running with the same secret?")
+            return
+    elapsed = time.perf_counter() - start
+    label = f"{mode} (cached)" if cache_size else mode
+    print(f"{label:>15}: {messages / elapsed:10.0f} messages/sec ({elapsed * 1e6 / messages:.1f} us/message)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--auth-url', default=os.environ.get('AUTH_SERVICE_URL', 'http://localhost:5001'))
+    parser.add_argument('--secret', default=os.environ.get('JWT_SECRET_KEY', 'auth-secret-key-change-in-production'))
+    args = parser.parse_args()
+
+    config = {
+        'AUTH_SERVICE_URL': args.auth_url,
+        'JWT_SECRET_KEY': args.secret,
+        'JWT_ALGORITHM': 'HS256',
+        'TOKEN_CACHE_TTL': 300,
+        'TOKEN_REVOCATION_INTERVAL': 0
+    }
+    token = make_token(args.secret)
+
+    run('remote', token, args.messages, config)
+    run('local', token, args.messages, config)
+    run('remote', token, args.messages, config, cache_size=1000)
+    run('local', token, args.messages, config, cache_size=1000)
+
+
+if __name__ == '__main__':
+    main()
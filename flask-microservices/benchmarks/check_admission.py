@@ -0,0 +1,147 @@
+"""
+Admission Control Check
+Hammers a rate-limited route the way a misbehaving client does and checks that
+the burst is admitted, the excess gets 429 with Retry-After, other clients and
+unlisted routes are unaffected, and the bucket refills. Then saturates an
+upstream concurrency cap from many threads and checks that waiters beyond the
+queue are rejected at once rather than piling up.
+
+Usage:
+    python benchmarks/check_admission.py [--rate 5] [--burst 10] [--threads 20]
+
+Exits with status 1 if a check fails.
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+from flask import Flask
+
+from query_plans import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, 'flask-microservices', 'api-gateway'))
+from admission import (ConcurrencyLimiter, RateLimiter, RateLimited,  # noqa: E402
+                       UpstreamBusy, parse_rate_limits, retry_after_header)
+
+
+def expect(results, ok, message):
+    print(f"  {'ok  ' if ok else 'FAIL'} {message}")
+    results.append(ok)
+
+
+def check_rate_limits(args, results):
+    app = Flask(__name__)
+    app.config['RATE_LIMITS'] = {'/api/auth/login': (args.rate, args.burst)}
+    app.config['RATE_LIMIT_CLIENT_HEADER'] = 'X-Forwarded-For'
+    limiter = RateLimiter(app)
+
+    @app.errorhandler(RateLimited)
+    def rate_limited(error):
+        return {'error': 'Rate limit exceeded'}, 429, {'Retry-After': retry_after_header(error.retry_after)}
+
+    @app.route('/api/auth/login', methods=['POST'])
+    def login():
+        return {'token': 'x'}
+
+    @app.route('/health')
+    def health():
+        return {'status': 'healthy'}
+
+    client = app.test_client()
+    # The ingress appends the address it saw; the client rotates what it sends before it
+    attacker = {'X-Forwarded-For': '10.0.0.1, 203.0.113.7'}
+    statuses = [
+        client.post('/api/auth/login', headers={'X-Forwarded-For': f'10.0.{i // 256}.{i % 256}, 203.0.113.7'})
+        .status_code for i in range(args.burst * 5)
+    ]
+    print(f"rate limit {args.rate}/s, burst {args.burst}:")
+    expect(results, statuses.count(200) == args.burst,
+           f"{statuses.count(200)} of {len(statuses)} requests admitted, {statuses.count(429)} rejected "
+           f"(spoofed X-Forwarded-For entries ignored)")
+    rejected = client.post('/api/auth/login', headers=attacker)
+    expect(results, rejected.status_code == 429 and rejected.headers.get('Retry-After') == '1',
+           f"rejection carries Retry-After: {rejected.headers.get('Retry-After')}")
+
+    other = client.post('/api/auth/login', headers={'X-Forwarded-For': '198.51.100.2'})
+    expect(results, other.status_code == 200, "another client is admitted")
+    expect(results, all(client.get('/health').status_code == 200 for _ in range(args.burst * 2)),
+           "unlisted routes are not limited")
+
+    try:
+        parse_rate_limits('/api/auth/login=0')
+        zero_rejected = False
+    except ValueError:
+        zero_rejected = True
+    expect(results, zero_rejected, "a zero rate is rejected when parsing RATE_LIMITS")
+
+    time.sleep(1.5 / args.rate)
+    refilled = client.post('/api/auth/login', headers=attacker)
+    expect(results, refilled.status_code == 200, "bucket refills after 1/rate seconds")
+    print(f"  counters: {limiter.stats()}")
+
+
+def check_concurrency(args, results):
+    app = Flask(__name__)
+    app.config['UPSTREAM_MAX_CONCURRENCY'] = 2
+    app.config['UPSTREAM_QUEUE_SIZE'] = 3
+    app.config['UPSTREAM_QUEUE_TIMEOUT'] = 0.1
+    limiter = ConcurrencyLimiter(app)
+    hold = 0.3  # seconds each admitted request keeps its slot
+    outcomes = []
+    lock = threading.Lock()
+    start = threading.Barrier(args.threads)
+
+    def request():
+        start.wait()
+        started = time.perf_counter()
+        try:
+            limiter.acquire('http://chat-service')
+        except UpstreamBusy:
+            with lock:
+                outcomes.append(('rejected', time.perf_counter() - started))
+            return
+        time.sleep(hold)
+        limiter.release('http://chat-service')
+        with lock:
+            outcomes.append(('admitted', time.perf_counter() - started))
+
+    threads = [threading.Thread(target=request) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    admitted = [seconds for outcome, seconds in outcomes if outcome == 'admitted']
+    rejected = sorted(seconds for outcome, seconds in outcomes if outcome == 'rejected')
+    stats = limiter.stats()['upstreams']['http://chat-service']
+    print(f"concurrency cap 2, queue 3, {args.threads} simultaneous requests:")
+    expect(results, len(admitted) == 2, f"{len(admitted)} admitted")
+    expect(results, stats['queued'] == 3, f"{stats['queued']} queued, then rejected after the queue timeout")
+    fast = rejected[:args.threads - 5]
+    expect(results, bool(fast) and max(fast) < 0.05,
+           f"{len(fast)} rejected immediately (slowest {max(fast, default=0) * 1000:.1f} ms)")
+    expect(results, stats['in_flight'] == 0 and stats['waiting'] == 0, "all slots released")
+    print(f"  counters: {stats}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rate', type=float, default=5)
+    parser.add_argument('--burst', type=int, default=10)
+    parser.add_argument('--threads', type=int, default=20)
+    args = parser.parse_args()
+    results = []
+
+    check_rate_limits(args, results)
+    check_concurrency(args, results)
+
+    if not all(results):
+        sys.exit(1)
+    print("Bursts are admitted, excess load is rejected quickly, and slots are released")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Async Gateway CORS Check
+Runs async_app.py against a stub chat-service and checks that proxied
+responses, which are streamed, carry the same Access-Control-* headers as
+the gateway's own routes and CORS preflights
+
+Usage:
+    python benchmarks/check_async_cors.py
+
+Exits with status 1 if a response is missing a CORS header.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from query_plans import ROOT, load_app
+
+ORIGIN = 'http://chat.example.com'
+
+
+async def rooms(request):
+    return web.json_response([{'id': 1, 'name': 'General'}], headers={'ETag': '"rooms-1"'})
+
+
+async def run(results):
+    upstream = TestServer(web.Application())
+    upstream.app.router.add_get('/rooms', rooms)
+    await upstream.start_server()
+    os.environ['CHAT_SERVICE_URL'] = str(upstream.make_url('')).rstrip('/')
+
+    with tempfile.TemporaryDirectory() as workdir:
+        gateway = load_app('async_gateway', os.path.join(ROOT, 'flask-microservices', 'api-gateway', 'async_app.py'),
+                           os.path.join(workdir, 'unused.db'))
+    client = TestClient(TestServer(gateway.create_app()))
+    await client.start_server()
+    try:
+        for method, path, headers in (
+            ('GET', '/api/chat/rooms', {'Origin': ORIGIN}),
+            ('GET', '/health/live', {'Origin': ORIGIN}),
+            ('OPTIONS', '/api/chat/rooms', {'Origin': ORIGIN, 'Access-Control-Request-Method': 'GET'}),
+        ):
+            response = await client.request(method, path, headers=headers)
+            await response.read()
+            allow = response.headers.get('Access-Control-Allow-Origin')
+            expose = response.headers.get('Access-Control-Expose-Headers', '')
+            ok = allow == ORIGIN and 'ETag' in expose
+            if method == 'OPTIONS':
+                ok = ok and 'Access-Control-Allow-Methods' in response.headers
+            print(f"  {'ok  ' if ok else 'FAIL'} {method} {path}: {response.status}, "
+                  f"Allow-Origin={allow} Expose-Headers={expose or None}")
+            results.append(ok)
+    finally:
+        await client.close()
+        await upstream.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.parse_args()
+    results = []
+
+    asyncio.run(run(results))
+
+    if not all(results):
+        sys.exit(1)
+    print("Streamed proxy responses carry the CORS headers")
+
+
+if __name__ == '__main__':
+    main()
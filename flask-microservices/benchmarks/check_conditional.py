@@ -0,0 +1,126 @@
+"""
+Conditional GET Check
+Polls chat-service /rooms, /rooms/<id> and user-service /profiles/<id> the way
+a client revalidating its copy does, and checks that unchanged resources are
+answered with 304 and changed ones with a new ETag. Reports bytes transferred
+with and without revalidation. Then caches user-service profiles in the
+gateway and checks that a PUT through it invalidates the profile, its
+query-string variants and the profile list.
+
+Usage:
+    python benchmarks/check_conditional.py [--rooms 200] [--polls 100]
+
+Exits with status 1 if a poll gets the wrong status.
+"""
+
+import argparse
+import datetime
+import logging
+import os
+import sys
+import tempfile
+import threading
+
+import jwt
+from werkzeug.serving import make_server
+
+from query_plans import ROOT, load_app, seed
+
+
+def poll(client, path, etag=None, expect=200):
+    """GET with If-None-Match; (ok, new etag, body bytes)"""
+    headers = {'If-None-Match': etag} if etag else {}
+    response = client.get(path, headers=headers)
+    ok = response.status_code == expect
+    if not ok:
+        print(f"  GET {path}: expected {expect}, got {response.status_code}")
+    return ok, response.headers.get('ETag', etag), len(response.get_data())
+
+
+def serve(app):
+    """Run a WSGI app on a free local port; returns its URL"""
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}'
+
+
+def check_gateway_cache(users, results):
+    """PUT /api/users/profiles/<id> must invalidate every cached profile response"""
+    os.environ['USER_SERVICE_URL'] = serve(users.app)
+    os.environ['RESPONSE_CACHE_TTLS'] = '/api/users/profiles=60'
+    gateway = load_app('gateway_app', os.path.join(ROOT, 'flask-microservices', 'api-gateway', 'app.py'),
+                       os.environ['DATABASE_URL'][len('sqlite:///'):])
+    client = gateway.app.test_client()
+    paths = ['/api/users/profiles/7', '/api/users/profiles/7?fields=id,bio', '/api/users/profiles?limit=20']
+    for path in paths:
+        client.get(path)
+    hits = [client.get(path).headers.get('X-Cache') for path in paths]
+    results.append(hits == ['HIT'] * len(paths))
+
+    token = jwt.encode({'user_id': 7, 'username': 'u7', 'is_admin': False,
+                        'exp': datetime.datetime.utcnow() + datetime.timedelta(minutes=5)},
+                       users.app.config['JWT_SECRET_KEY'], algorithm=users.app.config['JWT_ALGORITHM'])
+    client.put('/api/users/profiles/7', json={'bio': 'changed'}, headers={'Authorization': f'Bearer {token}'})
+    after = {path: client.get(path) for path in paths}
+    for path, response in after.items():
+        ok = response.headers.get('X-Cache') == 'MISS' and 'changed' in response.get_data(as_text=True)
+        results.append(ok)
+        print(f"{path:>36}: {'fresh' if ok else 'STALE'} after PUT /api/users/profiles/7")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rooms', type=int, default=200)
+    parser.add_argument('--polls', type=int, default=100)
+    args = parser.parse_args()
+    results = []
+    os.environ['TOKEN_REVOCATION_INTERVAL'] = '0'  # no auth-service to poll
+
+    with tempfile.TemporaryDirectory() as workdir:
+        chat_db = os.path.join(workdir, 'chat.db')
+        chat = load_app('chat_app', os.path.join(ROOT, 'flask-microservices', 'chat-service', 'app.py'), chat_db)
+        now = datetime.datetime.utcnow().isoformat(' ')
+        seed(chat_db, 'rooms', ['name', 'description', 'created_by', 'created_at', 'is_private'],
+             ((f'room-{i}', '', 1, now, 0) for i in range(args.rooms)))
+        users = load_app('user_app', os.path.join(ROOT, 'flask-microservices', 'user-service', 'app.py'),
+                         os.path.join(workdir, 'users.db'))
+
+        chat_client, user_client = chat.app.test_client(), users.app.test_client()
+        for client, path in ((chat_client, '/rooms?limit=100'), (chat_client, '/rooms/1'),
+                             (user_client, '/profiles/7')):
+            ok, etag, full = poll(client, path)
+            results.append(ok)
+            revalidated = 0
+            for _ in range(args.polls):
+                ok, etag, size = poll(client, path, etag, expect=304)
+                results.append(ok)
+                revalidated += size
+            print(f"{path:>18}: {full * args.polls:9d} bytes re-downloading, "
+                  f"{revalidated:6d} bytes revalidating ({args.polls} polls)")
+
+        # Changes must produce a new representation
+        with chat.app.app_context():
+            chat.db.session.add(chat.Room(name='late room', description='', created_by=1))
+            chat.db.session.commit()
+        _, rooms_etag, _ = poll(chat_client, f'/rooms?limit={args.rooms + 10}')
+        with chat.app.app_context():
+            chat.db.session.add(chat.Room(name='later room', description='', created_by=1))
+            chat.db.session.commit()
+        ok, _, _ = poll(chat_client, f'/rooms?limit={args.rooms + 10}', rooms_etag, expect=200)
+        results.append(ok)
+
+        _, profile_etag, _ = poll(user_client, '/profiles/7')
+        user_client.post('/profiles/stats:batch', json={'deltas': [{'user_id': 7, 'messages_sent': 1}]})
+        ok, _, _ = poll(user_client, '/profiles/7', profile_etag, expect=200)
+        results.append(ok)
+
+        check_gateway_cache(users, results)
+
+    if not all(results):
+        sys.exit(1)
+    print("Unchanged resources revalidate with 304; changed ones return a new ETag")
+
+
+if __name__ == '__main__':
+    main()
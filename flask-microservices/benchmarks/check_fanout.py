@@ -0,0 +1,103 @@
+"""
+Cross-Replica Fan-out Check
+Starts two Socket.IO servers ("replicas") sharing one client manager backend,
+connects a client to each and checks that room emits on one replica reach
+clients on the other, reporting delivery latency
+
+Usage:
+    python benchmarks/check_fanout.py [--queue fakeredis://] [--messages 200]
+
+The default fakeredis:// backend is an in-process stand-in for Redis (needs
+fakeredis); pass --queue redis://localhost:6379/0 to go through a real server.
+Exits with status 1 if any message is not delivered across replicas.
+"""
+
+import argparse
+import os
+import socketserver
+import sys
+import threading
+import time
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from engineio.payload import Payload
+import socketio
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'chat-service'))
+from broadcast import create_client_manager  # noqa: E402
+
+
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def start_replica(queue):
+    """A minimal chat-service: join a room, emit to it"""
+    server = socketio.Server(async_mode='threading', client_manager=create_client_manager(queue))
+
+    @server.on('join')
+    def join(sid, data):
+        server.enter_room(sid, str(data['room_id']))
+
+    @server.on('message')
+    def message(sid, data):
+        server.emit('new_message', data, room=str(data['room_id']))
+
+    httpd = make_server('127.0.0.1', 0, socketio.WSGIApp(server),
+                        server_class=ThreadingWSGIServer, handler_class=QuietHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{httpd.server_port}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--queue', default='fakeredis://')
+    parser.add_argument('--messages', type=int, default=200)
+    args = parser.parse_args()
+    # Long-polling batches every queued packet into one payload; engineio
+    # rejects payloads of more than 16 by default
+    Payload.max_decode_packets = args.messages + 16
+
+    url_a, url_b = start_replica(args.queue), start_replica(args.queue)
+    time.sleep(0.5)  # let the managers subscribe
+
+    received = {}
+    done = threading.Event()
+    listener = socketio.Client()
+
+    @listener.on('new_message')
+    def on_message(data):
+        received[data['seq']] = time.perf_counter() - data['sent']
+        if len(received) == args.messages:
+            done.set()
+
+    sender = socketio.Client()
+    listener.connect(url_b, transports=['polling'])
+    sender.connect(url_a, transports=['polling'])
+    listener.emit('join', {'room_id': 1})
+    time.sleep(0.5)
+
+    for seq in range(args.messages):
+        sender.emit('message', {'room_id': 1, 'seq': seq, 'sent': time.perf_counter()})
+    done.wait(timeout=10)
+
+    sender.disconnect()
+    listener.disconnect()
+
+    latencies = sorted(received.values())
+    print(f"delivered {len(received)}/{args.messages} messages from replica A to a client on replica B "
+          f"via {args.queue}")
+    if latencies:
+        print(f"latency ms: p50 {latencies[len(latencies) // 2] * 1000:.1f}  "
+              f"max {latencies[-1] * 1000:.1f}")
+    if len(received) != args.messages:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Token Revocation Check
+Bans a user through auth-service and checks that their tokens stop verifying,
+that they cannot log in while banned, and that once the ban is lifted a token
+issued within the same second as the ban verifies while the old one stays
+revoked.
+
+Usage:
+    python benchmarks/check_revocation.py
+
+Exits with status 1 if a check fails.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+from query_plans import ROOT, load_app
+
+
+def expect(results, ok, message):
+    print(f"  {'ok  ' if ok else 'FAIL'} {message}")
+    results.append(ok)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.parse_args()
+    results = []
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ['PASSWORD_HASH_POOL'] = 'inline'
+        auth = load_app('auth_app', os.path.join(ROOT, 'flask-microservices', 'auth-service', 'app.py'),
+                        os.path.join(workdir, 'auth.db'))
+        client = auth.app.test_client()
+
+        def verify(token):
+            return client.post('/verify', json={'token': token}).status_code
+
+        def login(username, password):
+            response = client.post('/login', json={'username': username, 'password': password})
+            return response.status_code, (response.get_json() or {}).get('token')
+
+        _, admin_token = login('admin', 'admin123')
+        admin = {'Authorization': f'Bearer {admin_token}'}
+        user = {'username': 'banned', 'email': 'banned@example.com', 'password': 'secret-password'}
+        user_id = client.post('/register', json=user).get_json()['user']['id']
+        _, old_token = login(user['username'], user['password'])
+
+        status = client.post(f'/users/{user_id}/revoke', headers=admin).status_code
+        expect(results, status == 200, f"admin bans the user ({status})")
+        expect(results, verify(old_token) == 401, "tokens issued before the ban no longer verify")
+        status, _ = login(user['username'], user['password'])
+        expect(results, status == 403, f"banned user cannot log in ({status})")
+
+        status = client.delete(f'/users/{user_id}/revoke', headers=admin).status_code
+        expect(results, status == 200, f"admin lifts the ban ({status})")
+        status, new_token = login(user['username'], user['password'])
+        expect(results, status == 200 and verify(new_token) == 200,
+               "a token issued right after the ban (same second) verifies")
+        expect(results, verify(old_token) == 401, "tokens issued before the ban stay revoked")
+
+    if not all(results):
+        sys.exit(1)
+    print("Bans revoke existing tokens and block logins until lifted")
+
+
+if __name__ == '__main__':
+    main()
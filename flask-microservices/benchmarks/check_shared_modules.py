@@ -0,0 +1,67 @@
+"""
+Shared Module Check
+Each service directory is built as its own image (COPY *.py), so modules used
+by several services (fast_json.py, record_cache.py, gunicorn.conf.py, ...) are
+copied into every directory that needs them. Finds every module present in
+more than one service directory and checks the copies are identical.
+
+Usage:
+    python benchmarks/check_shared_modules.py
+
+Exits with status 1 if any copy has drifted; edit one copy, then copy it over
+the others.
+"""
+
+import argparse
+import glob
+import hashlib
+import os
+import sys
+
+from query_plans import ROOT
+
+# Each service's own entry point, not a shared module
+SERVICE_MODULES = {'app.py', 'async_app.py'}
+
+
+def service_dirs():
+    dirs = [os.path.join(ROOT, 'flask')]
+    for path in sorted(glob.glob(os.path.join(ROOT, 'flask-microservices', '*', 'Dockerfile'))):
+        dirs.append(os.path.dirname(path))
+    return dirs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.parse_args()
+
+    copies = {}
+    for directory in service_dirs():
+        for path in glob.glob(os.path.join(directory, '*.py')):
+            name = os.path.basename(path)
+            if name not in SERVICE_MODULES:
+                copies.setdefault(name, []).append(path)
+
+    drifted = 0
+    for name, paths in sorted(copies.items()):
+        if len(paths) < 2:
+            continue
+        digests = {}
+        for path in paths:
+            with open(path, 'rb') as f:
+                digests.setdefault(hashlib.sha256(f.read()).hexdigest(), []).append(os.path.relpath(path, ROOT))
+        ok = len(digests) == 1
+        drifted += not ok
+        print(f"  [{'ok' if ok else 'DRIFT'}] {name:<20} {len(paths)} copies")
+        if not ok:
+            for digest, group in digests.items():
+                print(f"      {digest[:12]}: {', '.join(sorted(group))}")
+
+    if drifted:
+        print(f"{drifted} shared modules have drifted")
+        sys.exit(1)
+    print("All shared module copies are identical")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Load Test
+Measures requests/sec and latency of an HTTP endpoint, and how many concurrent
+Socket.IO connections one chat-service pod holds
+
+Usage:
+    python benchmarks/load_test.py http --url http://localhost:30000/api/chat/rooms --concurrency 100 --duration 30
+    python benchmarks/load_test.py sockets --url http://localhost:5003 --connections 2000 --hold 30
+
+Needs aiohttp and python-socketio[asyncio_client]. Point --url at a pod (or a
+port-forward to one) to measure per-pod capacity rather than the whole service.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import aiohttp
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def http_load(url, concurrency, duration):
+    """Keep `concurrency` requests in flight for `duration` seconds"""
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+    connector = aiohttp.TCPConnector(limit=concurrency)
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+        async def worker():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    async with session.get(url) as response:
+                        await response.read()
+                        if response.status >= 400:
+                            errors += 1
+                            continue
+                except aiohttp.ClientError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    print(f"{len(latencies) / elapsed:10.0f} requests/sec ({len(latencies)} ok, {errors} errors, "
+          f"{concurrency} concurrent)")
+    if latencies:
+        print(f"latency ms: p50 {percentile(latencies, 0.5) * 1000:.1f}  "
+              f"p99 {percentile(latencies, 0.99) * 1000:.1f}  "
+              f"mean {statistics.mean(latencies) * 1000:.1f}")
+
+
+async def socket_capacity(url, connections, hold, ramp):
+    """Open `connections` Socket.IO clients, hold them, and count survivors"""
+    import socketio
+
+    clients = []
+    connect_times = []
+    failures = 0
+
+    async def connect():
+        nonlocal failures
+        client = socketio.AsyncClient(reconnection=False)
+        started = time.perf_counter()
+        try:
+            await client.connect(url, transports=['websocket'])
+        except socketio.exceptions.ConnectionError:
+            failures += 1
+            return
+        connect_times.append(time.perf_counter() - started)
+        clients.append(client)
+
+    # Open connections in batches of `ramp` so the test measures holding, not a thundering herd
+    for start in range(0, connections, ramp):
+        await asyncio.gather(*(connect() for _ in range(min(ramp, connections - start))))
+    print(f"connected {len(clients)}/{connections} ({failures} failed), "
+          f"connect ms p50 {percentile(connect_times, 0.5) * 1000:.1f} "
+          f"p99 {percentile(connect_times, 0.99) * 1000:.1f}")
+
+    await asyncio.sleep(hold)
+    alive = sum(client.connected for client in clients)
+    print(f"{alive} connections still open after {hold}s")
+
+    await asyncio.gather(*(client.disconnect() for client in clients))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    modes = parser.add_subparsers(dest='mode', required=True)
+
+    http = modes.add_parser('http', help='requests/sec against one URL')
+    http.add_argument('--url', required=True)
+    http.add_argument('--concurrency', type=int, default=50)
+    http.add_argument('--duration', type=float, default=30)
+
+    sockets = modes.add_parser('sockets', help='concurrent Socket.IO connections held')
+    sockets.add_argument('--url', required=True)
+    sockets.add_argument('--connections', type=int, default=1000)
+    sockets.add_argument('--hold', type=float, default=30)
+    sockets.add_argument('--ramp', type=int, default=100, help='connections opened at a time')
+
+    args = parser.parse_args()
+    if args.mode == 'http':
+        asyncio.run(http_load(args.url, args.concurrency, args.duration))
+    else:
+        asyncio.run(socket_capacity(args.url, args.connections, args.hold, args.ramp))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Query Count Checks
+Requests the monolith's endpoints against a seeded SQLite database and pins the
+number of SQL statements each one issues, so a lazy load inside a serializer
+(one query per message, per room, ...) shows up as a failure instead of latency.
+
+Usage:
+    python benchmarks/query_counts.py [--rows 10000]
+
+Exits with status 1 if any endpoint exceeds its statement budget.
+"""
+
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+
+from query_plans import ROOT, load_app, seed
+
+# Endpoint -> maximum statements, including the session user lookup (served from
+# user_cache after the first request).
+# Budgets do not depend on the number of rows, which is the point.
+BUDGETS = {
+    '/api/rooms': 2,
+    '/api/rooms/1': 2,
+    '/api/rooms/1/messages': 2,
+    '/api/rooms/1/messages?limit=200': 2,
+    '/api/users': 2,
+    '/admin': 5,
+    '/profile': 2,
+}
+
+
+def count_statements(module, client, path):
+    """Number of SQL statements executed while serving one GET request"""
+    from sqlalchemy import event
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with module.app.app_context():
+        engine = module.db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = client.get(path)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    return response.status_code, len(statements)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10_000, help='messages seeded')
+    args = parser.parse_args()
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, 'chat_app.db')
+        cwd = os.getcwd()
+        os.chdir(workdir)  # the monolith creates static/uploads relative to the cwd
+        mono = load_app('monolith_app', os.path.join(ROOT, 'flask', 'app.py'), db_path)
+        assert mono.app.root_path == os.path.join(ROOT, 'flask'), mono.app.root_path  # templates
+
+        now = datetime.datetime.utcnow().isoformat(' ')
+        user_count, rooms = 200, 50
+        seed(db_path, 'users', ['username', 'email', 'password_hash', 'is_admin', 'created_at', 'last_seen'],
+             ((f'user-{i}', f'user-{i}@example.com', '-', i == 0, now, now) for i in range(user_count)))
+        seed(db_path, 'rooms', ['name', 'description', 'created_by', 'created_at', 'is_private'],
+             ((f'room-{i}', '', 1, now, 0) for i in range(rooms)))
+        seed(db_path, 'messages', ['content', 'user_id', 'room_id', 'timestamp', 'is_file'],
+             ((f'message {i}', i % user_count + 1, i % rooms + 1, now, 0) for i in range(args.rows)))
+
+        client = mono.app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = '1'  # log in as the default admin created by create_app()
+
+        for path, budget in BUDGETS.items():
+            status, statements = count_statements(mono, client, path)
+            ok = status == 200 and statements <= budget
+            failures += not ok
+            print(f"  [{'ok' if ok else 'FAIL'}] GET {path:<36} {statements:4d} statements "
+                  f"(budget {budget}, status {status})")
+        os.chdir(cwd)
+
+    if failures:
+        print(f"{failures} endpoints exceed their query budget")
+        sys.exit(1)
+    print("All endpoints within their query budget")
+
+
+if __name__ == '__main__':
+    main()
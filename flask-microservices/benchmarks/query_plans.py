@@ -0,0 +1,151 @@
+"""
+Query Plan Checks
+Seeds large SQLite databases for each service and asserts, via EXPLAIN QUERY
+PLAN, that every hot query is served by an index. Also reports query latency.
+
+Usage:
+    python benchmarks/query_plans.py [--rows 1000000]
+
+Exits with status 1 if any hot query scans a table or sorts in a temp b-tree.
+"""
+
+import argparse
+import datetime
+import importlib.util
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+
+def load_app(name, path, db_path):
+    """Import a service's app.py as a uniquely named module against db_path"""
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    sys.path.insert(0, os.path.dirname(path))
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    # Registered first so Flask(__name__) finds the module's directory (templates,
+    # static) instead of falling back to the current working directory
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    module.create_app()  # creates the tables
+    return module
+
+
+def seed(db_path, table, columns, rows):
+    """Bulk insert rows with plain sqlite3 (much faster than the ORM)"""
+    conn = sqlite3.connect(db_path)
+    placeholders = ', '.join('?' for _ in columns)
+    conn.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+    conn.commit()
+    conn.close()
+
+
+def uses_index(plan, rowid_scan=False):
+    """No full table scans and no sorting outside an index
+
+    rowid_scan allows a plain SCAN for queries ordered by primary key with a
+    LIMIT, which walk the table in rowid order and stop after LIMIT rows.
+    """
+    for detail in plan:
+        if detail.startswith('SCAN ') and 'USING' not in detail and not rowid_scan:
+            return False
+        if 'TEMP B-TREE' in detail:
+            return False
+    return True
+
+
+def check(module, label, query, rowid_scan=False):
+    """Print the plan and timing of one query; return whether it uses an index"""
+    db = module.db
+    with module.app.app_context():
+        sql = str(query().statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+        plan = [row[3] for row in db.session.execute(db.text(f'EXPLAIN QUERY PLAN {sql}'))]
+        started = time.perf_counter()
+        query().all()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+    ok = uses_index(plan, rowid_scan)
+    print(f"  [{'ok' if ok else 'FAIL'}] {label:<40} {elapsed_ms:8.2f} ms  {' | '.join(plan)}")
+    return ok
+
+
+def chat_service(workdir, rows):
+    db_path = os.path.join(workdir, 'chat.db')
+    chat = load_app('chat_app', os.path.join(ROOT, 'flask-microservices', 'chat-service', 'app.py'), db_path)
+    now = datetime.datetime.utcnow().isoformat(' ')
+    rooms = 1000
+    seed(db_path, 'rooms', ['name', 'description', 'created_by', 'created_at', 'is_private'],
+         ((f'room-{i}', '', 1, now, 0) for i in range(rooms)))
+    seed(db_path, 'messages', ['content', 'user_id', 'username', 'room_id', 'timestamp', 'is_file'],
+         ((f'message {i}', i % 5000, f'user-{i % 5000}', i % rooms + 1, now, 0) for i in range(rows)))
+
+    Message = chat.Message
+    return chat, [
+        ('newest messages in room', lambda: Message.query.filter_by(room_id=7)
+            .order_by(Message.id.desc()).limit(51)),
+        ('messages before_id', lambda: Message.query.filter_by(room_id=7)
+            .filter(Message.id < rows // 2).order_by(Message.id.desc()).limit(51)),
+        ('messages after_id (gap-fill)', lambda: Message.query.filter_by(room_id=7)
+            .filter(Message.id > rows // 2).order_by(Message.id.asc()).limit(51)),
+    ]
+
+
+def user_service(workdir, rows):
+    db_path = os.path.join(workdir, 'users.db')
+    users = load_app('user_app', os.path.join(ROOT, 'flask-microservices', 'user-service', 'app.py'), db_path)
+    seed(db_path, 'user_profiles', ['user_id', 'messages_sent', 'rooms_created'],
+         ((i, 0, 0) for i in range(rows // 10)))
+
+    UserProfile = users.UserProfile
+    return users, [
+        ('profile by user_id', lambda: UserProfile.query.filter_by(user_id=4242)),
+    ]
+
+
+def monolith(workdir, rows):
+    db_path = os.path.join(workdir, 'chat_app.db')
+    os.chdir(workdir)  # the monolith creates static/uploads relative to the cwd
+    mono = load_app('monolith_app', os.path.join(ROOT, 'flask', 'app.py'), db_path)
+    now = datetime.datetime.utcnow().isoformat(' ')
+    user_count, rooms = 5000, 1000
+    seed(db_path, 'users', ['username', 'email', 'password_hash', 'created_at', 'last_seen'],
+         ((f'user-{i}', f'user-{i}@example.com', '-', now, now) for i in range(user_count)))
+    seed(db_path, 'rooms', ['name', 'description', 'created_by', 'created_at', 'is_private'],
+         ((f'room-{i}', '', 1, now, 0) for i in range(rooms)))
+    seed(db_path, 'messages', ['content', 'user_id', 'room_id', 'timestamp', 'is_file'],
+         ((f'message {i}', i % user_count + 1, i % rooms + 1, now, 0) for i in range(rows)))
+
+    Message = mono.Message
+    return mono, [
+        ('newest messages in room', lambda: Message.query.filter_by(room_id=7)
+            .order_by(Message.id.desc()).limit(51)),
+        ('recent messages (admin)', lambda: Message.query.order_by(Message.id.desc()).limit(100), True),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000, help='messages seeded per database')
+    args = parser.parse_args()
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, setup in (('chat-service', chat_service), ('user-service', user_service),
+                            ('monolith', monolith)):
+            started = time.perf_counter()
+            module, queries = setup(workdir, args.rows)
+            print(f"{name} (seeded in {time.perf_counter() - started:.1f}s)")
+            failures += sum(not check(module, *query) for query in queries)
+
+    if failures:
+        print(f"{failures} hot queries do not use an index")
+        sys.exit(1)
+    print("All hot queries use an index")
+
+
+if __name__ == '__main__':
+    main()
@@ -8,19 +8,88 @@ from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_sqlalchemy import SQLAlchemy
 import datetime
 import os
-import requests
+from token_auth import TokenVerifier
+from presence import create_presence
+from stats_queue import StatsQueue
+from message_writer import MessageWriter
+from broadcast import create_client_manager, RoomBatcher
+from typing_state import TypingTracker
+import fast_json
+from fast_json import FastJSONProvider, FragmentCache, json_list, parse_fields, project
+from conditional import row_etag, validators, not_modified
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 
 # Configuration
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'chat-secret-key')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///chat.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['AUTH_SERVICE_URL'] = os.environ.get('AUTH_SERVICE_URL', 'http://localhost:5001')
+app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'auth-secret-key-change-in-production')
+app.config['JWT_ALGORITHM'] = os.environ.get('JWT_ALGORITHM', 'HS256')
+app.config['TOKEN_VERIFICATION'] = os.environ.get('TOKEN_VERIFICATION', 'local')  # 'local' or 'remote'
+app.config['TOKEN_CACHE_SIZE'] = int(os.environ.get('TOKEN_CACHE_SIZE', 10000))
+app.config['TOKEN_CACHE_TTL'] = int(os.environ.get('TOKEN_CACHE_TTL', 300))
+app.config['TOKEN_REVOCATION_INTERVAL'] = int(os.environ.get('TOKEN_REVOCATION_INTERVAL', 30))
 app.config['USER_SERVICE_URL'] = os.environ.get('USER_SERVICE_URL', 'http://localhost:5002')
 
+# 'threading' for the development server, 'eventlet' under gunicorn (see Dockerfile)
+app.config['SOCKETIO_ASYNC_MODE'] = os.environ.get('SOCKETIO_ASYNC_MODE', 'threading')
+# Pub/sub backend fanning emits out to every replica, e.g. redis://redis:6379/0
+app.config['SOCKETIO_MESSAGE_QUEUE'] = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+# Opt-in: send rooms one new_messages frame per BROADCAST_BATCH_WINDOW seconds
+app.config['BROADCAST_BATCHING'] = os.environ.get('BROADCAST_BATCHING', 'false').lower() == 'true'
+app.config['BROADCAST_BATCH_WINDOW'] = float(os.environ.get('BROADCAST_BATCH_WINDOW', 0.005))
+app.config['BROADCAST_BATCH_MAX'] = int(os.environ.get('BROADCAST_BATCH_MAX', 100))
+
+# Pagination
+app.config['PAGE_SIZE'] = int(os.environ.get('PAGE_SIZE', 100))
+app.config['MAX_PAGE_SIZE'] = int(os.environ.get('MAX_PAGE_SIZE', 500))
+app.config['MAX_MESSAGE_PAGE_SIZE'] = int(os.environ.get('MAX_MESSAGE_PAGE_SIZE', 200))
+
+# Message persistence - commit per message, or write-behind with group commit
+app.config['MESSAGE_WRITE_BEHIND'] = os.environ.get('MESSAGE_WRITE_BEHIND', 'false').lower() == 'true'
+app.config['MESSAGE_ACK'] = os.environ.get('MESSAGE_ACK', 'commit')  # 'commit' or 'journal'
+app.config['MESSAGE_GROUP_SIZE'] = int(os.environ.get('MESSAGE_GROUP_SIZE', 200))
+app.config['MESSAGE_GROUP_WINDOW'] = float(os.environ.get('MESSAGE_GROUP_WINDOW', 0.01))
+app.config['MESSAGE_JOURNAL_DIR'] = os.environ.get('MESSAGE_JOURNAL_DIR', 'journal')
+
+# User stats are batched and sent to user-service in the background
+app.config['USER_STATS_FLUSH_INTERVAL'] = float(os.environ.get('USER_STATS_FLUSH_INTERVAL', 1.0))
+app.config['USER_STATS_BATCH_SIZE'] = int(os.environ.get('USER_STATS_BATCH_SIZE', 500))
+
+# Presence - in-memory by default, shared across replicas with a redis:// URL
+app.config['PRESENCE_BACKEND_URL'] = os.environ.get('PRESENCE_BACKEND_URL')
+app.config['PRESENCE_TTL'] = int(os.environ.get('PRESENCE_TTL', 90))
+app.config['PRESENCE_SWEEP_INTERVAL'] = int(os.environ.get('PRESENCE_SWEEP_INTERVAL', 30))
+
+# Typing indicators - only start/stop transitions are broadcast
+app.config['TYPING_TIMEOUT'] = float(os.environ.get('TYPING_TIMEOUT', 5))
+app.config['TYPING_MIN_INTERVAL'] = float(os.environ.get('TYPING_MIN_INTERVAL', 1))
+
+# Serialized messages kept for history responses (0 disables)
+app.config['JSON_FRAGMENT_CACHE_SIZE'] = int(os.environ.get('JSON_FRAGMENT_CACHE_SIZE', 20000))
+
 db = SQLAlchemy(app)
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
+token_verifier = TokenVerifier(app)
+stats_queue = StatsQueue(app)
+presence = create_presence(app.config['PRESENCE_BACKEND_URL'], ttl=app.config['PRESENCE_TTL'])
+presence_sweeper = None
+typing_tracker = TypingTracker(
+    timeout=app.config['TYPING_TIMEOUT'],
+    min_interval=app.config['TYPING_MIN_INTERVAL']
+)
+typing_sweeper = None
+message_json = FragmentCache(app.config['JSON_FRAGMENT_CACHE_SIZE'])
+socketio = SocketIO(
+    app,
+    cors_allowed_origins="*",
+    async_mode=app.config['SOCKETIO_ASYNC_MODE'],
+    json=fast_json,
+    client_manager=create_client_manager(app.config['SOCKETIO_MESSAGE_QUEUE'])
+)
+room_batcher = RoomBatcher(socketio, app)
 
 # Models
 class Room(db.Model):
@@ -44,6 +113,10 @@ class Room(db.Model):
 
 class Message(db.Model):
     __tablename__ = 'messages'
+    __table_args__ = (
+        # Room history is paged by (room_id, id)
+        db.Index('ix_messages_room_id_id', 'room_id', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
     user_id = db.Column(db.Integer, nullable=False)
@@ -65,62 +138,96 @@ class Message(db.Model):
             'file_url': self.file_url
         }
 
-class OnlineUser(db.Model):
-    __tablename__ = 'online_users'
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, nullable=False)
-    username = db.Column(db.String(80), nullable=False)
-    room_id = db.Column(db.Integer, nullable=False)
-    sid = db.Column(db.String(100), nullable=False)
-    joined_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
-
-# Initialize database
-with app.app_context():
-    db.create_all()
-    # Create default room
-    if not Room.query.filter_by(name='General').first():
-        general_room = Room(name='General', description='General chat room', created_by=1)
-        db.session.add(general_room)
-        db.session.commit()
-        print("Default 'General' room created")
+message_writer = MessageWriter(db, Message, app)
+
+def init_database():
+    """Create tables, indexes and the default room"""
+    with app.app_context():
+        db.create_all()
+        # create_all() skips existing tables, so add indexes introduced since
+        for model in (Room, Message):
+            for index in model.__table__.indexes:
+                index.create(db.engine, checkfirst=True)
+        # Create default room
+        if not Room.query.filter_by(name='General').first():
+            general_room = Room(name='General', description='General chat room', created_by=1)
+            db.session.add(general_room)
+            db.session.commit()
+            print("Default 'General' room created")
+
+def create_app():
+    """App factory used by the production server (gunicorn.conf.py)"""
+    init_database()
+    # Replay messages journaled before a crash, then start the group-commit writer
+    if message_writer.enabled:
+        with app.app_context():
+            message_writer.start()
+    return app
 
 def verify_token(token):
-    """Verify token with auth service"""
-    try:
-        response = requests.post(
-            f"{app.config['AUTH_SERVICE_URL']}/verify",
-            json={'token': token},
-            timeout=5
-        )
-        if response.status_code == 200:
-            return response.json()
-        return None
-    except Exception as e:
-        print(f"Error verifying token: {e}")
-        return None
+    """Verify token locally (or with auth service in remote mode)"""
+    return token_verifier.verify(token)
 
 def update_user_stats(user_id, **stats):
-    """Update user statistics via user service"""
-    try:
-        requests.post(
-            f"{app.config['USER_SERVICE_URL']}/profiles/{user_id}/stats",
-            json=stats,
-            timeout=5
-        )
-    except Exception as e:
-        print(f"Error updating user stats: {e}")
+    """Queue a user statistics update for user service (sent in batches)"""
+    stats_queue.record(user_id, **stats)
+
+def paginate(query, key):
+    """Keyset pagination (?limit=N&after=<id>) ordered by primary key
+    
+    Returns the page and the cursor of the next page (None on the last page).
+    """
+    limit = request.args.get('limit', app.config['PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, app.config['MAX_PAGE_SIZE']))
+    after = request.args.get('after', type=int)
+    
+    if after is not None:
+        query = query.filter(key > after)
+    items = query.order_by(key).limit(limit + 1).all()
+    
+    if len(items) > limit:
+        items = items[:limit]
+        return items, str(items[-1].id)
+    return items, None
+
+def page_headers(next_cursor):
+    """Response headers advertising the next page cursor"""
+    return {'X-Next-Cursor': next_cursor} if next_cursor else {}
 
 # HTTP Routes
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
-    return jsonify({'status': 'healthy', 'service': 'chat-service'}), 200
+    return jsonify({
+        'status': 'healthy',
+        'service': 'chat-service',
+        'token_cache': token_verifier.stats(),
+        'user_stats': stats_queue.stats(),
+        'typing': typing_tracker.stats(),
+        'broadcast_batching': room_batcher.stats() if room_batcher.enabled else None,
+        'message_json_cache': message_json.stats(),
+        'messages': message_writer.stats() if message_writer.enabled else {'mode': 'commit per message'}
+    }), 200
 
 @app.route('/rooms', methods=['GET'])
 def get_rooms():
-    """Get all rooms"""
-    rooms = Room.query.all()
-    return jsonify([room.to_dict() for room in rooms]), 200
+    """Get all rooms (paginated)
+    
+    Rooms never change once created, so a page's version is the rooms on it.
+    """
+    rooms, next_cursor = paginate(Room.query, Room.id)
+    etag = row_etag([(room.id, room.created_at) for room in rooms], next_cursor)
+    headers = {**page_headers(next_cursor), **validators(etag)}
+    
+    if not_modified(etag):
+        return '', 304, headers
+    return jsonify([room.to_dict() for room in rooms]), 200, headers
+
+@app.route('/rooms/count', methods=['GET'])
+def count_rooms():
+    """Get the number of rooms"""
+    count = db.session.query(db.func.count(Room.id)).scalar()
+    return jsonify({'count': count}), 200, {'X-Total-Count': str(count)}
 
 @app.route('/rooms', methods=['POST'])
 def create_room():
@@ -163,31 +270,107 @@ def get_room(room_id):
     if not room:
         return jsonify({'error': 'Room not found'}), 404
     
-    return jsonify(room.to_dict()), 200
+    etag = row_etag(room.id, room.created_at)
+    headers = validators(etag, room.created_at)
+    
+    if not_modified(etag, room.created_at):
+        return '', 304, headers
+    return jsonify(room.to_dict()), 200, headers
 
 @app.route('/rooms/<int:room_id>/messages', methods=['GET'])
 def get_messages(room_id):
-    """Get messages for a room"""
+    """Get messages for a room
+    
+    Without cursors the newest `limit` messages are returned. `before_id`
+    pages back through history; `after_id` returns only messages newer than
+    the given id (gap-fill for reconnecting clients), including write-behind
+    messages that were broadcast but are not committed yet. Messages are always
+    returned oldest first; X-Next-Cursor holds the id to pass as the same
+    parameter for the next page. `fields=id,content,username` returns only
+    those fields of each message.
+    """
+    try:
+        fields = parse_fields(request.args.get('fields'), Message.__table__.columns.keys())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
     limit = request.args.get('limit', 50, type=int)
-    messages = Message.query.filter_by(room_id=room_id).order_by(Message.timestamp.desc()).limit(limit).all()
-    messages.reverse()
+    limit = max(1, min(limit, app.config['MAX_MESSAGE_PAGE_SIZE']))
+    before_id = request.args.get('before_id', type=int)
+    after_id = request.args.get('after_id', type=int)
+    
+    query = Message.query.filter_by(room_id=room_id)
+    if after_id is not None:
+        pending = message_writer.pending(room_id, after_id) if message_writer.enabled else []
+        messages = query.filter(Message.id > after_id).order_by(Message.id.asc()).limit(limit + 1).all()
+        if pending:
+            stored = {msg.id for msg in messages}
+            messages = sorted(messages + [msg for msg in pending if msg.id not in stored],
+                              key=lambda msg: msg.id)[:limit + 1]
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        next_cursor = messages[-1].id if has_more else None
+    else:
+        if before_id is not None:
+            query = query.filter(Message.id < before_id)
+        messages = query.order_by(Message.id.desc()).limit(limit + 1).all()
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        messages.reverse()
+        next_cursor = messages[0].id if has_more else None
     
-    return jsonify([msg.to_dict() for msg in messages]), 200
+    # Messages never change once stored, so each one is serialized only once (per projection)
+    body = json_list([message_json.get((msg.id, fields), lambda msg=msg: project(msg.to_dict(), fields))
+                      for msg in messages])
+    return app.response_class(body, mimetype='application/json'), 200, page_headers(next_cursor and str(next_cursor))
 
 @app.route('/rooms/<int:room_id>/online', methods=['GET'])
 def get_online_users(room_id):
     """Get online users in a room"""
-    users = OnlineUser.query.filter_by(room_id=room_id).all()
-    return jsonify([{
-        'user_id': u.user_id,
-        'username': u.username,
-        'joined_at': u.joined_at.isoformat()
-    } for u in users]), 200
+    return jsonify(presence.members(room_id)), 200
+
+def broadcast_presence(room_id, joined=(), left=()):
+    """Send a room only the presence changes instead of the full list"""
+    socketio.emit('presence_diff', {
+        'room_id': room_id,
+        'joined': list(joined),
+        'left': list(left)
+    }, room=str(room_id))
+
+def sweep_presence():
+    """Expire sessions that stopped sending heartbeats"""
+    while True:
+        socketio.sleep(app.config['PRESENCE_SWEEP_INTERVAL'])
+        for room_id, user in presence.expire():
+            socketio.emit('user_left', {
+                'message': f"{user['username']} disconnected"
+            }, room=str(room_id))
+            broadcast_presence(room_id, left=[user])
+
+def broadcast_typing(room_id, user, is_typing, skip_sid=None):
+    """Tell a room that a user started or stopped typing"""
+    socketio.emit('user_typing', {
+        'username': user['username'],
+        'is_typing': is_typing
+    }, room=str(room_id), skip_sid=skip_sid)
+
+def sweep_typing():
+    """Auto-stop typing indicators of users who went quiet"""
+    while True:
+        socketio.sleep(1)
+        for room_id, user in typing_tracker.expire():
+            broadcast_typing(room_id, user, False)
 
 # WebSocket Events
 @socketio.on('connect')
 def handle_connect():
     """Handle WebSocket connection"""
+    global presence_sweeper, typing_sweeper
+    if presence_sweeper is None:
+        presence_sweeper = socketio.start_background_task(sweep_presence)
+    if typing_sweeper is None:
+        typing_sweeper = socketio.start_background_task(sweep_typing)
+    
     print(f'Client connected: {request.sid}')
     emit('connected', {'message': 'Connected to chat service'})
 
@@ -207,28 +390,24 @@ def handle_join(data):
     # Add to room
     join_room(str(room_id))
     
-    # Track online user
-    online_user = OnlineUser(
-        user_id=user['user_id'],
-        username=user['username'],
-        room_id=room_id,
-        sid=request.sid
-    )
-    db.session.add(online_user)
-    db.session.commit()
-    
-    # Notify room
-    emit('user_joined', {
+    # Track presence
+    member = {
         'user_id': user['user_id'],
         'username': user['username'],
-        'message': f"{user['username']} joined the room"
-    }, room=str(room_id))
+        'joined_at': datetime.datetime.utcnow().isoformat()
+    }
+    newly_present = presence.join(room_id, request.sid, user['user_id'], member)
     
-    # Send online users list
-    users = OnlineUser.query.filter_by(room_id=room_id).all()
-    emit('online_users', {
-        'users': [{'user_id': u.user_id, 'username': u.username} for u in users]
-    }, room=str(room_id))
+    # Send the joining client the full online list; everyone else gets a diff
+    emit('online_users', {'users': presence.members(room_id)})
+    
+    if newly_present:
+        emit('user_joined', {
+            'user_id': user['user_id'],
+            'username': user['username'],
+            'message': f"{user['username']} joined the room"
+        }, room=str(room_id))
+        broadcast_presence(room_id, joined=[member])
 
 @socketio.on('leave')
 def handle_leave(data):
@@ -236,26 +415,31 @@ def handle_leave(data):
     room_id = data.get('room_id')
     
     # Remove from tracking
-    online_user = OnlineUser.query.filter_by(sid=request.sid, room_id=room_id).first()
-    if online_user:
-        username = online_user.username
-        db.session.delete(online_user)
-        db.session.commit()
-        
-        leave_room(str(room_id))
-        
-        # Notify room
+    user = presence.leave(room_id, request.sid)
+    leave_room(str(room_id))
+    typist = typing_tracker.stop(room_id, request.sid)
+    if typist:
+        broadcast_typing(room_id, typist, False)
+    
+    # Notify room once the user's last session has left
+    if user:
         emit('user_left', {
-            'message': f"{username} left the room"
+            'message': f"{user['username']} left the room"
         }, room=str(room_id))
+        broadcast_presence(room_id, left=[user])
 
 @socketio.on('message')
 def handle_message(data):
     """Handle sending a message"""
-    room_id = data.get('room_id')
     content = data.get('content')
     token = data.get('token')
-    
+    # One type for the stored row, the broadcast room and after_id gap-fill
+    try:
+        room_id = int(data.get('room_id'))
+    except (TypeError, ValueError):
+        emit('error', {'message': 'Invalid room_id'})
+        return
+
     user_data = verify_token(token)
     if not user_data or not user_data.get('valid'):
         emit('error', {'message': 'Invalid token'})
@@ -263,50 +447,76 @@ def handle_message(data):
     
     user = user_data['user']
     
-    # Save message
-    message = Message(
+    fields = dict(
         content=content,
         user_id=user['user_id'],
         username=user['username'],
-        room_id=room_id
+        room_id=room_id,
+        is_file=False,
+        file_url=None
     )
-    db.session.add(message)
-    db.session.commit()
+    
+    # Save message
+    if message_writer.enabled:
+        # Id assigned now; the background writer commits it with its group
+        message, ack = message_writer.create(**fields)
+    else:
+        message = Message(**fields)
+        db.session.add(message)
+        db.session.commit()
+        ack = None
     
     # Update user stats
     update_user_stats(user['user_id'], messages_sent=1, last_seen=True)
     
-    # Broadcast message
-    emit('new_message', message.to_dict(), room=str(room_id))
+    # Broadcast message; sending ends the sender's typing indicator
+    if room_batcher.enabled:
+        room_batcher.add(room_id, message.to_dict())
+    else:
+        emit('new_message', message.to_dict(), room=str(room_id))
+    typist = typing_tracker.stop(room_id, request.sid)
+    if typist:
+        broadcast_typing(room_id, typist, False, skip_sid=request.sid)
+    
+    # Acknowledge to the sender once the message is journaled or committed (MESSAGE_ACK)
+    if ack:
+        ack()
+    return {'id': message.id}
 
 @socketio.on('typing')
 def handle_typing(data):
-    """Handle typing indicator"""
+    """Handle typing indicator
+    
+    Clients send an event per keystroke; the room only hears when a user
+    starts or stops typing (see TypingTracker).
+    """
     room_id = data.get('room_id')
-    username = data.get('username')
-    is_typing = data.get('is_typing', False)
+    user = {'username': data.get('username')}
+    is_typing = bool(data.get('is_typing', False))
     
-    emit('user_typing', {
-        'username': username,
-        'is_typing': is_typing
-    }, room=str(room_id), include_self=False)
+    if typing_tracker.update(room_id, request.sid, user, is_typing):
+        broadcast_typing(room_id, user, is_typing, skip_sid=request.sid)
+
+@socketio.on('heartbeat')
+def handle_heartbeat(data=None):
+    """Keep the session's presence alive"""
+    presence.heartbeat(request.sid)
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle WebSocket disconnection"""
+    for room_id, user in typing_tracker.clear(request.sid):
+        broadcast_typing(room_id, user, False)
+    
     # Remove from all rooms
-    online_users = OnlineUser.query.filter_by(sid=request.sid).all()
-    for online_user in online_users:
-        room_id = online_user.room_id
-        username = online_user.username
-        db.session.delete(online_user)
-        
+    for room_id, user in presence.disconnect(request.sid):
         emit('user_left', {
-            'message': f"{username} disconnected"
+            'message': f"{user['username']} disconnected"
         }, room=str(room_id))
+        broadcast_presence(room_id, left=[user])
     
-    db.session.commit()
     print(f'Client disconnected: {request.sid}')
 
 if __name__ == '__main__':
-    socketio.run(app, host='0.0.0.0', port=5003, debug=False, allow_unsafe_werkzeug=True)
+    # Development server; production runs gunicorn with gunicorn.conf.py
+    socketio.run(create_app(), host='0.0.0.0', port=5003, debug=False, allow_unsafe_werkzeug=True)
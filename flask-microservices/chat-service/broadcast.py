@@ -0,0 +1,143 @@
+"""
+Room Broadcasts
+Socket.IO client managers that fan room emits out to every chat-service
+replica, and batching of message broadcasts for busy rooms
+"""
+
+import threading
+
+import socketio
+from socketio import packet
+
+# Shared by every FakeRedisManager in the process
+_fake_server = None
+
+
+class FakeRedisManager(socketio.RedisManager):
+    """RedisManager backed by an in-process fakeredis server
+
+    All managers in one process share the same fake server, so Socket.IO
+    servers started side by side (tests, local development) exchange
+    broadcasts exactly as replicas do through Redis. Needs `fakeredis`.
+    """
+
+    name = 'fakeredis'
+
+    def _redis_connect(self):
+        global _fake_server
+        import fakeredis
+        if _fake_server is None:
+            _fake_server = fakeredis.FakeServer()
+        self.redis = fakeredis.FakeRedis(server=_fake_server)
+        self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+
+
+def create_client_manager(url=None, channel='chat-service'):
+    """Client manager for SOCKETIO_MESSAGE_QUEUE
+
+    None (single replica) keeps Socket.IO's in-memory manager. redis:// and
+    rediss:// publish every emit on a Redis channel all replicas listen to,
+    fakeredis:// does the same in-process, and any other URL (amqp://, ...)
+    goes through kombu.
+    """
+    if not url:
+        return None
+    if url.startswith('fakeredis://'):
+        return FakeRedisManager(url, channel=channel)
+    if url.startswith(('redis://', 'rediss://')):
+        return socketio.RedisManager(url, channel=channel)
+    return socketio.KombuManager(url, channel=channel)
+
+
+class RoomBatcher:
+    """Batches new_message broadcasts per room into new_messages frames
+
+    The first message queued for a room schedules a flush BROADCAST_BATCH_WINDOW
+    seconds later (or right away once BROADCAST_BATCH_MAX messages are queued);
+    the flush sends the room one `new_messages` frame, {"room_id", "messages"}.
+
+    Socket.IO encodes a packet once per recipient, so with the in-memory
+    client manager the frame is encoded once here and the same bytes are sent
+    to every participant. With a message queue the batch goes through a normal
+    emit, so other replicas deliver it to their clients.
+    """
+
+    def __init__(self, socketio_ext, app=None):
+        self.socketio = socketio_ext
+        self.app = None
+        self.messages = 0
+        self.frames = 0
+        self.deliveries = 0
+        self._pending = {}      # room -> [message payloads]
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('BROADCAST_BATCHING', False)
+        app.config.setdefault('BROADCAST_BATCH_WINDOW', 0.005)
+        app.config.setdefault('BROADCAST_BATCH_MAX', 100)
+
+    @property
+    def enabled(self):
+        return self.app.config['BROADCAST_BATCHING']
+
+    def add(self, room, payload):
+        """Queue a message payload for the room's next batch frame"""
+        room = str(room)
+        with self._lock:
+            self.messages += 1
+            batch = self._pending.setdefault(room, [])
+            batch.append(payload)
+            size = len(batch)
+
+        if size >= self.app.config['BROADCAST_BATCH_MAX']:
+            self.flush(room)
+        elif size == 1:
+            self.socketio.start_background_task(self._flush_later, room)
+
+    def flush(self, room):
+        """Send everything queued for a room as one frame"""
+        with self._lock:
+            messages = self._pending.pop(room, None)
+        if not messages:
+            return
+        batch = {'room_id': room, 'messages': messages}
+
+        server = self.socketio.server
+        if isinstance(server.manager, socketio.PubSubManager):
+            self.socketio.emit('new_messages', batch, room=room)
+            with self._lock:
+                self.frames += 1
+            return
+
+        encoded = server.packet_class(packet.EVENT, namespace='/', data=['new_messages', batch]).encode()
+        delivered = 0
+        participants = server.manager.get_participants('/', room) if '/' in server.manager.rooms else ()
+        for _, eio_sid in participants:
+            server.eio.send(eio_sid, encoded)
+            delivered += 1
+        with self._lock:
+            self.frames += 1
+            self.deliveries += delivered
+
+    def flush_all(self):
+        with self._lock:
+            rooms = list(self._pending)
+        for room in rooms:
+            self.flush(room)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'messages': self.messages,
+                'frames': self.frames,
+                'messages_per_frame': round(self.messages / self.frames, 2) if self.frames else None,
+                'deliveries': self.deliveries,
+                'pending_rooms': len(self._pending)
+            }
+
+    def _flush_later(self, room):
+        self.socketio.sleep(self.app.config['BROADCAST_BATCH_WINDOW'])
+        self.flush(room)
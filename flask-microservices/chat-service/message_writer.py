@@ -0,0 +1,278 @@
+"""
+Write-Behind Message Persistence
+Assigns message ids up front, journals messages to local disk and commits them
+to the database in groups from a background writer
+"""
+
+from collections import deque
+import datetime
+import json
+import os
+import threading
+import time
+
+
+class MessageJournal:
+    """Append-only JSON-lines journal split into numbered segment files
+
+    write() appends a record and sync() waits until it is fsynced. Concurrent
+    writers share fsyncs: a record already covered by another thread's fsync
+    returns without calling it again. A segment is deleted once it is
+    closed and every message in it has been committed.
+    """
+
+    def __init__(self, directory, segment_bytes=4 * 1024 * 1024, fsync=True):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self._segment = None
+        self._file = None
+        self._pending = {}          # segment -> messages not committed yet
+        self._written = 0           # sequence number of the last written record
+        self._synced = 0            # sequence number covered by the last fsync
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def segments(self):
+        """Existing segment numbers, oldest first"""
+        return sorted(int(name.split('.')[0]) for name in os.listdir(self.directory)
+                      if name.endswith('.journal'))
+
+    def path(self, segment):
+        return os.path.join(self.directory, f'{segment:010d}.journal')
+
+    def read(self):
+        """Every record in the journal, in append order"""
+        records = []
+        for segment in self.segments():
+            with open(self.path(segment)) as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        break  # torn write at the end of a segment
+        return records
+
+    def reset(self):
+        """Delete every segment (after recovery committed them) and start a new one"""
+        with self._lock:
+            existing = self.segments()
+            for segment in existing:
+                os.remove(self.path(segment))
+            self._open((existing[-1] + 1) if existing else 1)
+
+    def write(self, record):
+        """Append one record; returns (segment, sequence) to pass to sync()"""
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self._lock:
+            if self._file.tell() >= self.segment_bytes:
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+                self._file.close()
+                self._open(self._segment + 1)
+            self._file.write(line)
+            self._file.flush()
+            self._written += 1
+            self._pending[self._segment] = self._pending.get(self._segment, 0) + 1
+            return self._segment, self._written
+
+    def sync(self, sequence):
+        """Return once the record with this sequence number is on disk"""
+        if not self.fsync:
+            return
+        with self._sync_lock:
+            if self._synced >= sequence:
+                return
+            with self._lock:
+                target = self._written
+                # A duplicate stays valid if another writer rotates the segment meanwhile
+                fd = os.dup(self._file.fileno())
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            self._synced = target
+
+    def committed(self, segments):
+        """Mark messages committed; delete closed segments with nothing pending"""
+        with self._lock:
+            for segment in segments:
+                self._pending[segment] -= 1
+            for segment in [s for s, count in self._pending.items() if count == 0 and s != self._segment]:
+                del self._pending[segment]
+                os.remove(self.path(segment))
+
+    def _open(self, segment):
+        self._segment = segment
+        self._file = open(self.path(segment), 'a')
+
+
+class MessageWriter:
+    """Write-behind persistence for chat messages
+
+    create() assigns the next message id and timestamp, appends the message to
+    the journal and queues it; the caller can broadcast straight away. A
+    background writer inserts queued messages in groups of up to
+    MESSAGE_GROUP_SIZE, waiting at most MESSAGE_GROUP_WINDOW seconds to fill a
+    group, with one transaction per group. Groups are committed in id order,
+    so the committed messages are always a prefix of the assigned ids and
+    after_id gap-fill never skips a message.
+
+    MESSAGE_ACK chooses what the sender's ack waits for: 'journal' until the
+    message is fsynced to the journal, 'commit' until its group is committed. On startup
+    messages left in the journal by a crash are inserted before new ids are
+    assigned. Ids come from an in-process counter, so each database must have
+    a single chat-service writer (as with the per-pod SQLite databases).
+    """
+
+    def __init__(self, db, model, app=None):
+        self.db = db
+        self.model = model
+        self.app = None
+        self.journal = None
+        self.engine = None
+        self.recovered = 0
+        self.committed = 0
+        self.groups = 0
+        self.failures = 0
+        self._next_id = None
+        self._queue = deque()
+        self._writing = []          # the group being committed
+        self._thread = None
+        self._condition = threading.Condition()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('MESSAGE_WRITE_BEHIND', False)
+        app.config.setdefault('MESSAGE_ACK', 'commit')
+        app.config.setdefault('MESSAGE_GROUP_SIZE', 200)
+        app.config.setdefault('MESSAGE_GROUP_WINDOW', 0.01)
+        app.config.setdefault('MESSAGE_JOURNAL_DIR', 'journal')
+        app.config.setdefault('MESSAGE_JOURNAL_SEGMENT_BYTES', 4 * 1024 * 1024)
+        app.config.setdefault('MESSAGE_JOURNAL_FSYNC', True)
+
+    @property
+    def enabled(self):
+        return self.app.config['MESSAGE_WRITE_BEHIND']
+
+    def start(self):
+        """Replay the journal and start the writer; call in an app context after create_all()"""
+        self.engine = self.db.engine
+        self.journal = MessageJournal(
+            self.app.config['MESSAGE_JOURNAL_DIR'],
+            segment_bytes=self.app.config['MESSAGE_JOURNAL_SEGMENT_BYTES'],
+            fsync=self.app.config['MESSAGE_JOURNAL_FSYNC']
+        )
+        self._recover()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def create(self, **fields):
+        """Assign an id, journal and queue a message
+
+        Returns the unsaved model instance, ready to broadcast, and an ack()
+        callable that blocks until the message is journaled or committed,
+        depending on MESSAGE_ACK.
+        """
+        committed = threading.Event() if self.app.config['MESSAGE_ACK'] == 'commit' else None
+        with self._condition:
+            row = dict(fields, id=self._next_id, timestamp=datetime.datetime.utcnow())
+            self._next_id += 1
+            # Writing under the queue lock keeps journal order equal to id order
+            segment, sequence = self.journal.write(dict(row, timestamp=row['timestamp'].isoformat()))
+            self._queue.append((row, segment, committed))
+            self._condition.notify()
+
+        def ack():
+            self.journal.sync(sequence)
+            if committed is not None:
+                committed.wait()
+
+        return self.model(**row), ack
+
+    def pending(self, room_id, after_id):
+        """Uncommitted messages of a room with ids above after_id, oldest first
+
+        Take this before querying the database: a group committed in between
+        then shows up in both (callers drop duplicate ids) rather than in neither.
+        """
+        with self._condition:
+            rows = [row for row, _, _ in list(self._writing) + list(self._queue)
+                    if row['room_id'] == room_id and row['id'] > after_id]
+        return [self.model(**row) for row in rows]
+
+    def stats(self):
+        with self._condition:
+            return {
+                'mode': f"write-behind (ack after {self.app.config['MESSAGE_ACK']})",
+                'queued': len(self._queue),
+                'committed': self.committed,
+                'groups': self.groups,
+                'failures': self.failures,
+                'recovered': self.recovered
+            }
+
+    def _recover(self):
+        table = self.model.__table__
+        records = self.journal.read()
+        with self.engine.begin() as conn:
+            if records:
+                ids = [record['id'] for record in records]
+                existing = set()
+                for start in range(0, len(ids), 500):
+                    chunk = ids[start:start + 500]
+                    existing.update(conn.execute(
+                        self.db.select(table.c.id).where(table.c.id.in_(chunk))
+                    ).scalars())
+                missing = [dict(record, timestamp=datetime.datetime.fromisoformat(record['timestamp']))
+                           for record in records if record['id'] not in existing]
+                if missing:
+                    conn.execute(table.insert(), missing)
+                self.recovered = len(missing)
+            max_id = conn.execute(self.db.select(self.db.func.max(table.c.id))).scalar()
+
+        self.journal.reset()
+        self._next_id = (max_id or 0) + 1
+
+    def _take_group(self):
+        """Wait for queued messages and return up to one group of them"""
+        size = self.app.config['MESSAGE_GROUP_SIZE']
+        with self._condition:
+            while not self._queue:
+                self._condition.wait()
+            deadline = time.monotonic() + self.app.config['MESSAGE_GROUP_WINDOW']
+            while len(self._queue) < size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            self._writing = [self._queue.popleft() for _ in range(min(size, len(self._queue)))]
+            return self._writing
+
+    def _run(self):
+        table = self.model.__table__
+        while True:
+            group = self._take_group()
+            while True:
+                try:
+                    with self.engine.begin() as conn:
+                        conn.execute(table.insert(), [row for row, _, _ in group])
+                    break
+                except Exception as e:
+                    # Keep the group (it is still journaled) and retry in order
+                    print(f"Error committing message group: {e}")
+                    with self._condition:
+                        self.failures += 1
+                    time.sleep(1)
+
+            self.journal.committed([segment for _, segment, _ in group])
+            with self._condition:
+                self.committed += len(group)
+                self.groups += 1
+                self._writing = []
+            for _, _, committed in group:
+                if committed is not None:
+                    committed.set()
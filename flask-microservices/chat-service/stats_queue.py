@@ -0,0 +1,137 @@
+"""
+User Stats Queue
+Batches user statistics updates for user-service off the message path
+"""
+
+import datetime
+import threading
+import time
+
+import requests
+
+
+class StatsQueue:
+    """In-process queue of user stats increments drained by a background worker
+
+    record() only merges the increment into the pending batch, so sending a
+    message never waits on user-service. Every USER_STATS_FLUSH_INTERVAL
+    seconds the worker coalesces increments per user and posts them to
+    user-service /profiles/stats:batch in chunks of USER_STATS_BATCH_SIZE.
+    Deltas of a failed flush are merged back and retried on the next round;
+    once USER_STATS_MAX_PENDING users are pending, new users are dropped.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.recorded = 0
+        self.sent = 0
+        self.batches = 0
+        self.failures = 0
+        self.dropped = 0
+        self._pending = {}      # user_id -> delta
+        self._thread = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('USER_STATS_FLUSH_INTERVAL', 1.0)
+        app.config.setdefault('USER_STATS_BATCH_SIZE', 500)
+        app.config.setdefault('USER_STATS_MAX_PENDING', 100000)
+
+    def record(self, user_id, messages_sent=0, rooms_created=0, last_seen=False):
+        """Queue an increment for a user; returns immediately"""
+        self._start_worker()
+        seen = datetime.datetime.utcnow().isoformat() if last_seen else None
+        with self._lock:
+            self.recorded += 1
+            if not self._merge(user_id, messages_sent, rooms_created, seen):
+                self.dropped += 1
+
+    def flush(self):
+        """Send everything pending now; returns the number of deltas sent"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        deltas = list(pending.values())
+        size = self.app.config['USER_STATS_BATCH_SIZE']
+        sent = 0
+        for start in range(0, len(deltas), size):
+            chunk = deltas[start:start + size]
+            if self._send(chunk):
+                sent += len(chunk)
+            else:
+                # Keep the increments for the next round
+                with self._lock:
+                    for delta in chunk:
+                        if not self._merge(delta['user_id'], delta['messages_sent'],
+                                           delta['rooms_created'], delta['last_seen']):
+                            self.dropped += 1
+        return sent
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending_users': len(self._pending),
+                'recorded': self.recorded,
+                'sent': self.sent,
+                'batches': self.batches,
+                'failures': self.failures,
+                'dropped': self.dropped
+            }
+
+    def _merge(self, user_id, messages_sent, rooms_created, last_seen):
+        """Add to a user's pending delta (caller holds the lock)"""
+        delta = self._pending.get(user_id)
+        if delta is None:
+            if len(self._pending) >= self.app.config['USER_STATS_MAX_PENDING']:
+                return False
+            delta = self._pending[user_id] = {
+                'user_id': user_id,
+                'messages_sent': 0,
+                'rooms_created': 0,
+                'last_seen': None
+            }
+        delta['messages_sent'] += messages_sent
+        delta['rooms_created'] += rooms_created
+        if last_seen and (delta['last_seen'] is None or last_seen > delta['last_seen']):
+            delta['last_seen'] = last_seen
+        return True
+
+    def _send(self, deltas):
+        try:
+            response = requests.post(
+                f"{self.app.config['USER_SERVICE_URL']}/profiles/stats:batch",
+                json={'deltas': deltas},
+                timeout=5
+            )
+            response.raise_for_status()
+        except Exception as e:
+            print(f"Error sending user stats batch: {e}")
+            with self._lock:
+                self.failures += 1
+            return False
+
+        with self._lock:
+            self.sent += len(deltas)
+            self.batches += 1
+        return True
+
+    def _start_worker(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.app.config['USER_STATS_FLUSH_INTERVAL'])
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing user stats: {e}")
@@ -0,0 +1,276 @@
+"""
+Token Verification
+Verifies JWT tokens issued by auth-service locally instead of calling /verify
+"""
+
+from collections import OrderedDict
+import hashlib
+import threading
+import time
+
+import jwt
+import requests
+
+
+def token_digest(token):
+    """Digest used to identify a token (matches auth-service revocations)"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class TokenCache:
+    """Bounded LRU cache of verified tokens with per-entry expiry"""
+
+    def __init__(self, max_size=10000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest):
+        """Return the cached verification result, or None if missing/expired"""
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._entries[digest]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return value
+
+    def set(self, digest, value, exp=None):
+        """Cache a result for the configured TTL, capped at the token's exp"""
+        expires_at = time.time() + self.ttl
+        if exp is not None:
+            expires_at = min(expires_at, exp)
+        if self.max_size <= 0 or expires_at <= time.time():
+            return
+
+        with self._lock:
+            self._entries[digest] = (expires_at, value)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, digest):
+        with self._lock:
+            self._entries.pop(digest, None)
+
+    def discard_users(self, user_ids):
+        """Drop every cached token belonging to the given users"""
+        with self._lock:
+            stale = [
+                digest for digest, (_, value) in self._entries.items()
+                if value['user']['user_id'] in user_ids
+            ]
+            for digest in stale:
+                del self._entries[digest]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+class TokenVerifier:
+    """Verify auth-service JWT tokens
+
+    In 'local' mode the signature and expiry are checked in-process, using the
+    shared secret for HS* algorithms or the public keys published on
+    auth-service /keys for asymmetric ones. In 'remote' mode every token is
+    sent to auth-service /verify, as before.
+
+    Verified tokens are kept in a TokenCache in both modes. Revocations
+    (logout and per-user bans) are pulled from auth-service /revocations
+    every TOKEN_REVOCATION_INTERVAL seconds, which bounds how long a revoked
+    token can still be accepted.
+    """
+
+    # Minimum seconds between /keys refreshes triggered by an unknown key id
+    KEY_REFRESH_INTERVAL = 60
+
+    def __init__(self, app=None):
+        self.app = None
+        self.cache = None
+        self._public_keys = {}
+        self._keys_fetched_at = None
+        self._revoked_tokens = set()
+        self._revoked_users = {}
+        self._revocations_thread = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('JWT_ALGORITHM', 'HS256')
+        app.config.setdefault('TOKEN_VERIFICATION', 'local')
+        app.config.setdefault('TOKEN_CACHE_SIZE', 10000)
+        app.config.setdefault('TOKEN_CACHE_TTL', 300)
+        app.config.setdefault('TOKEN_REVOCATION_INTERVAL', 30)
+        self.cache = TokenCache(app.config['TOKEN_CACHE_SIZE'], app.config['TOKEN_CACHE_TTL'])
+
+    def verify(self, token):
+        """Verify a token, returning the auth-service /verify payload or None"""
+        if not token:
+            return None
+        self._start_revocation_polling()
+
+        digest = token_digest(token)
+        if digest in self._revoked_tokens:
+            return None
+
+        result = self.cache.get(digest)
+        if result is not None:
+            return result
+
+        if self.app.config['TOKEN_VERIFICATION'] == 'remote':
+            result = self.verify_remote(token)
+        else:
+            result = self.verify_local(token)
+
+        if not result or not result.get('valid') or self._user_revoked(result):
+            return None
+
+        self.cache.set(digest, result, result.get('exp'))
+        return result
+
+    def verify_local(self, token):
+        """Verify signature and expiry without contacting auth-service"""
+        algorithm = self.app.config['JWT_ALGORITHM']
+        try:
+            if algorithm.startswith('HS'):
+                key = self.app.config['JWT_SECRET_KEY']
+            else:
+                key = self._public_key(jwt.get_unverified_header(token).get('kid'))
+                if key is None:
+                    return None
+            payload = jwt.decode(token, key, algorithms=[algorithm], options={'require': ['exp']})
+        except jwt.InvalidTokenError:
+            return None
+
+        if 'user_id' not in payload or 'username' not in payload:
+            return None
+
+        return {
+            'valid': True,
+            'user': {
+                'user_id': payload['user_id'],
+                'username': payload['username'],
+                'is_admin': payload.get('is_admin', False)
+            },
+            'iat': payload.get('iat', 0),
+            'exp': payload['exp']
+        }
+
+    def verify_remote(self, token):
+        """Verify token with auth service"""
+        try:
+            response = requests.post(
+                f"{self.app.config['AUTH_SERVICE_URL']}/verify",
+                json={'token': token},
+                timeout=5
+            )
+            if response.status_code == 200:
+                return response.json()
+            return None
+        except Exception as e:
+            print(f"Error verifying token: {e}")
+            return None
+
+    def refresh_revocations(self):
+        """Pull the current revocation list from auth-service"""
+        try:
+            response = requests.get(f"{self.app.config['AUTH_SERVICE_URL']}/revocations", timeout=5)
+            if response.status_code != 200:
+                return False
+            data = response.json()
+        except Exception as e:
+            print(f"Error fetching revocations: {e}")
+            return False
+
+        revoked_tokens = set(data.get('tokens', []))
+        revoked_users = {int(user_id): revoked_at for user_id, revoked_at in data.get('users', {}).items()}
+        newly_revoked_users = {
+            user_id for user_id, revoked_at in revoked_users.items()
+            if self._revoked_users.get(user_id) != revoked_at
+        }
+
+        self._revoked_tokens = revoked_tokens
+        self._revoked_users = revoked_users
+        for digest in revoked_tokens:
+            self.cache.discard(digest)
+        if newly_revoked_users:
+            self.cache.discard_users(newly_revoked_users)
+        return True
+
+    def stats(self):
+        stats = self.cache.stats()
+        stats['revoked_tokens'] = len(self._revoked_tokens)
+        stats['revoked_users'] = len(self._revoked_users)
+        return stats
+
+    def _user_revoked(self, result):
+        """Check a verification result against per-user revocations"""
+        revoked_at = self._revoked_users.get(result['user']['user_id'])
+        # Remote results carry no iat; auth-service has already checked them
+        return revoked_at is not None and 'iat' in result and result['iat'] <= revoked_at
+
+    def _start_revocation_polling(self):
+        """Start the background revocation poller on first use"""
+        interval = self.app.config['TOKEN_REVOCATION_INTERVAL']
+        if self._revocations_thread is not None or not interval:
+            return
+        with self._lock:
+            if self._revocations_thread is not None:
+                return
+            self._revocations_thread = threading.Thread(
+                target=self._poll_revocations, args=(interval,), daemon=True
+            )
+            self._revocations_thread.start()
+
+    def _poll_revocations(self, interval):
+        while True:
+            self.refresh_revocations()
+            time.sleep(interval)
+
+    def _public_key(self, kid):
+        """Look up a public key by id, refreshing from auth-service when unknown"""
+        with self._lock:
+            key = self._public_keys.get(kid)
+            if key is not None:
+                return key
+            if (self._keys_fetched_at is not None
+                    and time.monotonic() - self._keys_fetched_at < self.KEY_REFRESH_INTERVAL):
+                return None
+            self._keys_fetched_at = time.monotonic()
+
+            try:
+                response = requests.get(f"{self.app.config['AUTH_SERVICE_URL']}/keys", timeout=5)
+                if response.status_code != 200:
+                    return None
+                self._public_keys = {
+                    k['kid']: k['public_key'] for k in response.json().get('keys', [])
+                }
+            except Exception as e:
+                print(f"Error fetching public keys: {e}")
+                return None
+
+            return self._public_keys.get(kid)
@@ -0,0 +1,98 @@
+"""
+Typing Indicators
+Turns keystroke-level typing events into start/stop transitions per user and room
+"""
+
+import threading
+import time
+
+
+class TypingTracker:
+    """Per-room typing state with coalescing, rate limiting and auto-stop
+
+    Clients send a typing event per keystroke; update() only reports the ones
+    that change state, so a room sees one "started" and one "stopped" per
+    burst of typing. A user can start typing at most once per `min_interval`
+    seconds (stops always go through, so no indicator is left on), and a user
+    who stops sending events is stopped by expire() after `timeout` seconds.
+    """
+
+    def __init__(self, timeout=5.0, min_interval=1.0):
+        self.timeout = timeout
+        self.min_interval = min_interval
+        self.received = 0
+        self.emitted = 0
+        self.coalesced = 0
+        self.rate_limited = 0
+        self.expired = 0
+        self._typing = {}       # (room_id, user_key) -> (deadline, user)
+        self._started = {}      # user_key -> time of the last emitted start
+        self._lock = threading.Lock()
+
+    def update(self, room_id, user_key, user, is_typing):
+        """Record a client event; True if it is a transition to broadcast"""
+        key = (str(room_id), user_key)
+        now = time.monotonic()
+        with self._lock:
+            self.received += 1
+            if is_typing:
+                if key in self._typing:
+                    self._typing[key] = (now + self.timeout, user)
+                    self.coalesced += 1
+                    return False
+                if now - self._started.get(user_key, float('-inf')) < self.min_interval:
+                    self.rate_limited += 1
+                    return False
+                self._typing[key] = (now + self.timeout, user)
+                self._started[user_key] = now
+            else:
+                if self._typing.pop(key, None) is None:
+                    self.coalesced += 1
+                    return False
+            self.emitted += 1
+            return True
+
+    def stop(self, room_id, user_key):
+        """Stop a user explicitly (message sent, left the room); the user if they were typing"""
+        with self._lock:
+            entry = self._typing.pop((str(room_id), user_key), None)
+            if entry is None:
+                return None
+            self.emitted += 1
+            return entry[1]
+
+    def clear(self, user_key):
+        """Stop a user in every room; [(room_id, user)] that were typing"""
+        with self._lock:
+            stopped = [(room_id, user) for (room_id, key), (_, user) in self._typing.items()
+                       if key == user_key]
+            for room_id, _ in stopped:
+                del self._typing[(room_id, user_key)]
+            self._started.pop(user_key, None)
+            self.emitted += len(stopped)
+            return stopped
+
+    def expire(self):
+        """Auto-stop users whose last event is older than the timeout; [(room_id, user)]"""
+        now = time.monotonic()
+        with self._lock:
+            stale = [(key, user) for key, (deadline, user) in self._typing.items() if deadline <= now]
+            for key, _ in stale:
+                del self._typing[key]
+            # Start times only matter for min_interval
+            for user_key in [k for k, started in self._started.items() if now - started >= self.min_interval]:
+                del self._started[user_key]
+            self.expired += len(stale)
+            self.emitted += len(stale)
+            return [(room_id, user) for (room_id, _), user in stale]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'typing': len(self._typing),
+                'received': self.received,
+                'emitted': self.emitted,
+                'coalesced': self.coalesced,
+                'rate_limited': self.rate_limited,
+                'expired': self.expired
+            }
@@ -19,5 +19,10 @@ def static_files(path):
 def health():
     return {'status': 'healthy', 'service': 'frontend'}, 200
 
+def create_app():
+    """App factory used by the production server (gunicorn.conf.py)"""
+    return app
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8080, debug=True)
+    # Development server; production runs gunicorn with gunicorn.conf.py
+    create_app().run(host='0.0.0.0', port=8080, debug=True)
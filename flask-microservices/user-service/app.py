@@ -7,17 +7,43 @@ from flask import Flask, request, jsonify
 from flask_sqlalchemy import SQLAlchemy
 import datetime
 import os
-import requests
+from token_auth import TokenVerifier
+from fast_json import FastJSONProvider, parse_fields, project
+from record_cache import create_record_cache
+from conditional import row_etag, validators, not_modified
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 
 # Configuration
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'user-secret-key')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///users.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['AUTH_SERVICE_URL'] = os.environ.get('AUTH_SERVICE_URL', 'http://localhost:5001')
+app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'auth-secret-key-change-in-production')
+app.config['JWT_ALGORITHM'] = os.environ.get('JWT_ALGORITHM', 'HS256')
+app.config['TOKEN_VERIFICATION'] = os.environ.get('TOKEN_VERIFICATION', 'local')  # 'local' or 'remote'
+app.config['TOKEN_CACHE_SIZE'] = int(os.environ.get('TOKEN_CACHE_SIZE', 10000))
+app.config['TOKEN_CACHE_TTL'] = int(os.environ.get('TOKEN_CACHE_TTL', 300))
+app.config['TOKEN_REVOCATION_INTERVAL'] = int(os.environ.get('TOKEN_REVOCATION_INTERVAL', 30))
+
+# Pagination
+app.config['PAGE_SIZE'] = int(os.environ.get('PAGE_SIZE', 100))
+app.config['MAX_PAGE_SIZE'] = int(os.environ.get('MAX_PAGE_SIZE', 500))
+
+# Profile lookup cache - in-process unless a redis:// URL is configured
+app.config['USER_CACHE_BACKEND_URL'] = os.environ.get('USER_CACHE_BACKEND_URL')
+app.config['USER_CACHE_SIZE'] = int(os.environ.get('USER_CACHE_SIZE', 10000))
+app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', 60))
 
 db = SQLAlchemy(app)
+token_verifier = TokenVerifier(app)
+profile_cache = create_record_cache(
+    app.config['USER_CACHE_BACKEND_URL'],
+    max_size=app.config['USER_CACHE_SIZE'],
+    ttl=app.config['USER_CACHE_TTL'],
+    prefix='user:profile:'
+)
 
 # User Profile Model
 class UserProfile(db.Model):
@@ -29,6 +55,9 @@ class UserProfile(db.Model):
     messages_sent = db.Column(db.Integer, default=0)
     rooms_created = db.Column(db.Integer, default=0)
     last_seen = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    # Row version for ETag / Last-Modified; set by every write, NULL until a
+    # profile that predates the column is first changed
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
     
     def to_dict(self):
         return {
@@ -38,28 +67,33 @@ class UserProfile(db.Model):
             'bio': self.bio,
             'messages_sent': self.messages_sent,
             'rooms_created': self.rooms_created,
-            'last_seen': self.last_seen.isoformat() if self.last_seen else None
+            'last_seen': self.last_seen.isoformat() if self.last_seen else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
-# Initialize database
-with app.app_context():
-    db.create_all()
-    print("User service database initialized")
+def init_database():
+    """Create tables (and columns added since)"""
+    with app.app_context():
+        db.create_all()
+        # create_all() skips existing tables, so add columns introduced since
+        existing = {column['name'] for column in db.inspect(db.engine).get_columns('user_profiles')}
+        for column in UserProfile.__table__.columns:
+            if column.name not in existing:
+                with db.engine.begin() as conn:
+                    conn.execute(db.text(
+                        f"ALTER TABLE user_profiles ADD COLUMN {column.name} "
+                        f"{column.type.compile(db.engine.dialect)}"
+                    ))
+        print("User service database initialized")
+
+def create_app():
+    """App factory used by the production server (gunicorn.conf.py)"""
+    init_database()
+    return app
 
 def verify_token(token):
-    """Verify token with auth service"""
-    try:
-        response = requests.post(
-            f"{app.config['AUTH_SERVICE_URL']}/verify",
-            json={'token': token},
-            timeout=5
-        )
-        if response.status_code == 200:
-            return response.json()
-        return None
-    except Exception as e:
-        print(f"Error verifying token: {e}")
-        return None
+    """Verify token locally (or with auth service in remote mode)"""
+    return token_verifier.verify(token)
 
 # Middleware to verify JWT token
 def token_required(f):
@@ -80,24 +114,146 @@ def token_required(f):
     decorator.__name__ = f.__name__
     return decorator
 
+def paginate(query, key):
+    """Keyset pagination (?limit=N&after=<id>) ordered by primary key
+    
+    Returns the page and the cursor of the next page (None on the last page).
+    """
+    limit = request.args.get('limit', app.config['PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, app.config['MAX_PAGE_SIZE']))
+    after = request.args.get('after', type=int)
+    
+    if after is not None:
+        query = query.filter(key > after)
+    items = query.order_by(key).limit(limit + 1).all()
+    
+    if len(items) > limit:
+        items = items[:limit]
+        return items, str(items[-1].id)
+    return items, None
+
+def page_headers(next_cursor):
+    """Response headers advertising the next page cursor"""
+    return {'X-Next-Cursor': next_cursor} if next_cursor else {}
+
+def coalesce_deltas(deltas):
+    """Merge deltas per user: counters are summed, the latest last_seen wins"""
+    rows = {}
+    for delta in deltas:
+        user_id = int(delta['user_id'])
+        last_seen = delta.get('last_seen')
+        last_seen = datetime.datetime.fromisoformat(last_seen) if last_seen else None
+        
+        row = rows.setdefault(user_id, {
+            'user_id': user_id, 'messages_sent': 0, 'rooms_created': 0, 'last_seen': None
+        })
+        row['messages_sent'] += int(delta.get('messages_sent', 0))
+        row['rooms_created'] += int(delta.get('rooms_created', 0))
+        if last_seen and (row['last_seen'] is None or last_seen > row['last_seen']):
+            row['last_seen'] = last_seen
+    return list(rows.values())
+
+def apply_stats_deltas(rows):
+    """Add per-user counter deltas with set-based statements in one transaction
+    
+    Counters are incremented in SQL (x = x + delta) rather than read and
+    written back, so concurrent replicas never lose updates. On SQLite and
+    PostgreSQL one INSERT ... ON CONFLICT DO UPDATE upserts every row; other
+    databases run an UPDATE per batch and insert the profiles that were missing.
+    """
+    if not rows:
+        return
+    
+    table = UserProfile.__table__
+    dialect = db.engine.dialect.name
+    now = datetime.datetime.utcnow()
+    
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id],
+            set_={
+                'messages_sent': table.c.messages_sent + stmt.excluded.messages_sent,
+                'rooms_created': table.c.rooms_created + stmt.excluded.rooms_created,
+                'last_seen': db.case(
+                    (stmt.excluded.last_seen.is_(None), table.c.last_seen),
+                    (table.c.last_seen.is_(None), stmt.excluded.last_seen),
+                    (stmt.excluded.last_seen > table.c.last_seen, stmt.excluded.last_seen),
+                    else_=table.c.last_seen
+                ),
+                'updated_at': now
+            }
+        )
+        db.session.execute(stmt, rows)
+    else:
+        existing = {user_id for (user_id,) in db.session.execute(
+            db.select(table.c.user_id).where(table.c.user_id.in_([row['user_id'] for row in rows]))
+        )}
+        updates = [{'b_' + key: value for key, value in row.items()}
+                   for row in rows if row['user_id'] in existing]
+        if updates:
+            db.session.execute(
+                table.update()
+                .where(table.c.user_id == db.bindparam('b_user_id'))
+                .values(
+                    messages_sent=table.c.messages_sent + db.bindparam('b_messages_sent'),
+                    rooms_created=table.c.rooms_created + db.bindparam('b_rooms_created'),
+                    last_seen=db.func.coalesce(db.bindparam('b_last_seen', type_=db.DateTime),
+                                               table.c.last_seen),
+                    updated_at=now
+                ),
+                updates
+            )
+        inserts = [row for row in rows if row['user_id'] not in existing]
+        if inserts:
+            db.session.execute(table.insert(), inserts)
+    
+    db.session.commit()
+    profile_cache.invalidate(*[row['user_id'] for row in rows])
+
 # Routes
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
-    return jsonify({'status': 'healthy', 'service': 'user-service'}), 200
+    return jsonify({
+        'status': 'healthy',
+        'service': 'user-service',
+        'token_cache': token_verifier.stats(),
+        'profile_cache': profile_cache.stats()
+    }), 200
 
 @app.route('/profiles/<int:user_id>', methods=['GET'])
 def get_profile(user_id):
-    """Get user profile"""
-    profile = UserProfile.query.filter_by(user_id=user_id).first()
+    """Get user profile (`fields=` selects fields)"""
+    try:
+        fields = parse_fields(request.args.get('fields'), UserProfile.__table__.columns.keys())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    if not profile:
-        # Create default profile
-        profile = UserProfile(user_id=user_id)
-        db.session.add(profile)
-        db.session.commit()
+    def load():
+        profile = UserProfile.query.filter_by(user_id=user_id).first()
+        
+        if not profile:
+            # Create default profile
+            profile = UserProfile(user_id=user_id)
+            db.session.add(profile)
+            db.session.commit()
+        
+        return profile.to_dict()
+    
+    profile = profile_cache.get(user_id, load)
+    updated_at = profile['updated_at'] and datetime.datetime.fromisoformat(profile['updated_at'])
+    etag = row_etag(profile['id'], profile['updated_at'], fields)
+    headers = validators(etag, updated_at)
     
-    return jsonify(profile.to_dict()), 200
+    if not_modified(etag, updated_at):
+        return '', 304, headers
+    return jsonify(project(profile, fields)), 200, headers
 
 @app.route('/profiles/<int:user_id>', methods=['PUT'])
 @token_required
@@ -120,6 +276,7 @@ def update_profile(current_user, user_id):
         profile.bio = data['bio']
     
     db.session.commit()
+    profile_cache.invalidate(user_id)
     
     return jsonify({
         'message': 'Profile updated successfully',
@@ -129,29 +286,45 @@ def update_profile(current_user, user_id):
 @app.route('/profiles/<int:user_id>/stats', methods=['POST'])
 def update_stats(user_id):
     """Update user statistics (called by other services)"""
-    data = request.get_json()
-    profile = UserProfile.query.filter_by(user_id=user_id).first()
+    data = request.get_json() or {}
+    apply_stats_deltas([{
+        'user_id': user_id,
+        'messages_sent': data.get('messages_sent', 0),
+        'rooms_created': data.get('rooms_created', 0),
+        'last_seen': datetime.datetime.utcnow() if data.get('last_seen') else None
+    }])
     
-    if not profile:
-        profile = UserProfile(user_id=user_id)
-        db.session.add(profile)
+    return jsonify({'message': 'Stats updated'}), 200
+
+@app.route('/profiles/stats:batch', methods=['POST'])
+def update_stats_batch():
+    """Apply many users' statistics deltas atomically
     
-    if 'messages_sent' in data:
-        profile.messages_sent += data['messages_sent']
-    if 'rooms_created' in data:
-        profile.rooms_created += data['rooms_created']
-    if 'last_seen' in data:
-        profile.last_seen = datetime.datetime.utcnow()
+    Body: {"deltas": [{"user_id", "messages_sent", "rooms_created", "last_seen"}]}
+    where last_seen is an ISO timestamp or null.
+    """
+    deltas = (request.get_json() or {}).get('deltas') or []
     
-    db.session.commit()
+    try:
+        rows = coalesce_deltas(deltas)
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'Invalid stats deltas'}), 400
     
-    return jsonify({'message': 'Stats updated'}), 200
+    apply_stats_deltas(rows)
+    
+    return jsonify({'message': 'Stats updated', 'count': len(deltas), 'users': len(rows)}), 200
 
 @app.route('/profiles', methods=['GET'])
 def get_all_profiles():
-    """Get all user profiles"""
-    profiles = UserProfile.query.all()
-    return jsonify([profile.to_dict() for profile in profiles]), 200
+    """Get all user profiles (paginated, `fields=` selects fields)"""
+    try:
+        fields = parse_fields(request.args.get('fields'), UserProfile.__table__.columns.keys())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    profiles, next_cursor = paginate(UserProfile.query, UserProfile.id)
+    return jsonify([project(profile.to_dict(), fields) for profile in profiles]), 200, page_headers(next_cursor)
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5002, debug=True)
+    # Development server; production runs gunicorn with gunicorn.conf.py
+    create_app().run(host='0.0.0.0', port=5002, debug=True)
@@ -0,0 +1,39 @@
+"""
+Gunicorn Configuration
+Production server settings for the service in this directory, read from the
+environment (defaults are set per service in its Dockerfile)
+"""
+
+import os
+import subprocess
+import sys
+
+# "module:factory()" - gunicorn calls the app factory once in every worker
+wsgi_app = os.environ.get('APP_MODULE', 'app:create_app()')
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+# gthread for request/response services; eventlet for Socket.IO (one worker
+# per pod, since Socket.IO sessions must stay on the worker that opened them)
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+accesslog = '-' if os.environ.get('GUNICORN_ACCESS_LOG', 'false').lower() == 'true' else None
+errorlog = '-'
+
+
+def on_starting(server):
+    """Create tables once before workers start, so they do not race on an empty database
+
+    Runs in a throwaway interpreter: importing the app in the master would
+    share its database connections with every forked worker.
+    """
+    module = wsgi_app.split(':')[0]
+    subprocess.run([
+        sys.executable, '-c',
+        f"import {module}; init = getattr({module}, 'init_database', None); init and init()"
+    ], check=True)
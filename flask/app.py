@@ -2,32 +2,75 @@ from flask import Flask, render_template, request, jsonify, session, redirect, u
 from flask_socketio import SocketIO, emit, join_room, leave_room, rooms
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 from datetime import datetime
 import os
 import secrets
+from presence import create_presence
+from typing_state import TypingTracker
+from password_hasher import PasswordHasher, HasherBusy
+from record_cache import create_record_cache
+import fast_json
+from fast_json import FastJSONProvider, FragmentCache, json_list
 
 # ============================================================================
 # APPLICATION SETUP
 # ============================================================================
 
 app = Flask(__name__, static_folder='static', static_url_path='/static')
+app.json = FastJSONProvider(app)
 app.config['SECRET_KEY'] = 'dev-secret-key-change-in-production'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///chat_app.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///chat_app.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif'}
+app.config['PAGE_SIZE'] = 100  # default page size for list endpoints
+app.config['MAX_PAGE_SIZE'] = 500
+app.config['MAX_MESSAGE_PAGE_SIZE'] = 200
+# Presence - in-memory by default, shared across processes with a redis:// URL
+app.config['PRESENCE_BACKEND_URL'] = os.environ.get('PRESENCE_BACKEND_URL')
+app.config['PRESENCE_TTL'] = int(os.environ.get('PRESENCE_TTL', 90))  # seconds without a heartbeat
+app.config['PRESENCE_SWEEP_INTERVAL'] = int(os.environ.get('PRESENCE_SWEEP_INTERVAL', 30))
+# Typing indicators - only start/stop transitions are broadcast
+app.config['TYPING_TIMEOUT'] = float(os.environ.get('TYPING_TIMEOUT', 5))
+app.config['TYPING_MIN_INTERVAL'] = float(os.environ.get('TYPING_MIN_INTERVAL', 1))
+# Serialized messages kept for history responses (0 disables)
+app.config['JSON_FRAGMENT_CACHE_SIZE'] = int(os.environ.get('JSON_FRAGMENT_CACHE_SIZE', 20000))
+# Password hashing off the request path; raising the method's cost rehashes users as they log in
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256')
+app.config['PASSWORD_HASH_POOL'] = os.environ.get('PASSWORD_HASH_POOL', 'process')  # 'process', 'thread' or 'inline'
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+app.config['PASSWORD_HASH_MAX_PENDING'] = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 4 * app.config['PASSWORD_HASH_WORKERS']))
+app.config['PASSWORD_HASH_TIMEOUT'] = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+# Cache of users loaded for current_user - in-process unless a redis:// URL is configured
+app.config['USER_CACHE_BACKEND_URL'] = os.environ.get('USER_CACHE_BACKEND_URL')
+app.config['USER_CACHE_SIZE'] = int(os.environ.get('USER_CACHE_SIZE', 10000))
+app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', 60))
 
 # Ensure upload folder exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 # Initialize extensions
 db = SQLAlchemy(app)
-socketio = SocketIO(app, cors_allowed_origins='*')
+socketio = SocketIO(app, cors_allowed_origins='*', json=fast_json)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
+presence = create_presence(app.config['PRESENCE_BACKEND_URL'], ttl=app.config['PRESENCE_TTL'])
+presence_sweeper = None
+typing_tracker = TypingTracker(
+    timeout=app.config['TYPING_TIMEOUT'],
+    min_interval=app.config['TYPING_MIN_INTERVAL']
+)
+typing_sweeper = None
+message_json = FragmentCache(app.config['JSON_FRAGMENT_CACHE_SIZE'])
+password_hasher = PasswordHasher(app)
+user_cache = create_record_cache(
+    app.config['USER_CACHE_BACKEND_URL'],
+    max_size=app.config['USER_CACHE_SIZE'],
+    ttl=app.config['USER_CACHE_TTL'],
+    prefix='monolith:user:'
+)
 
 # ============================================================================
 # DATABASE MODELS
@@ -47,10 +90,14 @@ class User(UserMixin, db.Model):
     messages = db.relationship('Message', backref='author', lazy=True)
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        # Upgrades the stored hash when PASSWORD_HASH_METHOD has changed
+        valid, new_hash = password_hasher.verify(self.password_hash, password)
+        if new_hash:
+            self.password_hash = new_hash
+        return valid
     
     def to_dict(self):
         return {
@@ -83,11 +130,15 @@ class Room(db.Model):
             'created_by': self.created_by,
             'created_at': self.created_at.isoformat(),
             'is_private': self.is_private,
-            'message_count': len(self.messages)
+            'message_count': self.message_count
         }
 
 class Message(db.Model):
     __tablename__ = 'messages'
+    __table_args__ = (
+        # Room history is paged by (room_id, id)
+        db.Index('ix_messages_room_id_id', 'room_id', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -109,21 +160,66 @@ class Message(db.Model):
             'file_url': self.file_url
         }
 
-class OnlineUser(db.Model):
-    __tablename__ = 'online_users'
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    room_id = db.Column(db.Integer, db.ForeignKey('rooms.id'), nullable=False)
-    sid = db.Column(db.String(100), unique=True, nullable=False)
-    joined_at = db.Column(db.DateTime, default=datetime.utcnow)
+# Counts as correlated COUNT subqueries instead of len(relationship), which loads
+# every message. Deferred so plain lookups skip them: undefer() where serialized.
+Room.message_count = db.column_property(
+    db.select(db.func.count(Message.id))
+    .where(Message.room_id == Room.id)
+    .correlate_except(Message)
+    .scalar_subquery(),
+    deferred=True
+)
+User.message_count = db.column_property(
+    db.select(db.func.count(Message.id))
+    .where(Message.user_id == User.id)
+    .correlate_except(Message)
+    .scalar_subquery(),
+    deferred=True
+)
+
+def rooms_with_counts():
+    """Room query that loads message_count in the same SELECT"""
+    return Room.query.options(db.undefer(Room.message_count))
+
+def messages_with_authors():
+    """Message query that joins each message's author instead of one query per message"""
+    return Message.query.options(db.joinedload(Message.author))
 
 # ============================================================================
 # LOGIN MANAGER
 # ============================================================================
 
+# Never copied into user_cache, which may be a Redis shared with other services
+UNCACHED_USER_COLUMNS = ('password_hash',)
+
+def user_columns(user):
+    """Column values of a user, as kept in user_cache (JSON-safe, no credentials)"""
+    if not user:
+        return None
+    columns = {}
+    for column in User.__table__.columns:
+        if column.name not in UNCACHED_USER_COLUMNS:
+            value = getattr(user, column.name)
+            columns[column.name] = value.isoformat() if isinstance(value, datetime) else value
+    return columns
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # Runs on every request and Socket.IO event. Cached rows are attached to the
+    # session as if just loaded (no SELECT), so current_user can still be
+    # modified and committed; writers invalidate user_cache after committing.
+    user_id = int(user_id)
+    columns = user_cache.get(user_id, lambda: user_columns(db.session.get(User, user_id)))
+    if columns is None:
+        return None
+    # password_hash is left unloaded and fetched only if check_password() needs it
+    user = User(**{
+        name: datetime.fromisoformat(value) if value and isinstance(User.__table__.columns[name].type, db.DateTime)
+        else value
+        for name, value in columns.items()
+    })
+    db.make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
 
 # ============================================================================
 # HELPER FUNCTIONS
@@ -133,18 +229,62 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
+def paginate(query, key):
+    """Keyset pagination (?limit=N&after=<id>) ordered by primary key.
+    Returns the page and the next page cursor (None on the last page)."""
+    limit = request.args.get('limit', app.config['PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, app.config['MAX_PAGE_SIZE']))
+    after = request.args.get('after', type=int)
+    
+    if after is not None:
+        query = query.filter(key > after)
+    items = query.order_by(key).limit(limit + 1).all()
+    
+    if len(items) > limit:
+        items = items[:limit]
+        return items, str(items[-1].id)
+    return items, None
+
+def page_headers(next_cursor):
+    return {'X-Next-Cursor': next_cursor} if next_cursor else {}
+
 def get_online_users_in_room(room_id):
-    online = OnlineUser.query.filter_by(room_id=room_id).all()
-    users = []
-    for ou in online:
-        user = User.query.get(ou.user_id)
-        if user:
-            users.append({
-                'id': user.id,
-                'username': user.username,
-                'avatar': user.avatar
-            })
-    return users
+    return presence.members(room_id)
+
+def broadcast_presence(room_id, joined=(), left=()):
+    """Send a room only the presence changes instead of the full list"""
+    socketio.emit('presence_diff', {
+        'room_id': room_id,
+        'joined': list(joined),
+        'left': list(left)
+    }, room=str(room_id))
+
+def sweep_presence():
+    """Expire sessions that stopped sending heartbeats"""
+    while True:
+        socketio.sleep(app.config['PRESENCE_SWEEP_INTERVAL'])
+        for room_id, user in presence.expire():
+            socketio.emit('user_left', {
+                'user_id': user['id'],
+                'username': user['username'],
+                'timestamp': datetime.utcnow().isoformat()
+            }, room=str(room_id))
+            broadcast_presence(room_id, left=[user])
+
+def broadcast_typing(room_id, user, is_typing):
+    """Tell a room that a user started or stopped typing"""
+    socketio.emit('user_typing', {
+        'user_id': user['id'],
+        'username': user['username'],
+        'is_typing': is_typing
+    }, room=str(room_id))
+
+def sweep_typing():
+    """Auto-stop typing indicators of users who went quiet"""
+    while True:
+        socketio.sleep(1)
+        for room_id, user in typing_tracker.expire():
+            broadcast_typing(room_id, user, False)
 
 # ============================================================================
 # AUTHENTICATION ROUTES
@@ -156,6 +296,15 @@ def index():
         return redirect(url_for('chat'))
     return redirect(url_for('login'))
 
+@app.errorhandler(HasherBusy)
+def hasher_busy(error):
+    # Shed logins and registrations while the hashing pool is saturated
+    message = 'Too many sign-ins right now, please retry in a moment'
+    if request.is_json:
+        return jsonify({'success': False, 'error': message}), 503, {'Retry-After': '1'}
+    template = 'register.html' if request.endpoint == 'register' else 'login.html'
+    return render_template(template, error=message), 503, {'Retry-After': '1'}
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
@@ -172,6 +321,7 @@ def login():
             login_user(user)
             user.last_seen = datetime.utcnow()
             db.session.commit()
+            user_cache.invalidate(user.id)
             
             if request.is_json:
                 return jsonify({'success': True, 'redirect': url_for('chat')})
@@ -258,6 +408,7 @@ def update_profile():
             current_user.avatar = filename
     
     db.session.commit()
+    user_cache.invalidate(current_user.id)
     return jsonify({'success': True, 'user': current_user.to_dict()})
 
 @app.route('/admin')
@@ -267,14 +418,15 @@ def admin():
         return "Unauthorized", 403
     
     users = User.query.all()
-    rooms_list = Room.query.all()
-    messages = Message.query.order_by(Message.timestamp.desc()).limit(100).all()
+    rooms_list = rooms_with_counts().all()
+    messages = messages_with_authors().options(db.joinedload(Message.room))\
+        .order_by(Message.id.desc()).limit(100).all()
     
     stats = {
         'total_users': len(users),
         'total_rooms': len(rooms_list),
         'total_messages': Message.query.count(),
-        'online_users': OnlineUser.query.count()
+        'online_users': presence.count()
     }
     
     return render_template('admin.html', users=users, rooms=rooms_list, 
@@ -288,8 +440,8 @@ def admin():
 @login_required
 def api_rooms():
     if request.method == 'GET':
-        rooms_list = Room.query.all()
-        return jsonify([room.to_dict() for room in rooms_list])
+        rooms_list, next_cursor = paginate(rooms_with_counts(), Room.id)
+        return jsonify([room.to_dict() for room in rooms_list]), 200, page_headers(next_cursor)
     
     elif request.method == 'POST':
         data = request.get_json()
@@ -314,7 +466,7 @@ def api_rooms():
 @app.route('/api/rooms/<int:room_id>', methods=['GET', 'DELETE'])
 @login_required
 def api_room_detail(room_id):
-    room = Room.query.get_or_404(room_id)
+    room = rooms_with_counts().get_or_404(room_id)
     
     if request.method == 'GET':
         return jsonify(room.to_dict())
@@ -325,21 +477,46 @@ def api_room_detail(room_id):
         
         db.session.delete(room)
         db.session.commit()
+        message_json.clear()  # SQLite may hand the deleted ids out again
         return jsonify({'success': True})
 
 @app.route('/api/rooms/<int:room_id>/messages')
 @login_required
 def api_room_messages(room_id):
+    # Newest `limit` messages, or keyset pages via before_id (older history)
+    # and after_id (gap-fill after a reconnect). Always returned oldest first;
+    # X-Next-Cursor is the id to pass as the same parameter for the next page.
     limit = request.args.get('limit', 50, type=int)
-    messages = Message.query.filter_by(room_id=room_id)\
-        .order_by(Message.timestamp.desc()).limit(limit).all()
-    return jsonify([msg.to_dict() for msg in reversed(messages)])
+    limit = max(1, min(limit, app.config['MAX_MESSAGE_PAGE_SIZE']))
+    before_id = request.args.get('before_id', type=int)
+    after_id = request.args.get('after_id', type=int)
+    
+    query = messages_with_authors().filter_by(room_id=room_id)
+    if after_id is not None:
+        messages = query.filter(Message.id > after_id)\
+            .order_by(Message.id.asc()).limit(limit + 1).all()
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        next_cursor = messages[-1].id if has_more else None
+    else:
+        if before_id is not None:
+            query = query.filter(Message.id < before_id)
+        messages = query.order_by(Message.id.desc()).limit(limit + 1).all()
+        has_more = len(messages) > limit
+        messages = list(reversed(messages[:limit]))
+        next_cursor = messages[0].id if has_more else None
+    
+    # Messages never change once sent; the avatar is part of the key since
+    # it is the one serialized field that can (profile updates)
+    body = json_list([message_json.get((msg.id, msg.author.avatar), msg.to_dict) for msg in messages])
+    return app.response_class(body, mimetype='application/json'), 200, \
+        page_headers(next_cursor and str(next_cursor))
 
 @app.route('/api/users')
 @login_required
 def api_users():
-    users = User.query.all()
-    return jsonify([user.to_dict() for user in users])
+    users, next_cursor = paginate(User.query, User.id)
+    return jsonify([user.to_dict() for user in users]), 200, page_headers(next_cursor)
 
 @app.route('/api/users/<int:user_id>')
 @login_required
@@ -354,7 +531,10 @@ def api_stats():
         'total_users': User.query.count(),
         'total_rooms': Room.query.count(),
         'total_messages': Message.query.count(),
-        'online_users': OnlineUser.query.count(),
+        'online_users': presence.count(),
+        'typing_events': typing_tracker.stats(),
+        'message_json_cache': message_json.stats(),
+        'user_cache': user_cache.stats(),
         'is_admin': current_user.is_admin
     }
     return jsonify(stats)
@@ -365,6 +545,12 @@ def api_stats():
 
 @socketio.on('connect')
 def handle_connect():
+    global presence_sweeper, typing_sweeper
+    if presence_sweeper is None:
+        presence_sweeper = socketio.start_background_task(sweep_presence)
+    if typing_sweeper is None:
+        typing_sweeper = socketio.start_background_task(sweep_typing)
+    
     if current_user.is_authenticated:
         emit('connected', {
             'user_id': current_user.id,
@@ -387,32 +573,38 @@ def handle_join(data):
     join_room(str(room_id))
     
     # Track online user
-    online_user = OnlineUser.query.filter_by(
-        user_id=current_user.id,
-        room_id=room_id
-    ).first()
-    
-    if not online_user:
-        online_user = OnlineUser(
-            user_id=current_user.id,
-            room_id=room_id,
-            sid=request.sid
-        )
-        db.session.add(online_user)
-        db.session.commit()
+    member = {
+        'id': current_user.id,
+        'username': current_user.username,
+        'avatar': current_user.avatar
+    }
+    newly_present = presence.join(room_id, request.sid, current_user.id, member)
     
     # Notify others
-    emit('user_joined', {
-        'user_id': current_user.id,
-        'username': current_user.username,
-        'avatar': current_user.avatar,
-        'timestamp': datetime.utcnow().isoformat()
-    }, room=str(room_id))
+    if newly_present:
+        emit('user_joined', {
+            'user_id': current_user.id,
+            'username': current_user.username,
+            'avatar': current_user.avatar,
+            'timestamp': datetime.utcnow().isoformat()
+        }, room=str(room_id))
+        broadcast_presence(room_id, joined=[member])
     
-    # Send online users list
+    # Send online users list to the joining client
     online_users = get_online_users_in_room(room_id)
     emit('online_users', {'users': online_users})
 
+@socketio.on('get_online_users')
+def handle_get_online_users(data):
+    if not current_user.is_authenticated:
+        return
+    
+    emit('online_users', {'users': get_online_users_in_room(data.get('room_id'))})
+
+@socketio.on('heartbeat')
+def handle_heartbeat(data=None):
+    presence.heartbeat(request.sid)
+
 @socketio.on('leave')
 def handle_leave(data):
     if not current_user.is_authenticated:
@@ -421,19 +613,19 @@ def handle_leave(data):
     room_id = data.get('room_id')
     leave_room(str(room_id))
     
-    # Remove from online users
-    OnlineUser.query.filter_by(
-        user_id=current_user.id,
-        room_id=room_id
-    ).delete()
-    db.session.commit()
+    typist = typing_tracker.stop(room_id, current_user.id)
+    if typist:
+        broadcast_typing(room_id, typist, False)
     
-    # Notify others
-    emit('user_left', {
-        'user_id': current_user.id,
-        'username': current_user.username,
-        'timestamp': datetime.utcnow().isoformat()
-    }, room=str(room_id))
+    # Remove from online users; notify others once the user's last session left
+    user = presence.leave(room_id, request.sid)
+    if user:
+        emit('user_left', {
+            'user_id': current_user.id,
+            'username': current_user.username,
+            'timestamp': datetime.utcnow().isoformat()
+        }, room=str(room_id))
+        broadcast_presence(room_id, left=[user])
 
 @socketio.on('message')
 def handle_message(data):
@@ -455,8 +647,11 @@ def handle_message(data):
     db.session.add(message)
     db.session.commit()
     
-    # Broadcast message
+    # Broadcast message; sending ends the sender's typing indicator
     emit('new_message', message.to_dict(), room=str(room_id))
+    typist = typing_tracker.stop(room_id, current_user.id)
+    if typist:
+        broadcast_typing(room_id, typist, False)
 
 @socketio.on('typing')
 def handle_typing(data):
@@ -464,28 +659,31 @@ def handle_typing(data):
         return
     
     room_id = data.get('room_id')
-    is_typing = data.get('is_typing', False)
+    is_typing = bool(data.get('is_typing', False))
+    user = {'id': current_user.id, 'username': current_user.username}
     
-    emit('user_typing', {
-        'user_id': current_user.id,
-        'username': current_user.username,
-        'is_typing': is_typing
-    }, room=str(room_id), include_self=False)
+    # Clients send an event per keystroke; the room only hears start/stop transitions
+    if typing_tracker.update(room_id, current_user.id, user, is_typing):
+        emit('user_typing', {
+            'user_id': current_user.id,
+            'username': current_user.username,
+            'is_typing': is_typing
+        }, room=str(room_id), include_self=False)
 
 @socketio.on('disconnect')
 def handle_disconnect():
     if current_user.is_authenticated:
-        # Remove all online records for this user
-        online_records = OnlineUser.query.filter_by(user_id=current_user.id).all()
-        for record in online_records:
-            emit('user_left', {
-                'user_id': current_user.id,
-                'username': current_user.username,
-                'timestamp': datetime.utcnow().isoformat()
-            }, room=str(record.room_id))
-        
-        OnlineUser.query.filter_by(user_id=current_user.id).delete()
-        db.session.commit()
+        for room_id, user in typing_tracker.clear(current_user.id):
+            broadcast_typing(room_id, user, False)
+    
+    # Remove this session from every room it joined
+    for room_id, user in presence.disconnect(request.sid):
+        emit('user_left', {
+            'user_id': user['id'],
+            'username': user['username'],
+            'timestamp': datetime.utcnow().isoformat()
+        }, room=str(room_id))
+        broadcast_presence(room_id, left=[user])
 
 # ============================================================================
 # FILE UPLOAD ROUTES
@@ -540,6 +738,11 @@ def init_database():
     with app.app_context():
         db.create_all()
         
+        # create_all() skips existing tables, so add indexes introduced since
+        for model in (User, Room, Message):
+            for index in model.__table__.indexes:
+                index.create(db.engine, checkfirst=True)
+        
         # Create default admin user if not exists
         admin = User.query.filter_by(username='admin').first()
         if not admin:
@@ -568,6 +771,11 @@ def init_database():
 # APPLICATION ENTRY POINT
 # ============================================================================
 
-if __name__ == '__main__':
+def create_app():
+    """App factory used by the production server (gunicorn.conf.py)"""
     init_database()
-    socketio.run(app, host='0.0.0.0', port=5000, debug=True)
+    return app
+
+if __name__ == '__main__':
+    # Development server; production runs gunicorn with gunicorn.conf.py
+    socketio.run(create_app(), host='0.0.0.0', port=5000, debug=True)
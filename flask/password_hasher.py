@@ -0,0 +1,182 @@
+"""
+Password Hashing
+Runs password hashing and verification off the request thread in a bounded
+worker pool, with a tunable hash cost and rehash-on-login
+"""
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import os
+import threading
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+
+class HasherBusy(Exception):
+    """The hashing pool is saturated; the request should be retried later (503)"""
+
+
+def normalize_method(method):
+    """Method string as werkzeug stores it in the hash (pbkdf2 with explicit iterations)"""
+    if method.startswith('pbkdf2:') and method.count(':') == 1:
+        return f'{method}:{DEFAULT_PBKDF2_ITERATIONS}'
+    return method
+
+
+def hash_method(pwhash):
+    """The method a stored hash was made with, e.g. pbkdf2:sha256:600000"""
+    return pwhash.split('$', 1)[0]
+
+
+def verify_and_rehash(pwhash, password, method):
+    """Check a password; (valid, new hash if the stored one uses a different method)
+
+    Module level so process pool workers can run it; one round trip covers
+    both the check and the upgrade.
+    """
+    if not check_password_hash(pwhash, password):
+        return False, None
+    if hash_method(pwhash) == method:
+        return True, None
+    return True, generate_password_hash(password, method=method)
+
+
+class PasswordHasher:
+    """Bounded pool for CPU-bound password hashing
+
+    PBKDF2 with a production cost takes tens to hundreds of milliseconds, so
+    hashing on the request thread lets a login burst pin every worker. Jobs go
+    to PASSWORD_HASH_WORKERS pool workers instead (PASSWORD_HASH_POOL:
+    `process`, `thread` - real OS threads via eventlet's tpool under eventlet -
+    or `inline`). Once PASSWORD_HASH_MAX_PENDING jobs are queued or running,
+    new ones fail fast with HasherBusy instead of piling up behind the burst.
+    A job that outlives PASSWORD_HASH_TIMEOUT fails the request but keeps its
+    slot until it finishes, so timeouts cannot overcommit the pool.
+
+    Hashes use PASSWORD_HASH_METHOD (a werkzeug method such as
+    `pbkdf2:sha256:600000`); a successful login with a hash made under a
+    different method returns a replacement hash, so raising the cost upgrades
+    users as they log in.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.hashed = 0
+        self.verified = 0
+        self.rehashed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self._in_flight = 0
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.config.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256')
+        app.config.setdefault('PASSWORD_HASH_POOL', 'process')
+        app.config.setdefault('PASSWORD_HASH_WORKERS', os.cpu_count() or 1)
+        app.config.setdefault('PASSWORD_HASH_MAX_PENDING', 4 * app.config['PASSWORD_HASH_WORKERS'])
+        app.config.setdefault('PASSWORD_HASH_TIMEOUT', 10.0)
+
+    @property
+    def method(self):
+        return normalize_method(self.app.config['PASSWORD_HASH_METHOD'])
+
+    def hash(self, password):
+        """Hash a new password with the configured method"""
+        result = self._run(generate_password_hash, password, self.method)
+        with self._lock:
+            self.hashed += 1
+        return result
+
+    def verify(self, pwhash, password):
+        """(valid, replacement hash or None) for a stored hash"""
+        valid, new_hash = self._run(verify_and_rehash, pwhash, password, self.method)
+        with self._lock:
+            self.verified += 1
+            if new_hash:
+                self.rehashed += 1
+        return valid, new_hash
+
+    def shutdown(self):
+        """Stop the pool; the next job starts a new one with the current config"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'method': self.method,
+                'pool': self.app.config['PASSWORD_HASH_POOL'],
+                'workers': self.app.config['PASSWORD_HASH_WORKERS'],
+                'in_flight': self._in_flight,
+                'max_pending': self.app.config['PASSWORD_HASH_MAX_PENDING'],
+                'hashed': self.hashed,
+                'verified': self.verified,
+                'rehashed': self.rehashed,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts
+            }
+
+    def _run(self, fn, *args):
+        if self.app.config['PASSWORD_HASH_POOL'] == 'inline':
+            return fn(*args)
+
+        with self._lock:
+            if self._in_flight >= self.app.config['PASSWORD_HASH_MAX_PENDING']:
+                self.rejected += 1
+                raise HasherBusy()
+            self._in_flight += 1
+        if self.app.config['PASSWORD_HASH_POOL'] == 'thread' and _eventlet_patched():
+            # Green threads would hold the hub; tpool runs on real threads
+            # (hashlib's PBKDF2 releases the GIL). Its size is EVENTLET_THREADPOOL_SIZE.
+            from eventlet import tpool
+            try:
+                return tpool.execute(fn, *args)
+            finally:
+                self._release()
+        try:
+            future = self._pool().submit(fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        # The slot is freed when the job finishes, not when the caller gives
+        # up on it: a job that already started keeps its worker busy
+        future.add_done_callback(self._release)
+        try:
+            return future.result(timeout=self.app.config['PASSWORD_HASH_TIMEOUT'])
+        except FutureTimeoutError:
+            future.cancel()  # only drops it if it is still queued
+            with self._lock:
+                self.timeouts += 1
+            raise HasherBusy()
+
+    def _release(self, future=None):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _pool(self):
+        # Created lazily, and again after a fork: pools do not survive fork()
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                workers = self.app.config['PASSWORD_HASH_WORKERS']
+                if self.app.config['PASSWORD_HASH_POOL'] == 'process':
+                    self._executor = ProcessPoolExecutor(max_workers=workers)
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=workers,
+                                                        thread_name_prefix='password-hasher')
+                self._pid = os.getpid()
+            return self._executor
+
+
+def _eventlet_patched():
+    try:
+        from eventlet import patcher
+    except ImportError:
+        return False
+    return patcher.is_monkey_patched('thread')
@@ -0,0 +1,196 @@
+"""
+Presence Registry
+Tracks which users are online in which rooms, keyed by Socket.IO session id
+"""
+
+import json
+import threading
+import time
+
+
+class InMemoryPresence:
+    """Presence for a single process: room -> sid -> user, O(1) join/leave
+
+    A user counts as present in a room while at least one of their sessions
+    is joined, so join() and leave() report only transitions (a user's first
+    session joining, their last session leaving). Sessions that stop sending
+    heartbeats for longer than `ttl` seconds are removed by expire().
+    """
+
+    def __init__(self, ttl=90):
+        self.ttl = ttl
+        self._rooms = {}        # room_id -> {sid: (user_id, user)}
+        self._counts = {}       # room_id -> {user_id: number of sessions}
+        self._sessions = {}     # sid -> set of room_ids
+        self._last_seen = {}    # sid -> timestamp
+        self._lock = threading.Lock()
+
+    def join(self, room_id, sid, user_id, user):
+        """Add a session to a room; True if the user was not present before"""
+        room_id = int(room_id)
+        with self._lock:
+            self._last_seen[sid] = time.time()
+            members = self._rooms.setdefault(room_id, {})
+            if sid in members:
+                return False
+            members[sid] = (user_id, user)
+            self._sessions.setdefault(sid, set()).add(room_id)
+            counts = self._counts.setdefault(room_id, {})
+            counts[user_id] = counts.get(user_id, 0) + 1
+            return counts[user_id] == 1
+
+    def leave(self, room_id, sid):
+        """Remove a session from a room; the user if they are no longer present"""
+        with self._lock:
+            return self._leave(int(room_id), sid)
+
+    def disconnect(self, sid):
+        """Remove a session from every room; [(room_id, user)] for users now gone"""
+        with self._lock:
+            return self._disconnect(sid)
+
+    def heartbeat(self, sid):
+        with self._lock:
+            if sid in self._sessions:
+                self._last_seen[sid] = time.time()
+
+    def expire(self):
+        """Drop sessions without a recent heartbeat; [(room_id, user)] for users now gone"""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            stale = [sid for sid, seen in self._last_seen.items() if seen < cutoff]
+            gone = []
+            for sid in stale:
+                gone.extend(self._disconnect(sid))
+            return gone
+
+    def members(self, room_id):
+        """Distinct users present in a room"""
+        with self._lock:
+            users = {}
+            for user_id, user in self._rooms.get(int(room_id), {}).values():
+                users.setdefault(user_id, user)
+            return list(users.values())
+
+    def count(self):
+        """Number of connected sessions with presence"""
+        with self._lock:
+            return len(self._sessions)
+
+    def _leave(self, room_id, sid):
+        members = self._rooms.get(room_id)
+        if not members or sid not in members:
+            return None
+        user_id, user = members.pop(sid)
+        if not members:
+            del self._rooms[room_id]
+
+        rooms = self._sessions.get(sid)
+        if rooms is not None:
+            rooms.discard(room_id)
+            if not rooms:
+                del self._sessions[sid]
+                self._last_seen.pop(sid, None)
+
+        counts = self._counts[room_id]
+        counts[user_id] -= 1
+        if counts[user_id] > 0:
+            return None
+        del counts[user_id]
+        if not counts:
+            del self._counts[room_id]
+        return user
+
+    def _disconnect(self, sid):
+        gone = []
+        for room_id in list(self._sessions.get(sid, ())):
+            user = self._leave(room_id, sid)
+            if user is not None:
+                gone.append((room_id, user))
+        self._sessions.pop(sid, None)
+        self._last_seen.pop(sid, None)
+        return gone
+
+
+class RedisPresence:
+    """Presence shared by every replica through Redis
+
+    Works with any client exposing the redis-py commands used here, so a
+    local stand-in such as fakeredis.FakeRedis() can replace the server.
+    Keys (all under `prefix`):
+        room:<room_id>        hash  sid -> user JSON
+        room:<room_id>:users  hash  user_id -> number of sessions
+        sid:<sid>             set   room ids the session joined
+        seen                  zset  sid -> last heartbeat
+    """
+
+    def __init__(self, client, ttl=90, prefix='presence:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _key(self, *parts):
+        return self.prefix + ':'.join(str(p) for p in parts)
+
+    def join(self, room_id, sid, user_id, user):
+        room_id = int(room_id)
+        self.client.zadd(self._key('seen'), {sid: time.time()})
+        if not self.client.hsetnx(self._key('room', room_id), sid, json.dumps([user_id, user])):
+            return False
+        self.client.sadd(self._key('sid', sid), room_id)
+        return self.client.hincrby(self._key('room', room_id, 'users'), user_id, 1) == 1
+
+    def leave(self, room_id, sid):
+        room_id = int(room_id)
+        raw = self.client.hget(self._key('room', room_id), sid)
+        if raw is None or not self.client.hdel(self._key('room', room_id), sid):
+            return None
+        self.client.srem(self._key('sid', sid), room_id)
+        if not self.client.scard(self._key('sid', sid)):
+            self.client.zrem(self._key('seen'), sid)
+        user_id, user = json.loads(raw)
+        if self.client.hincrby(self._key('room', room_id, 'users'), user_id, -1) > 0:
+            return None
+        self.client.hdel(self._key('room', room_id, 'users'), user_id)
+        return user
+
+    def disconnect(self, sid):
+        gone = []
+        for room_id in self.client.smembers(self._key('sid', sid)):
+            room_id = int(room_id)
+            user = self.leave(room_id, sid)
+            if user is not None:
+                gone.append((room_id, user))
+        self.client.delete(self._key('sid', sid))
+        self.client.zrem(self._key('seen'), sid)
+        return gone
+
+    def heartbeat(self, sid):
+        self.client.zadd(self._key('seen'), {sid: time.time()}, xx=True)
+
+    def expire(self):
+        gone = []
+        for sid in self.client.zrangebyscore(self._key('seen'), 0, time.time() - self.ttl):
+            if isinstance(sid, bytes):
+                sid = sid.decode()
+            gone.extend(self.disconnect(sid))
+        return gone
+
+    def members(self, room_id):
+        users = {}
+        for raw in self.client.hvals(self._key('room', int(room_id))):
+            user_id, user = json.loads(raw)
+            users.setdefault(user_id, user)
+        return list(users.values())
+
+    def count(self):
+        return self.client.zcard(self._key('seen'))
+
+
+def create_presence(backend_url=None, ttl=90):
+    """In-memory presence, or Redis-backed when a redis:// URL is configured"""
+    if not backend_url:
+        return InMemoryPresence(ttl=ttl)
+
+    import redis  # only needed for the shared backend
+    return RedisPresence(redis.Redis.from_url(backend_url), ttl=ttl)